@@ -0,0 +1,297 @@
+"""Replay participant sessions against the Sheets / GAS fakes and check per-step budgets.
+
+Sessions are scripted in ``sessions.json`` (or rebuilt from a drill's event
+log with ``--from-events``) and replayed one step at a time, in order, for
+every configuration listed there (GAS or sheet timer, row cache, expiry
+scheduler, incident start, shards).  Each step goes through the same code
+as a rerun of ``streamlit_app.py``: the page and ``mci.loadtest.LoadTest``
+both call ``patient.prepare_page`` (streamlit's ``AppTest`` is not needed).
+Nothing runs between steps: the expiry scheduler has no thread (due rows are
+expired in the ``expiry`` step) and Z totals are flushed at the end of each
+step only.  Each step records:
+
+- remote calls — exact, including the writes it queued
+- wall time (median over ``--runs``, fakes answer instantly by default)
+- allocations — peak traced memory above the step's start (``tracemalloc``,
+  after an untraced warm-up pass so lazy imports are not charged to a step)
+
+and compares them with ``budgets.json`` → ``replay`` → config → step.  More
+remote calls than budgeted, or time / memory over budget, exits 1::
+
+    python benchmarks/replay.py [--sessions benchmarks/sessions.json] [--runs 3]
+    python benchmarks/replay.py --update      # rewrite the budgets from this run
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+from collections import Counter, defaultdict
+from typing import Dict, List, Optional
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from mci import patient  # noqa: E402
+from mci.expiry import ExpiryScheduler  # noqa: E402
+from mci.fakes import CallStats, FakeGasServer, FakeSheetsHandle, FakeSpreadsheet, Faults  # noqa: E402
+from mci.gas import GasClient  # noqa: E402
+from mci.loadtest import LoadTest, SimSession, make_router, make_rows, split_rows  # noqa: E402
+from mci.row_cache import RowCache  # noqa: E402
+from mci.row_state import open_row_state  # noqa: E402
+from mci.shards import ShardedStorage  # noqa: E402
+from mci.storage import SheetsStorage  # noqa: E402
+
+STEPS = ("edit1", "submit_lq", "edit2", "submit_v", "view", "expiry", "locked")
+
+# event log kind → replayed step (``--from-events``)
+EVENT_STEPS = {"timer_start": "edit1", "lq_submit": "submit_lq", "v_submit": "submit_v", "expiry": "expiry"}
+
+
+class Env:
+    """Fresh fakes + app objects for one replay of one configuration."""
+
+    def __init__(self, spec: Dict, config: Dict, latency: float):
+        self.stats = CallStats()
+        patients = int(spec.get("patients", 10))
+        seconds = {r: int(spec.get("timer_seconds", 600)) for r in range(1, patients + 1)}
+        for s in spec["sessions"]:
+            if "timer_seconds" in s:
+                seconds[int(s["row"])] = int(s["timer_seconds"])
+        # short timers would run out while earlier sessions replay (how far depends on the machine):
+        # with an incident they start when their session arrives instead
+        self.late = {int(s["row"]) for s in spec["sessions"] if "timer_seconds" in s}
+        grid = make_rows(patients)
+        for r, secs in seconds.items():  # column Q = timer length (sheet fallback / incident start)
+            grid[r] += [""] * (16 - len(grid[r])) + [str(secs)]
+
+        router = make_router(int(config.get("shards", 1)), config.get("shard_strategy", "range"), patients)
+        self.sheets = [FakeSpreadsheet(part, stats=self.stats, faults=Faults(latency))
+                       for part in split_rows(grid, router)]
+        ttl = float(config.get("row_ttl", 0))
+        self.handles = [FakeSheetsHandle(sh, write_latency=float(config.get("write_latency", 0.05)),
+                                         row_cache=RowCache(ttl=ttl) if ttl > 0 else None) for sh in self.sheets]
+        for h in self.handles:
+            h.z_counter().interval = 3600  # no background flush: settle() flushes
+        stores = [SheetsStorage(h) for h in self.handles]
+        self.store = ShardedStorage(router, stores) if len(stores) > 1 else stores[0]
+
+        self.gas_server = FakeGasServer(seconds, stats=self.stats, faults=Faults(latency)).start()
+        gas = None if config.get("no_gas") else GasClient(self.gas_server.url)
+        self.tmp = tempfile.TemporaryDirectory(prefix="mci-replay-")
+        state = config.get("state", "memory")
+        row_state = None if state == "none" else open_row_state(
+            state, os.path.join(self.tmp.name, "state.sqlite3"), namespace="replay")
+        self.expiry = ExpiryScheduler(self.store, gas=gas, lock_col="W", batch_window=0,
+                                      row_state=row_state, background=False) if config.get("scheduler") else None
+        self.lt = LoadTest(self.store, gas, self.stats, self.expiry, row_state)
+        self.incident = bool(config.get("incident"))
+        if self.incident:
+            self.start_incident(set(seconds) - self.late)
+        self.settle("setup")
+
+    def start_incident(self, rows):
+        started = patient.start_incident(self.store, rows, timers=self.lt.timers)
+        if self.expiry is not None:
+            for r, t in started.items():
+                self.expiry.schedule(r, r + 1, t.end_epoch)
+
+    def settle(self, step: str):
+        """Push out work the step queued (Z totals, due expiries) so it is counted in that step."""
+        if step == "expiry" and self.expiry is not None:
+            self.expiry.run_due()
+        for h in self.handles:
+            h.z_counter().flush()
+
+    def calls(self) -> Counter:
+        return Counter(self.stats.totals)
+
+    def close(self):
+        if self.expiry is not None:
+            self.expiry.close()
+        for h in self.handles:
+            h.writer().close()
+        self.gas_server.stop()
+        self.tmp.cleanup()
+
+
+def run_step(env: Env, sess: SimSession, step: str):
+    lt = env.lt
+    if step in ("edit1", "edit2", "view", "locked"):
+        return lt.page_load(sess, "edit1" if step == "locked" else step)
+    if step == "submit_lq":
+        data = lt.page_load(sess, "edit1")
+        picks = {h: "Yes" for h in (data or {}).get("headers_LQ", [])}
+        return patient.update_LQ(env.store, sess.sheet_row, picks)
+    if step == "submit_v":
+        lt.page_load(sess, "edit2")
+        res = patient.update_V(env.store, sess.sheet_row, patient.ALLOWED_V[0])
+        if lt.row_state is not None:
+            lt.row_state.mark_treated(sess.display_row)
+        if env.expiry is not None:
+            env.expiry.cancel(sess.display_row)
+        patient.stop_timer(lt.gas, sess.display_row, lt.timers)
+        sess.state["treated"] = sess.state["timer_stopped"] = True
+        return res
+    if step == "expiry":
+        return lt.page_load(sess, "edit1")
+    raise ValueError(f"unknown step {step!r} (use {', '.join(STEPS)})")
+
+
+def wait_for_expiry(env: Env, sess: SimSession):
+    """Sleep until this session's timer has run out (not part of the step's time)."""
+    cached = env.lt.timers.get(sess.display_row)
+    end = cached.end_epoch if cached is not None else time.time()
+    time.sleep(max(0.0, end - time.time()) + 1.1)
+
+
+def replay(spec: Dict, config: Dict, latency: float, trace_alloc: bool) -> Dict[str, List[Dict]]:
+    """One pass over every session; ``{step: [{"calls", "ms", "alloc_kb"}, …]}``."""
+    env = Env(spec, config, latency)
+    out: Dict[str, List[Dict]] = defaultdict(list)
+    try:
+        for i, s in enumerate(spec["sessions"]):
+            sess = SimSession(s.get("name", f"s{i}"), int(s["row"]))
+            if env.incident and sess.display_row in env.late:  # not part of any step
+                env.start_incident([sess.display_row])
+                env.settle("setup")
+            for step in s["steps"]:
+                before = env.calls()
+                if step == "expiry":
+                    wait_for_expiry(env, sess)
+                if trace_alloc:
+                    tracemalloc.reset_peak()
+                    base = tracemalloc.get_traced_memory()[0]
+                t = time.perf_counter()
+                run_step(env, sess, step)
+                env.settle(step)
+                ms = (time.perf_counter() - t) * 1000
+                alloc = (tracemalloc.get_traced_memory()[1] - base) / 1024 if trace_alloc else 0.0
+                out[step].append({"calls": sum((env.calls() - before).values()), "ms": ms, "alloc_kb": alloc})
+    finally:
+        env.close()
+    return out
+
+
+def measure(spec: Dict, config: Dict, runs: int, latency: float) -> Dict[str, Dict]:
+    """Per step: max calls / max allocation (traced pass) and median wall time (untraced passes)."""
+    replay(spec, config, latency, trace_alloc=False)  # warm-up: imports, pools, caches of the process
+    tracemalloc.start()
+    try:
+        traced = replay(spec, config, latency, trace_alloc=True)
+    finally:
+        tracemalloc.stop()
+    timed = [replay(spec, config, latency, trace_alloc=False) for _ in range(max(1, runs))]
+    result = {}
+    for step, samples in traced.items():
+        ms = sorted(x["ms"] for run in timed for x in run[step])
+        result[step] = {
+            "n": len(samples),
+            "remote_calls": max(max(x["calls"] for x in samples), max(x["calls"] for run in timed for x in run[step])),
+            "ms": ms[len(ms) // 2],
+            "alloc_kb": max(x["alloc_kb"] for x in samples),
+        }
+    return result
+
+
+def sessions_from_events(directory: str, drill: Optional[str] = None) -> List[Dict]:
+    """Rebuild one scripted session per patient from an event log (``mci.events``)."""
+    from mci.events import load_events
+
+    df = load_events(directory, [drill] if drill else None)
+    sessions = []
+    for (drill_id, row), g in df.groupby(["drill", "row"], sort=True):
+        steps = [EVENT_STEPS[k] for k in g.sort_values("ts")["kind"] if k in EVENT_STEPS]
+        if steps and steps[0] != "edit1":
+            steps.insert(0, "edit1")
+        if "submit_v" in steps:
+            steps.append("view")
+        if "expiry" in steps:
+            steps.append("locked")
+        sessions.append({"name": f"{drill_id}:{row}", "row": int(row) - 1, "steps": steps})
+    return sessions
+
+
+def compare(name: str, got: Dict[str, Dict], budget: Dict[str, Dict]) -> List[str]:
+    failures = []
+    print(f"\n[{name}]")
+    print("%-10s %4s %14s %20s %22s" % ("step", "n", "calls/budget", "ms p50/budget", "alloc KB/budget"))
+    for step in [s for s in STEPS if s in got] + sorted(set(got) - set(STEPS)):
+        g, b = got[step], budget.get(step)
+        if b is None:
+            print("%-10s %4d %8d / -    %10.1f / -      %12.0f / -" % (step, g["n"], g["remote_calls"], g["ms"],
+                                                                      g["alloc_kb"]))
+            failures.append(f"{name}.{step}: no budget (run with --update)")
+            continue
+        print("%-10s %4d %8d / %-4d %10.1f / %-7g %12.0f / %-7g" % (
+            step, g["n"], g["remote_calls"], b["remote_calls"], g["ms"], b["ms"], g["alloc_kb"], b["alloc_kb"]))
+        if g["remote_calls"] > b["remote_calls"]:
+            failures.append(f"{name}.{step}: {g['remote_calls']} remote calls > {b['remote_calls']}")
+        elif g["remote_calls"] < b["remote_calls"]:
+            print(f"{'':10s} under the call budget — tighten it with --update")
+        if g["ms"] > b["ms"]:
+            failures.append(f"{name}.{step}: {g['ms']:.1f} ms > {b['ms']:g} ms")
+        if g["alloc_kb"] > b["alloc_kb"]:
+            failures.append(f"{name}.{step}: {g['alloc_kb']:.0f} KB allocated > {b['alloc_kb']:g} KB")
+    return failures
+
+
+def new_budget(got: Dict[str, Dict]) -> Dict[str, Dict]:
+    """Calls exact; time and memory with headroom for slower / noisier machines."""
+    return {
+        step: {
+            "remote_calls": g["remote_calls"],
+            "ms": round(max(g["ms"] * 4, g["ms"] + 100)),
+            "alloc_kb": round(g["alloc_kb"] * 2 + 256),
+        }
+        for step, g in got.items()
+    }
+
+
+def main(argv=None) -> int:
+    ap = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    ap.add_argument("--sessions", default=os.path.join(ROOT, "benchmarks", "sessions.json"))
+    ap.add_argument("--budgets", default=os.path.join(ROOT, "benchmarks", "budgets.json"))
+    ap.add_argument("--config", action="append", help="only these configurations (repeatable)")
+    ap.add_argument("--runs", type=int, default=3, help="timed passes per configuration (median is compared)")
+    ap.add_argument("--latency", type=float, default=0.0, help="seconds added to every fake remote call")
+    ap.add_argument("--from-events", metavar="DIR", help="replay the patients of an event log instead")
+    ap.add_argument("--drill", help="with --from-events: only this drill")
+    ap.add_argument("--update", action="store_true", help="write the measured numbers as the new budgets")
+    args = ap.parse_args(argv)
+
+    with open(args.sessions) as f:
+        spec = json.load(f)
+    if args.from_events:
+        spec["sessions"] = sessions_from_events(args.from_events, args.drill)
+        spec["patients"] = max([int(spec.get("patients", 1))] + [s["row"] for s in spec["sessions"]])
+    with open(args.budgets) as f:
+        budgets = json.load(f)
+    replay_budgets = budgets.setdefault("replay", {})
+
+    configs = spec.get("configs", {"default": {}})
+    failures = []
+    for name, config in configs.items():
+        if args.config and name not in args.config:
+            continue
+        got = measure(spec, config, args.runs, args.latency)
+        if args.update:
+            replay_budgets[name] = new_budget(got)
+        failures += compare(name, got, replay_budgets.get(name, {}))
+
+    if args.update:
+        with open(args.budgets, "w") as f:
+            json.dump(budgets, f, indent=2)
+            f.write("\n")
+        print(f"\nbudgets written to {args.budgets}")
+        return 0
+    print()
+    for msg in failures:
+        print("FAIL " + msg)
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,105 @@
+"""Cold-start budget: import time of the app's modules and first render of ``?mode=view``.
+
+Each measurement runs in a fresh interpreter (a new container is a cold
+process).  The first render uses Streamlit's ``AppTest`` with the SQLite
+backend seeded from the load-test rows, so no credentials or network are
+needed.  Exits 1 when a number is over its budget in ``budgets.json``::
+
+    python benchmarks/startup.py [--runs 3] [--budgets benchmarks/budgets.json]
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# what streamlit_app.py imports from mci at the top of every session
+APP_MODULES = ["mci.events", "mci.expiry", "mci.gas", "mci.patient", "mci.quota", "mci.row_cache", "mci.row_state",
+               "mci.shards", "mci.sheets", "mci.storage", "mci.timer_cache", "mci.tracing", "mci.watcher"]
+
+
+def child_import(forbidden):
+    t = time.perf_counter()
+    for name in APP_MODULES:
+        __import__(name)
+    ms = (time.perf_counter() - t) * 1000
+    return {"import_ms": ms, "loaded": sorted(m for m in forbidden if m in sys.modules)}
+
+
+def child_render(forbidden):
+    from streamlit.testing.v1 import AppTest
+
+    from mci.loadtest import make_rows
+    from mci.storage import SQLiteStorage
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "mci.sqlite3")
+        SQLiteStorage(path).load_rows(make_rows(50))
+        t = time.perf_counter()
+        at = AppTest.from_file(os.path.join(ROOT, "streamlit_app.py"), default_timeout=60)
+        at.secrets["storage"] = {"backend": "sqlite", "sqlite_path": path}
+        at.query_params["row"] = "1"
+        at.query_params["mode"] = "view"
+        at.run()
+        ms = (time.perf_counter() - t) * 1000
+        errors = [e.value for e in at.exception] + [e.value for e in at.error]
+    return {"first_render_ms": ms, "loaded": sorted(m for m in forbidden if m in sys.modules), "errors": errors}
+
+
+def run_child(kind, forbidden):
+    out = subprocess.run(
+        [sys.executable, os.path.abspath(__file__), "--child", kind, "--forbidden", ",".join(forbidden)],
+        cwd=ROOT, env=dict(os.environ, PYTHONPATH=ROOT), capture_output=True, text=True,
+    )
+    if out.returncode != 0:
+        raise RuntimeError(f"{kind} child failed:\n{out.stderr}")
+    return json.loads(out.stdout.strip().splitlines()[-1])
+
+
+def main(argv=None) -> int:
+    ap = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    ap.add_argument("--runs", type=int, default=3, help="cold runs per measurement (median is compared)")
+    ap.add_argument("--budgets", default=os.path.join(ROOT, "benchmarks", "budgets.json"))
+    ap.add_argument("--skip-render", action="store_true", help="imports only (no streamlit needed)")
+    ap.add_argument("--child", choices=["import", "render"], help=argparse.SUPPRESS)
+    ap.add_argument("--forbidden", default="", help=argparse.SUPPRESS)
+    args = ap.parse_args(argv)
+
+    if args.child:
+        forbidden = [m for m in args.forbidden.split(",") if m]
+        fn = child_import if args.child == "import" else child_render
+        print(json.dumps(fn(forbidden)))
+        return 0
+
+    with open(args.budgets) as f:
+        budget = json.load(f)["startup"]
+    forbidden = budget.get("forbidden_modules", [])
+    kinds = [("import", "import_ms")] + ([] if args.skip_render else [("render", "first_render_ms")])
+
+    failures = []
+    for kind, key in kinds:
+        results = [run_child(kind, forbidden) for _ in range(max(1, args.runs))]
+        ms = sorted(r[key] for r in results)[len(results) // 2]
+        limit = float(budget[key])
+        print(f"{key:16s} {ms:8.1f} ms  (budget {limit:g} ms)")
+        if ms > limit:
+            failures.append(f"{key} {ms:.1f} ms > {limit:g} ms")
+        loaded = results[0]["loaded"]
+        if loaded:
+            print(f"{'':16s} heavy modules loaded: {', '.join(loaded)}")
+            if kind == "import":
+                failures.append(f"imported at startup: {', '.join(loaded)}")
+        for err in results[0].get("errors", []):
+            failures.append(f"render error: {err}")
+
+    for msg in failures:
+        print("FAIL " + msg)
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
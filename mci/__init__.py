@@ -0,0 +1 @@
+"""Shared, process-wide helpers for the patient dashboard (Sheets / GAS / caches)."""
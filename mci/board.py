@@ -0,0 +1,97 @@
+"""Incident-commander board: every patient from one bulk read, derived column-wise."""
+import time
+from typing import Dict, Iterable, List, Optional
+
+import pandas as pd
+
+from mci.storage import COLUMNS
+from mci.timer_cache import TimerState
+
+TREATMENT_COLS = COLUMNS[11:17]  # L–Q
+BOARD_COLUMNS = ["name", "priority", "status", "remaining_s", "treatment_yes", "treatment_answered", "deaths",
+                 "end_epoch"]
+
+# status order for sorting: who needs the commander's attention first
+STATUS_ORDER = {"running": 0, "expired": 1, "unknown": 2, "not started": 3, "treated": 4, "dead": 5}
+
+
+def _int_col(s: pd.Series) -> pd.Series:
+    return pd.to_numeric(s, errors="coerce").fillna(0).astype("int64")
+
+
+def timers_to_fetch(rows: List[List[str]], timers: Optional[Dict[int, TimerState]] = None,
+                    skip: Iterable[int] = ()) -> List[int]:
+    """Open rows (not triaged, not dead) whose timer only GAS knows: not on the sheet (S), not in ``timers`` or ``skip``."""
+    s_idx, v_idx, z_idx = (COLUMNS.index(c) for c in ("S", "V", "Z"))
+    skip = set(skip)
+    out = []
+    for display_row, vals in enumerate(rows[1:], start=1):
+        if not any(vals) or (timers and display_row in timers) or display_row in skip:
+            continue
+        vals = list(vals) + [""] * (len(COLUMNS) - len(vals))
+        if vals[s_idx] == "" and vals[v_idx] == "" and vals[z_idx] in ("", "0"):
+            out.append(display_row)
+    return out
+
+
+def board_frame(rows: List[List[str]], timers: Optional[Dict[int, TimerState]] = None,
+                now: Optional[float] = None, unknown: Iterable[int] = ()) -> pd.DataFrame:
+    """One line per patient by display row; ``timers`` (GAS) over column S, ``unknown`` rows without either."""
+    now = int(time.time() if now is None else now)
+    if len(rows) < 2:
+        return pd.DataFrame(columns=BOARD_COLUMNS, index=pd.RangeIndex(0, name="row"))
+
+    df = pd.DataFrame(rows[1:], columns=COLUMNS, index=pd.RangeIndex(1, len(rows), name="row"))
+    df = df[df[COLUMNS].ne("").any(axis=1)]  # blank lines in the sheet
+
+    end = _int_col(df["S"])
+    if timers:
+        cached = pd.Series({r: t.end_epoch for r, t in timers.items()}, dtype="int64")
+        end = cached.reindex(df.index).fillna(end).astype("int64")
+    remaining = (end - now).clip(lower=0).where(end > 0, 0)
+
+    answers = df[TREATMENT_COLS]
+    deaths = _int_col(df["Z"])
+    priority = df["V"]
+
+    status = pd.Series("not started", index=df.index)
+    status = status.mask(df.index.isin(list(unknown)) & (end <= 0), "unknown")
+    status = status.mask(end > 0, "running")
+    status = status.mask((end > 0) & (remaining == 0), "expired")
+    status = status.mask(priority.ne(""), "treated")
+    status = status.mask(deaths > 0, "dead")
+
+    return pd.DataFrame({
+        "name": df["A"],
+        "priority": priority,
+        "status": status,
+        "remaining_s": remaining,
+        "treatment_yes": answers.eq("Yes").sum(axis=1),
+        "treatment_answered": answers.isin(["Yes", "No"]).sum(axis=1),
+        "deaths": deaths,
+        "end_epoch": end,
+    })
+
+
+def sort_board(frame: pd.DataFrame) -> pd.DataFrame:
+    """Running timers first (least time left on top), then the rest by status."""
+    key = frame["status"].map(STATUS_ORDER).fillna(len(STATUS_ORDER))
+    left = frame["remaining_s"].where(frame["status"] == "running", 0)
+    return frame.assign(_k=key, _l=left).sort_values(["_k", "_l"], kind="stable").drop(columns=["_k", "_l"])
+
+
+def format_remaining(seconds: pd.Series) -> pd.Series:
+    """``HH:MM:SS`` for the whole column at once."""
+    s = seconds.astype("int64")
+    h, m, ss = s // 3600, (s % 3600) // 60, s % 60
+    return h.astype(str).str.zfill(2) + ":" + m.astype(str).str.zfill(2) + ":" + ss.astype(str).str.zfill(2)
+
+
+def board_summary(frame: pd.DataFrame) -> Dict[str, object]:
+    return {
+        "patients": int(len(frame)),
+        "running": int((frame["status"] == "running").sum()),
+        "treated": int((frame["status"] == "treated").sum()),
+        "deaths": int(frame["deaths"].sum()),
+        "priority": frame.loc[frame["priority"].ne(""), "priority"].value_counts().to_dict(),
+    }
@@ -0,0 +1,145 @@
+"""Expiry (column Z) counter.
+
+The old ``increment_Z`` did ``acell`` + ``update_acell`` from each session:
+two calls per death, and two sessions expiring the same patient in the same
+second could both read N and both write N+1.  ``ExpiryCounter`` instead adds
+deltas up in process (one per ``(row, event_key)``, so a replayed event is
+never counted twice) and a single background thread periodically turns them
+into absolute totals: one batch read of the current Z values of all dirty
+rows, one batched write of ``base + delta``.  Only that thread ever does the
+read-modify-write, so nothing is lost between sessions of this process.
+
+A write that fails or times out may still be committed later (it stays in
+the write queue).  Its rows keep the ``base`` read before it and the deltas
+it carried, and later flushes write ``base + all deltas since`` without
+reading Z again, so a late commit is overwritten by the same or a larger
+total and never counted twice.  Until such a write is confirmed, increments
+made to those rows by another process in the meantime can be overwritten.
+"""
+import atexit
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional, Set, Tuple
+
+
+def parse_count(value) -> int:
+    try:
+        return int(float(value))
+    except Exception:
+        return 0
+
+
+class ExpiryCounter:
+    """Aggregate Z increments per row and write totals in batches.
+
+    ``read_totals(rows)`` returns the current ``{row: raw Z value}``;
+    ``write_totals({row: total})`` must block until the write is committed.
+    """
+
+    def __init__(
+        self,
+        read_totals: Callable[[List[int]], Dict[int, Any]],
+        write_totals: Callable[[Dict[int, int]], Any],
+        interval: float = 1.0,
+    ):
+        self._read_totals = read_totals
+        self._write_totals = write_totals
+        self.interval = interval
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._deltas: Dict[int, int] = {}
+        self._seen: Set[Tuple[int, str]] = set()
+        self._totals: Dict[int, int] = {}
+        self._unsure: Dict[int, Tuple[int, int]] = {}  # row → (base, deltas) of a write that may still commit
+        self._thread: Optional[threading.Thread] = None
+        self.flushes = 0
+        self.last_error: Optional[BaseException] = None
+        atexit.register(self._flush_quietly)
+
+    def add(self, row: int, event_key: str) -> bool:
+        """Count one expiry of ``row``. False if this event was already counted."""
+        with self._lock:
+            key = (row, event_key)
+            if key in self._seen:
+                return False
+            self._seen.add(key)
+            self._deltas[row] = self._deltas.get(row, 0) + 1
+            self._ensure_thread()
+        self._wake.set()
+        return True
+
+    def pending(self, row: Optional[int] = None) -> int:
+        """Increments not confirmed written yet (of ``row``, or all)."""
+        with self._lock:
+            if row is None:
+                return sum(self._deltas.values()) + sum(d for _, d in self._unsure.values())
+            return self._deltas.get(row, 0) + self._unsure.get(row, (0, 0))[1]
+
+    def last_total(self, row: int) -> Optional[int]:
+        """Total last written by this process (None if never flushed)."""
+        with self._lock:
+            return self._totals.get(row)
+
+    # ---------- flushing ----------
+    def flush(self) -> Dict[int, int]:
+        """Write absolute totals for every row with pending increments."""
+        with self._flush_lock:
+            with self._lock:
+                deltas, self._deltas = self._deltas, {}
+                unsure = dict(self._unsure)
+            rows = sorted(set(deltas) | set(unsure))
+            if not rows:
+                return {}
+            fresh = [r for r in rows if r not in unsure]  # rows whose last write is known
+            try:
+                current = self._read_totals(fresh) if fresh else {}
+            except Exception:
+                self._restore(deltas)  # nothing was written: keep them for the next round
+                raise
+            plan = {}
+            for r in rows:
+                base, done = unsure.get(r) or (parse_count(current.get(r, "")), 0)
+                plan[r] = (base, done + deltas.get(r, 0))
+            totals = {r: base + d for r, (base, d) in plan.items()}
+            try:
+                self._write_totals(totals)
+            except Exception:
+                with self._lock:  # may still commit: rewrite the same base next time, never re-read
+                    self._unsure.update(plan)
+                raise
+            with self._lock:
+                for r in rows:
+                    self._unsure.pop(r, None)
+                self._totals.update(totals)
+            self.flushes += 1
+            return totals
+
+    def _restore(self, deltas: Dict[int, int]):
+        with self._lock:
+            for r, d in deltas.items():
+                self._deltas[r] = self._deltas.get(r, 0) + d
+
+    def _ensure_thread(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._run, name="expiry-counter", daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while True:
+            self._wake.wait()
+            self._wake.clear()
+            # let more expiries of the same burst pile up before writing
+            time.sleep(self.interval)
+            try:
+                self.flush()
+                self.last_error = None
+            except Exception as e:
+                self.last_error = e
+                self._wake.set()
+
+    def _flush_quietly(self):
+        try:
+            self.flush()
+        except Exception:
+            pass
@@ -0,0 +1,317 @@
+"""Append-only log of triage events for after-action review.
+
+The sheet only holds the latest value of each cell, so when a patient was
+treated or triaged is lost.  Every action is appended here as one JSON line
+(``<dir>/<drill>/current-<replica>.jsonl``, written and fsync'd in batches by
+a background writer, off the rerun's path; one file per process, so
+processes sharing a directory never write to a file another one has just
+sealed).  Past ``rotate_bytes`` the file is sealed as
+``part-<ms>-<replica>.jsonl`` and, when pyarrow is installed, that part is
+compacted to ``part-<ms>-<replica>.parquet`` in the background.
+
+``load_events`` / ``patient_times`` / ``drill_summary`` answer time-to-
+treatment, time-to-triage and mortality across drills from these files alone::
+
+    python -m mci.events --dir events [--drill drill-2024-05]
+"""
+import atexit
+import glob
+import json
+import os
+import socket
+import threading
+import time
+from typing import Any, List, Optional
+
+# kind → emitted by
+KINDS = (
+    "timer_start",  # resolve_timer started the patient's timer (GAS or sheet)
+    "lq_submit",    # update_LQ (treatment)
+    "v_submit",     # update_V (triage priority)
+    "expiry",       # increment_Z / ExpiryScheduler counted a death
+    "timer_stop",   # stop_timer (treated)
+)
+
+CURRENT = "current-%s.jsonl"  # % replica
+
+
+def default_replica() -> str:
+    return f"{socket.gethostname()}-{os.getpid()}"
+
+
+def _safe(name: str) -> str:
+    """Drill id usable as a directory name."""
+    return "".join(c if c.isalnum() or c in "-_." else "_" for c in str(name))
+
+
+class EventLog:
+    """``directory`` empty → disabled (``emit`` is a no-op).
+
+    ``emit`` only queues the line; a background writer appends whatever is
+    queued, flushes and fsyncs once per batch (``flush_interval`` lets a
+    burst pile up first).  ``flush`` writes the queue out in the caller.
+    """
+
+    def __init__(self, directory: str = "", drill_id: str = "default", rotate_bytes: int = 8 << 20,
+                 fsync: bool = True, replica: str = "", flush_interval: float = 0.2):
+        self._lock = threading.Lock()  # file, size, rotation
+        self._cond = threading.Condition()  # queue
+        self._pending: List[str] = []
+        self._thread: Optional[threading.Thread] = None
+        self._file = None
+        self._size = 0
+        self.fsync = fsync
+        self.flush_interval = flush_interval
+        self.replica = _safe(replica or default_replica())
+        self.written = 0
+        self.batches = 0
+        self.last_error: Optional[BaseException] = None
+        self.configure(directory, drill_id, rotate_bytes)
+        atexit.register(self._flush_quietly)
+
+    def configure(self, directory: str, drill_id: str = "default", rotate_bytes: Optional[int] = None) -> "EventLog":
+        with self._lock:
+            if getattr(self, "directory", ""):
+                try:
+                    self._write_pending()  # queued lines belong to the old drill
+                except Exception as e:
+                    self.last_error = e
+            self._close()
+            self.directory = directory or ""
+            self.drill_id = _safe(drill_id or "default")
+            if rotate_bytes is not None:
+                self.rotate_bytes = rotate_bytes
+        return self
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.directory)
+
+    def drill_dir(self) -> str:
+        return os.path.join(self.directory, self.drill_id)
+
+    def current_path(self) -> str:
+        return os.path.join(self.drill_dir(), CURRENT % self.replica)
+
+    def emit(self, kind: str, row: int, **fields: Any):
+        if not self.directory:
+            return
+        rec = {"ts": round(time.time(), 3), "drill": self.drill_id, "kind": kind, "row": int(row)}
+        rec.update(fields)
+        line = json.dumps(rec, ensure_ascii=False, separators=(",", ":"), default=str) + "\n"
+        with self._cond:
+            self._pending.append(line)
+            self._ensure_thread()
+            self._cond.notify()
+
+    def pending(self) -> int:
+        with self._cond:
+            return len(self._pending)
+
+    def flush(self):
+        """Write every queued event now."""
+        with self._lock:
+            self._write_pending()
+
+    def rotate(self):
+        """Seal the current file now (e.g. at the end of a drill)."""
+        with self._lock:
+            self._write_pending()
+            self._rotate()
+
+    # ---------- writer ----------
+    def _ensure_thread(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._run, name="mci-events", daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._pending:
+                    self._cond.wait()
+            if self.flush_interval:
+                time.sleep(self.flush_interval)
+            try:
+                self.flush()
+                self.last_error = None
+            except Exception as e:  # disk full / gone: keep the lines for the next round
+                self.last_error = e
+                time.sleep(1.0)
+
+    def _flush_quietly(self):
+        try:
+            self.flush()
+        except Exception:
+            pass
+
+    # ---------- internals (lock held) ----------
+    def _write_pending(self):
+        with self._cond:
+            lines, self._pending = self._pending, []
+        if not lines or not self.directory:
+            return
+        try:
+            f = self._open()
+            data = "".join(lines)
+            f.write(data)
+            f.flush()
+            if self.fsync:
+                os.fsync(f.fileno())
+        except BaseException:
+            with self._cond:
+                self._pending[:0] = lines
+            self._close()
+            raise
+        self._size += len(data.encode("utf-8"))
+        self.written += len(lines)
+        self.batches += 1
+        if self._size >= self.rotate_bytes:
+            self._rotate()
+
+    def _open(self):
+        if self._file is None:
+            os.makedirs(self.drill_dir(), exist_ok=True)
+            self._file = open(self.current_path(), "a", encoding="utf-8")
+            self._size = self._file.tell()
+        return self._file
+
+    def _close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+            self._size = 0
+
+    def _rotate(self):
+        self._close()
+        path = self.current_path()
+        if not os.path.exists(path) or os.path.getsize(path) == 0:
+            return
+        sealed = os.path.join(self.drill_dir(), f"part-{int(time.time() * 1000)}-{self.replica}.jsonl")
+        os.replace(path, sealed)
+        # only the part sealed here: other parts may be in the hands of another rotation or process
+        threading.Thread(target=compact_file, args=(sealed,), name="mci-events-compact", daemon=True).start()
+
+
+# one log per process (configured by the page from [events])
+EVENTS = EventLog()
+
+
+_compact_lock = threading.Lock()  # one compaction at a time per process
+
+
+def compact_file(src: str) -> Optional[str]:
+    """One sealed ``part-*.jsonl`` → ``part-*.parquet``; None without pyarrow or if ``src`` is gone."""
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError:
+        return None
+    with _compact_lock:
+        try:
+            with open(src, encoding="utf-8") as f:
+                records = [json.loads(line) for line in f if line.strip()]
+        except FileNotFoundError:  # compacted meanwhile by a sweep
+            return None
+        dst = src[:-len(".jsonl")] + ".parquet"
+        tmp = f"{dst}.{os.getpid()}-{threading.get_ident()}.tmp"
+        pq.write_table(pa.Table.from_pylist(records), tmp)
+        os.replace(tmp, dst)
+        try:
+            os.remove(src)
+        except FileNotFoundError:
+            pass
+        return dst
+
+
+def compact(drill_dir: str) -> List[str]:
+    """Every sealed ``part-*.jsonl`` of a drill (e.g. sealed while pyarrow was missing) → parquet."""
+    done = []
+    for src in sorted(glob.glob(os.path.join(drill_dir, "part-*.jsonl"))):
+        dst = compact_file(src)
+        if dst:
+            done.append(dst)
+    return done
+
+
+# =========================
+# Query
+# =========================
+def load_events(directory: str, drills: Optional[List[str]] = None):
+    """Every event of ``drills`` (default: all) as a DataFrame sorted by time."""
+    import pandas as pd
+
+    frames = []
+    for drill_dir in sorted(glob.glob(os.path.join(directory, "*"))):
+        if not os.path.isdir(drill_dir) or (drills and os.path.basename(drill_dir) not in drills):
+            continue
+        for path in sorted(glob.glob(os.path.join(drill_dir, "part-*.parquet"))):
+            frames.append(pd.read_parquet(path))
+        for pattern in ("part-*.jsonl", "current*.jsonl"):
+            for path in sorted(glob.glob(os.path.join(drill_dir, pattern))):
+                try:
+                    if os.path.getsize(path):
+                        frames.append(pd.read_json(path, lines=True, dtype=False))
+                except FileNotFoundError:  # sealed / compacted while listing
+                    continue
+    if not frames:
+        return pd.DataFrame(columns=["ts", "drill", "kind", "row"])
+    df = pd.concat(frames, ignore_index=True)
+    df["ts"] = pd.to_numeric(df["ts"], errors="coerce")
+    return df.sort_values("ts", kind="stable").reset_index(drop=True)
+
+
+def patient_times(df):
+    """One line per (drill, row): start, first treatment / triage, death, and the durations in seconds."""
+    import pandas as pd
+
+    if df.empty:
+        return pd.DataFrame(columns=["drill", "row", "start", "treated_at", "triaged_at", "died",
+                                     "time_to_treatment", "time_to_triage"])
+    key = ["drill", "row"]
+    starts = df[df["kind"] == "timer_start"]
+    start_ts = starts["t0"].where(starts["t0"].fillna(0) > 0, starts["ts"]) if "t0" in starts else starts["ts"]
+    out = starts.assign(start=start_ts).groupby(key)["start"].min().to_frame()
+    out["treated_at"] = df[df["kind"] == "lq_submit"].groupby(key)["ts"].min()
+    out["triaged_at"] = df[df["kind"] == "v_submit"].groupby(key)["ts"].min()
+    died = df[df["kind"] == "expiry"].groupby(key).size()
+    out["died"] = died.reindex(out.index).fillna(0).gt(0)
+    out["time_to_treatment"] = out["treated_at"] - out["start"]
+    out["time_to_triage"] = out["triaged_at"] - out["start"]
+    return out.reset_index()
+
+
+def drill_summary(df):
+    """Per drill: patients, deaths, mortality and median / p90 times (seconds)."""
+    import pandas as pd
+
+    times = patient_times(df)
+    if times.empty:
+        return pd.DataFrame(columns=["patients", "deaths", "mortality"])
+    g = times.groupby("drill")
+    return pd.DataFrame({
+        "patients": g.size(),
+        "deaths": g["died"].sum().astype(int),
+        "mortality": g["died"].mean().round(3),
+        "treatment_p50_s": g["time_to_treatment"].median(),
+        "treatment_p90_s": g["time_to_treatment"].quantile(0.9),
+        "triage_p50_s": g["time_to_triage"].median(),
+        "triage_p90_s": g["time_to_triage"].quantile(0.9),
+    })
+
+
+def main(argv=None) -> int:
+    import argparse
+
+    ap = argparse.ArgumentParser(description="Drill summary from the event log.")
+    ap.add_argument("--dir", default="events")
+    ap.add_argument("--drill", action="append", help="only these drills (repeatable)")
+    ap.add_argument("--patients", action="store_true", help="per-patient times instead of the summary")
+    args = ap.parse_args(argv)
+    df = load_events(args.dir, args.drill)
+    print((patient_times(df) if args.patients else drill_summary(df)).to_string())
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
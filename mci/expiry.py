@@ -0,0 +1,222 @@
+"""Per-process expiry of patient timers: one thread counts Z, sets the lock
+column and stops the GAS timer for each due row, in batches, once per timer
+(claimed in the shared ``RowStateStore`` across replicas).  Failed steps are retried.
+"""
+import heapq
+import threading
+import time
+from concurrent.futures import wait
+from typing import Dict, FrozenSet, List, Optional, Set, Tuple
+
+from mci.events import EVENTS
+from mci.gas import GasClient
+from mci.patient import submit_traced
+from mci.row_state import RowStateStore
+from mci.storage import Storage
+from mci.timer_cache import TimerCache
+from mci.tracing import TRACER
+
+LOCKED = "expired"
+STEPS = frozenset(("count", "lock", "stop"))
+
+
+class ExpiryScheduler:
+    """Heap of ``(due_at, end_epoch, display_row, sheet_row)``.
+
+    ``batch_window`` — after the first deadline is due, wait this long so rows
+    expiring in the same second go out in one batch.  ``background=False`` —
+    no thread; the caller expires due rows with ``run_due`` (replay benchmark).
+    """
+
+    def __init__(
+        self,
+        store: Storage,
+        gas: Optional[GasClient] = None,
+        timers: Optional[TimerCache] = None,
+        lock_col: str = "",
+        batch_window: float = 0.5,
+        retry_delay: float = 5.0,
+        row_state: Optional[RowStateStore] = None,
+        background: bool = True,
+    ):
+        self.store = store
+        self.gas = gas
+        self.timers = timers
+        self.lock_col = lock_col.strip().upper()
+        self.batch_window = batch_window
+        self.retry_delay = retry_delay
+        self.row_state = row_state
+        self.background = background
+        self._claimed: Set[Tuple[int, int]] = set()  # (display_row, end_epoch) claimed here, pending count
+        self._cond = threading.Condition()
+        self._heap: List[Tuple[float, int, int, int]] = []
+        self._scheduled: Dict[int, int] = {}  # display_row → end_epoch waiting
+        self._done: Dict[int, int] = {}  # display_row → end_epoch expired
+        self._stopped: Dict[int, int] = {}  # display_row → end_epoch cancelled (treated)
+        self._todo: Dict[Tuple[int, int, int], FrozenSet[str]] = {}  # steps left of a partly failed expiry
+        self._thread: Optional[threading.Thread] = None
+        self._closed = False
+        self.batches = 0
+        self.expired = 0
+        self.failures = 0
+
+    # ---------- API for the page ----------
+    def schedule(self, display_row: int, sheet_row: int, end_epoch: int):
+        """Register a running timer (idempotent per ``end_epoch``)."""
+        end_epoch = int(end_epoch)
+        if end_epoch <= 0:
+            return
+        with self._cond:
+            if end_epoch in (self._scheduled.get(display_row), self._done.get(display_row),
+                             self._stopped.get(display_row)):
+                return
+            self._scheduled[display_row] = end_epoch
+            heapq.heappush(self._heap, (float(end_epoch), end_epoch, display_row, sheet_row))
+            self._ensure_thread()
+            self._cond.notify()
+
+    def cancel(self, display_row: int):
+        """Timer stopped before it ran out (patient treated)."""
+        with self._cond:
+            end_epoch = self._scheduled.pop(display_row, None)  # heap entry is skipped when it comes up
+            if end_epoch is not None:
+                self._stopped[display_row] = end_epoch
+
+    def processed(self, display_row: int, end_epoch: int) -> bool:
+        with self._cond:
+            return self._done.get(display_row) == int(end_epoch)
+
+    def pending(self) -> int:
+        with self._cond:
+            return len(self._scheduled)
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+
+    # ---------- background ----------
+    def _ensure_thread(self):
+        if not self.background:
+            return
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._run, name="mci-expiry", daemon=True)
+            self._thread.start()
+
+    def run_due(self) -> int:
+        """Expire everything already due in the calling thread (shutdown, load test)."""
+        batch = self._pop_due(time.time())
+        if batch:
+            self.expire(batch)
+        return len(batch)
+
+    def _next_batch(self) -> List[Tuple[int, int, int]]:
+        with self._cond:
+            while not self._closed:
+                if self._heap:
+                    delay = self._heap[0][0] - time.time()
+                    if delay <= 0:
+                        break
+                    self._cond.wait(min(delay, 60.0))
+                else:
+                    self._cond.wait()
+            if self._closed:
+                return []
+        if self.batch_window:
+            time.sleep(self.batch_window)
+        return self._pop_due(time.time())
+
+    def _pop_due(self, now: float) -> List[Tuple[int, int, int]]:
+        batch = []
+        with self._cond:
+            while self._heap and self._heap[0][0] <= now:
+                _, end_epoch, display_row, sheet_row = heapq.heappop(self._heap)
+                if self._scheduled.get(display_row) != end_epoch:
+                    continue  # cancelled or superseded by a newer timer
+                batch.append((display_row, sheet_row, end_epoch))
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._next_batch()
+            with self._cond:
+                if self._closed:
+                    return
+            if batch:
+                self.expire(batch)
+
+    def expire(self, batch: List[Tuple[int, int, int]]):
+        """Count, lock and stop a batch of ``(display_row, sheet_row, end_epoch)``; failed steps are retried."""
+        batch, skipped = self._claim(batch)
+        with self._cond:
+            todo = {item: self._todo.pop(item, STEPS) for item in batch}
+        left: Dict[Tuple[int, int, int], Set[str]] = {item: set() for item in batch}
+        with TRACER.span("expiry.batch"):
+            for item in batch:
+                if "count" not in todo[item]:
+                    continue
+                display_row, sheet_row, end_epoch = item
+                try:
+                    key = f"expiry:{sheet_row}:{end_epoch}"
+                    if self.store.increment_z(sheet_row, key):
+                        EVENTS.emit("expiry", sheet_row, event_key=key, end=end_epoch)
+                except Exception:
+                    left[item].add("count")
+            # writes / stops are submitted together so the write queue merges them into one batch update
+            futures = {}
+            for item in batch:
+                display_row, sheet_row, _ = item
+                if self.lock_col and "lock" in todo[item]:
+                    lock = submit_traced(self.store.write_cells, sheet_row, {self.lock_col: LOCKED})
+                    futures[lock] = (item, "lock")
+                if self.gas is not None and self.gas.url and "stop" in todo[item]:
+                    futures[submit_traced(self.gas.stop_timer, display_row)] = (item, "stop")
+            wait(futures)
+            for f, (item, step) in futures.items():
+                if f.exception() is not None:
+                    left[item].add(step)
+            self.failures += sum(len(steps) for steps in left.values())
+
+        retry_at = time.time() + self.retry_delay
+        with self._cond:
+            for item in batch:
+                display_row, sheet_row, end_epoch = item
+                if left[item]:  # only the steps that failed go again
+                    self._todo[item] = frozenset(left[item])
+                    heapq.heappush(self._heap, (retry_at, end_epoch, display_row, sheet_row))
+                    continue
+                self._claimed.discard((display_row, end_epoch))
+                if self._scheduled.get(display_row) == end_epoch:
+                    del self._scheduled[display_row]
+                self._done[display_row] = end_epoch
+                self.expired += 1
+            for display_row, _, end_epoch in skipped:
+                if self._scheduled.get(display_row) == end_epoch:
+                    del self._scheduled[display_row]
+                self._done[display_row] = end_epoch
+            self.batches += 1
+        if self.timers is not None:
+            for display_row, _, _ in batch + skipped:
+                self.timers.invalidate(display_row)
+
+    def _claim(self, batch: List[Tuple[int, int, int]]):
+        """Split into (ours to count, handled elsewhere / treated)."""
+        if self.row_state is None:
+            return batch, []
+        ours, skipped = [], []
+        for item in batch:
+            display_row, _, end_epoch = item
+            if (display_row, end_epoch) in self._claimed:  # retry of our own claim
+                ours.append(item)
+                continue
+            try:
+                claimed = self.row_state.claim_expiry(display_row, end_epoch)
+            except Exception:
+                claimed = True  # state store down: count here; Z's event key still dedups in process
+            if claimed:
+                with self._cond:
+                    self._claimed.add((display_row, end_epoch))
+                ours.append(item)
+            else:
+                skipped.append(item)
+        return ours, skipped
@@ -0,0 +1,331 @@
+"""Local stand-ins for Google Sheets and the GAS timer web app.
+
+``FakeSpreadsheet`` / ``FakeWorksheet`` implement the part of the gspread
+API the app uses (``values_batch_get``, ``values_batch_update``,
+``row_values``, ``get_all_values``, ``acell``, ``update_acell``) over an
+in-memory grid; ``FakeSheetsHandle`` plugs them into ``SheetsHandle``.
+``FakeGasServer`` is a real HTTP server speaking the GAS ``get`` /
+``start_timer`` / ``stop_timer`` protocol.  Both take a ``Faults`` object for
+latency and 429 injection and count every call in ``CallStats``.
+"""
+import json
+import random
+import re
+import threading
+import time
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List, Optional, Tuple
+from urllib.parse import parse_qs, urlparse
+
+from mci.sheets import SheetsHandle, col_letter_to_index
+
+_A1 = re.compile(r"^([A-Za-z]+)(\d+)(?::([A-Za-z]+)(\d*))?$")
+
+
+class FakeResponse:
+    def __init__(self, status_code: int, text: str = ""):
+        self.status_code = status_code
+        self.text = text
+
+    def json(self):
+        return json.loads(self.text or "{}")
+
+
+class FakeAPIError(Exception):
+    """Looks like ``gspread.exceptions.APIError`` to ``mci.sheets.error_status``."""
+
+    def __init__(self, code: int, message: str = ""):
+        super().__init__(f"APIError: [{code}]: {message or 'injected'}")
+        self.code = code
+        self.response = FakeResponse(code, json.dumps({"error": {"code": code, "message": message}}))
+
+
+class Faults:
+    """Latency (``latency`` ± ``jitter`` seconds) and error injection (``error_rate`` of ``status``)."""
+
+    def __init__(self, latency: float = 0.0, jitter: float = 0.0, error_rate: float = 0.0, status: int = 429):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.status = status
+
+    def apply(self):
+        delay = self.latency + (random.uniform(-self.jitter, self.jitter) if self.jitter else 0.0)
+        if delay > 0:
+            time.sleep(delay)
+        if self.error_rate and random.random() < self.error_rate:
+            raise FakeAPIError(self.status, "Quota exceeded (injected)")
+
+
+class CallStats:
+    """Thread-safe call counters: totals for the process + a per-thread tally.
+
+    A simulated session runs in one thread, so ``take_local()`` returns the
+    calls that session made since its last ``take_local()``.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.totals: Counter = Counter()
+        self.errors: Counter = Counter()
+        self._local = threading.local()
+
+    def record(self, name: str, error: bool = False):
+        with self._lock:
+            self.totals[name] += 1
+            if error:
+                self.errors[name] += 1
+        tally = getattr(self._local, "tally", None)
+        if tally is None:
+            tally = self._local.tally = Counter()
+        tally[name] += 1
+
+    def take_local(self) -> Counter:
+        tally = getattr(self._local, "tally", None) or Counter()
+        self._local.tally = Counter()
+        return tally
+
+
+# =========================
+# Sheets
+# =========================
+def parse_a1(rng: str) -> Tuple[str, int, int, int, int]:
+    """``'Title'!A5:S5`` → (title, row1, col1, row2, col2) (1-based, inclusive; row2 0 = to the last row)."""
+    title = ""
+    if "!" in rng:
+        title, rng = rng.rsplit("!", 1)
+        if title.startswith("'") and title.endswith("'"):
+            title = title[1:-1].replace("''", "'")
+    m = _A1.match(rng.strip())
+    if not m:
+        raise ValueError(f"unsupported range {rng!r}")
+    c1, r1, c2, r2 = m.groups()
+    if c2 is None:
+        c2, r2 = c1, r1
+    return title, int(r1), col_letter_to_index(c1), int(r2 or 0), col_letter_to_index(c2)
+
+
+class FakeSpreadsheet:
+    def __init__(self, rows: Optional[List[List[Any]]] = None, title: str = "Secondary",
+                 faults: Optional[Faults] = None, stats: Optional[CallStats] = None):
+        self.faults = faults or Faults()
+        self.stats = stats or CallStats()
+        self._lock = threading.RLock()
+        self._grid: List[List[str]] = [[_text(v) for v in r] for r in (rows or [])]
+        self.sheet1 = FakeWorksheet(self, title)
+
+    # ---------- grid ----------
+    def _get(self, r1: int, c1: int, r2: int, c2: int) -> List[List[str]]:
+        with self._lock:
+            out = []
+            for r in range(r1, (r2 or len(self._grid)) + 1):
+                src = self._grid[r - 1] if r - 1 < len(self._grid) else []
+                vals = [src[c - 1] if c - 1 < len(src) else "" for c in range(c1, c2 + 1)]
+                while vals and vals[-1] == "":  # Sheets drops trailing empties
+                    vals.pop()
+                out.append(vals)
+            while out and not out[-1]:
+                out.pop()
+            return out
+
+    def _set(self, r1: int, c1: int, values: List[List[Any]]):
+        with self._lock:
+            for dr, row_vals in enumerate(values):
+                r = r1 + dr
+                while len(self._grid) < r:
+                    self._grid.append([])
+                dst = self._grid[r - 1]
+                for dc, v in enumerate(row_vals):
+                    if v is None:  # null = leave the cell as is
+                        continue
+                    c = c1 + dc
+                    if len(dst) < c:
+                        dst.extend([""] * (c - len(dst)))
+                    dst[c - 1] = _text(v)
+
+    def _call(self, name: str):
+        try:
+            self.faults.apply()
+        except FakeAPIError:
+            self.stats.record(name, error=True)
+            raise
+        self.stats.record(name)
+
+    # ---------- gspread Spreadsheet API ----------
+    def values_batch_get(self, ranges: List[str], params: Optional[Dict] = None) -> Dict:
+        self._call("sheets.values_batch_get")
+        out = []
+        for rng in ranges:
+            _, r1, c1, r2, c2 = parse_a1(rng)
+            vr = {"range": rng, "majorDimension": "ROWS"}
+            vals = self._get(r1, c1, r2, c2)
+            if vals:
+                vr["values"] = vals
+            out.append(vr)
+        return {"valueRanges": out}
+
+    def values_batch_update(self, body: Optional[Dict] = None) -> Dict:
+        self._call("sheets.values_batch_update")
+        body = body or {}
+        responses = []
+        for item in body.get("data", []):
+            _, r1, c1, r2, c2 = parse_a1(item["range"])
+            self._set(r1, c1, item.get("values", []))
+            resp = {"updatedRange": item["range"]}
+            if body.get("includeValuesInResponse"):
+                resp["updatedData"] = {"range": item["range"], "values": self._get(r1, c1, r2, c2)}
+            responses.append(resp)
+        return {"totalUpdatedCells": sum(len(d.get("values", [[]])[0]) for d in body.get("data", [])),
+                "responses": responses}
+
+
+class FakeWorksheet:
+    def __init__(self, spreadsheet: FakeSpreadsheet, title: str):
+        self.spreadsheet = spreadsheet
+        self.title = title
+
+    def row_values(self, row: int) -> List[str]:
+        self.spreadsheet._call("sheets.row_values")
+        got = self.spreadsheet._get(row, 1, row, 26)
+        return got[0] if got else []
+
+    def get_all_values(self) -> List[List[str]]:
+        self.spreadsheet._call("sheets.get_all_values")
+        with self.spreadsheet._lock:
+            return [list(r) for r in self.spreadsheet._grid]
+
+    def acell(self, label: str):
+        self.spreadsheet._call("sheets.acell")
+        _, r, c, _, _ = parse_a1(label)
+        got = self.spreadsheet._get(r, c, r, c)
+
+        class _Cell:
+            value = got[0][0] if got and got[0] else ""
+        return _Cell()
+
+    def update_acell(self, label: str, value: Any):
+        self.spreadsheet._call("sheets.update_acell")
+        _, r, c, _, _ = parse_a1(label)
+        self.spreadsheet._set(r, c, [[value]])
+
+
+class FakeSheetsHandle(SheetsHandle):
+    """``SheetsHandle`` over a ``FakeSpreadsheet`` (no credentials, no network)."""
+
+    def __init__(self, spreadsheet: FakeSpreadsheet, **kwargs):
+        super().__init__("fake", spreadsheet.sheet1.title, **kwargs)
+        self.fake = spreadsheet
+
+    def _connect(self):
+        return None, None, self.fake.sheet1
+
+
+# =========================
+# GAS
+# =========================
+class FakeGasServer:
+    """Threaded HTTP server speaking the GAS web-app protocol.
+
+    ``timer_seconds`` is the per-row timer length (``{row: seconds}`` or one
+    default for every row).  Use as a context manager; ``.url`` is the web-app URL.
+    """
+
+    def __init__(self, timer_seconds: Any = 300, faults: Optional[Faults] = None,
+                 stats: Optional[CallStats] = None, host: str = "127.0.0.1", port: int = 0):
+        self.timer_seconds = timer_seconds
+        self.faults = faults or Faults()
+        self.stats = stats or CallStats()
+        self._lock = threading.Lock()
+        self.timers: Dict[int, Dict[str, int]] = {}
+        self._server = _Server((host, port), self._handler())
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}/exec"
+
+    def seconds_for(self, row: int) -> int:
+        if isinstance(self.timer_seconds, dict):
+            return int(self.timer_seconds.get(row, 0))
+        return int(self.timer_seconds)
+
+    def handle(self, action: str, row: int) -> Tuple[int, Dict]:
+        name = f"gas.{action}"
+        if action not in ("get", "start_timer", "stop_timer"):
+            return 400, {"status": "error", "message": f"unknown action {action}"}
+        try:
+            self.faults.apply()
+        except FakeAPIError as e:
+            self.stats.record(name, error=True)
+            return e.code, {"status": "error", "message": str(e)}
+        self.stats.record(name)
+        with self._lock:
+            t = self.timers.setdefault(row, {"t0_epoch": 0, "end_epoch": 0})
+            secs = self.seconds_for(row)
+            if action == "start_timer" and secs > 0 and not t["end_epoch"]:
+                now = int(time.time())
+                t["t0_epoch"], t["end_epoch"] = now, now + secs
+            elif action == "stop_timer":
+                t["end_epoch"] = t["end_epoch"] or int(time.time())
+                t["stopped"] = 1
+            return 200, {"status": "ok", "row": row, "timer_seconds": secs,
+                         "t0_epoch": t["t0_epoch"], "end_epoch": t["end_epoch"]}
+
+    def _handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"  # keep-alive, like the real endpoint
+            disable_nagle_algorithm = True  # headers and body go out as two writes: no delayed-ACK stall
+
+            def _reply(self, params: Dict[str, List[str]]):
+                action = (params.get("action") or [""])[0]
+                try:
+                    row = int((params.get("row") or ["0"])[0])
+                except ValueError:
+                    row = 0
+                status, payload = server.handle(action, row)
+                body = json.dumps(payload).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def do_GET(self):
+                self._reply(parse_qs(urlparse(self.path).query))
+
+            def do_POST(self):
+                n = int(self.headers.get("Content-Length") or 0)
+                self._reply(parse_qs(self.rfile.read(n).decode()))
+
+            def log_message(self, *args):
+                pass
+
+        return Handler
+
+    def start(self) -> "FakeGasServer":
+        self._thread = threading.Thread(target=self._server.serve_forever, name="fake-gas", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+class _Server(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 256  # a burst of simulated sessions connects at once
+
+
+def _text(value: Any) -> str:
+    return "" if value is None else str(value)
@@ -0,0 +1,184 @@
+"""Client for the GAS web app that owns the Primary timer (get / start_timer / stop_timer).
+
+One ``GasClient`` is shared by the whole process: a keep-alive connection
+pool to script.google.com, a short connect timeout, jittered exponential
+backoff for 429/5xx/connection errors, and a circuit breaker.  While the
+breaker is open, calls fail immediately with ``GasUnavailable`` so the page
+goes straight to the sheet fallback instead of waiting on a sick GAS.
+"""
+import random
+import threading
+import time
+from typing import Dict, Optional
+
+from mci.sheets import RETRY_STATUS
+from mci.tracing import TRACER
+
+
+class GasError(Exception):
+    """HTTP-level failure talking to the GAS web app."""
+
+
+class GasUnavailable(GasError):
+    """GAS did not answer (timeouts / connection errors) or the breaker is open."""
+
+
+class CircuitBreaker:
+    """closed → (``failure_threshold`` failures in a row) → open for ``reset_timeout`` s
+    → half-open: one probe call; success closes, failure opens again."""
+
+    CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+
+    def __init__(self, failure_threshold: int = 3, reset_timeout: float = 30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._lock = threading.Lock()
+        self._failures = 0
+        self._opened_at = 0.0
+        self._state = self.CLOSED
+        self._probe_in_flight = False
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            if self._state == self.OPEN and time.monotonic() - self._opened_at >= self.reset_timeout:
+                return self.HALF_OPEN
+            return self._state
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self._state == self.CLOSED:
+                return True
+            if self._state == self.OPEN:
+                if time.monotonic() - self._opened_at < self.reset_timeout:
+                    return False
+                self._state = self.HALF_OPEN
+                self._probe_in_flight = False
+            if self._probe_in_flight:  # half-open: let a single probe through
+                return False
+            self._probe_in_flight = True
+            return True
+
+    def record_success(self):
+        with self._lock:
+            self._failures = 0
+            self._state = self.CLOSED
+            self._probe_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self._state == self.HALF_OPEN or self._failures >= self.failure_threshold:
+                self._state = self.OPEN
+                self._opened_at = time.monotonic()
+            self._probe_in_flight = False
+
+
+class GasClient:
+    """``url`` empty → every call returns ``{}`` (no Primary timer configured)."""
+
+    def __init__(
+        self,
+        url: str = "",
+        token: str = "",
+        connect_timeout: float = 3.05,
+        read_timeout: float = 8.0,
+        retries: int = 2,
+        backoff: float = 0.25,
+        pool_size: int = 32,
+        breaker: Optional[CircuitBreaker] = None,
+    ):
+        self.url = (url or "").strip()
+        self.token = token or ""
+        self.timeout = (connect_timeout, read_timeout)
+        self.retries = retries
+        self.backoff = backoff
+        self.pool_size = pool_size
+        self.breaker = breaker or CircuitBreaker()
+        self._session = None
+        self._session_lock = threading.Lock()
+
+    def _payload(self, action: str, row: int) -> Dict[str, str]:
+        data = {"action": action, "row": str(row)}
+        if self.token:
+            data["token"] = self.token
+        return data
+
+    def session(self):
+        """Shared keep-alive ``requests.Session`` (built on first use)."""
+        with self._session_lock:
+            if self._session is None:
+                import requests
+                from requests.adapters import HTTPAdapter
+
+                s = requests.Session()
+                adapter = HTTPAdapter(pool_connections=4, pool_maxsize=self.pool_size)
+                s.mount("https://", adapter)
+                s.mount("http://", adapter)
+                self._session = s
+            return self._session
+
+    def _sleep_backoff(self, attempt: int):
+        # full jitter: 0 … backoff * 2^attempt
+        time.sleep(random.uniform(0, self.backoff * (2 ** attempt)))
+
+    def _request(self, method: str, action: str, row: int):
+        """Single place every GAS round-trip goes through. Returns the ``requests`` response."""
+        import requests
+
+        if not self.breaker.allow():
+            raise GasUnavailable("GAS unavailable (circuit open), using sheet timer")
+        data = self._payload(action, row)
+        session = self.session()
+        attempt = 0
+        while True:
+            try:
+                with TRACER.remote(f"gas.{action}"):
+                    if method == "GET":
+                        r = session.get(self.url, params=data, timeout=self.timeout)
+                    else:
+                        r = session.post(self.url, data=data, timeout=self.timeout)
+            except requests.RequestException as e:
+                if isinstance(e, (requests.ConnectionError, requests.Timeout)) and attempt < self.retries:
+                    self._sleep_backoff(attempt)
+                    attempt += 1
+                    continue
+                self.breaker.record_failure()
+                raise GasUnavailable(f"GAS unreachable: {e}") from e
+            if r.status_code in RETRY_STATUS:
+                if attempt < self.retries:
+                    self._sleep_backoff(attempt)
+                    attempt += 1
+                    continue
+                self.breaker.record_failure()
+                return r
+            self.breaker.record_success()
+            return r
+
+    def get_row(self, row: int) -> dict:
+        if not self.url:
+            return {}
+        r = self._request("GET", "get", row)
+        try:
+            r.raise_for_status()
+        except Exception as e:
+            raise GasError(f"GAS HTTP error: {e}\nResponse: {r.text}") from e
+        return r.json()
+
+    def start_timer(self, row: int) -> dict:
+        if not self.url:
+            return {}
+        r = self._request("POST", "start_timer", row)
+        r.raise_for_status()
+        return r.json()
+
+    def stop_timer(self, row: int) -> dict:
+        """หยุดที่ต้นทาง (ถ้ามี endpoint stop_timer); ถ้าไม่มีจะไม่ error"""
+        if not self.url:
+            return {}
+        r = self._request("POST", "stop_timer", row)
+        try:
+            r.raise_for_status()
+            return r.json()
+        except Exception:
+            return {"status": "noop"}
@@ -0,0 +1,311 @@
+"""Concurrent load test against the local Sheets / GAS fakes.
+
+Simulates many participants, each in its own thread, going through the same
+per-rerun steps as ``streamlit_app.py`` (``edit1`` → submit treatment →
+``edit2`` → submit triage → ``view``; the sessions on a share of the patients
+instead wait for that patient's timer to run out).  Reports p50/p95/p99 rerun latency and remote
+calls per rerun (from the rerun's trace), without touching a real spreadsheet::
+
+    python -m mci.loadtest --sessions 200 --sheets-latency 0.15 --gas-latency 0.3 --error-rate 0.02
+"""
+import argparse
+import os
+import random
+import tempfile
+import threading
+import time
+from collections import Counter, defaultdict
+from typing import Dict, List, Optional
+
+from mci import patient
+from mci.fakes import CallStats, FakeGasServer, FakeSheetsHandle, FakeSpreadsheet, Faults
+from mci.expiry import ExpiryScheduler
+from mci.gas import GasClient
+from mci.quota import SUBMIT, VIEW, QuotaScheduler, set_priority
+from mci.row_cache import RowCache
+from mci.row_state import RowStateStore, open_row_state
+from mci.shards import Shard, ShardedStorage, ShardRouter
+from mci.storage import SheetsStorage, Storage
+from mci.timer_cache import TimerCache
+from mci.tracing import TRACER
+
+HEADER = (
+    ["Name", "Age", "Sex"] + [f"Info {c}" for c in "DEFGHIJK"]
+    + ["Airway", "Breathing", "Circulation", "Disability", "Exposure", "Other"]
+    + ["Result R", "Result S", "Result T", "Result U", "Priority", "W", "X", "Y", "Deaths"]
+)
+
+
+def make_rows(patients: int) -> List[List[str]]:
+    rows = [list(HEADER)]
+    for i in range(1, patients + 1):
+        rows.append([f"Patient {i}", str(20 + i % 60), "MF"[i % 2]] + [f"d{i}"] * 8)
+    return rows
+
+
+def make_router(shards: int, strategy: str, patients: int) -> ShardRouter:
+    if strategy == "hash":
+        return ShardRouter([Shard(f"s{i}") for i in range(max(1, shards))], "hash")
+    size = -(-patients // max(1, shards))
+    return ShardRouter([Shard(f"s{i}", i * size + 1, (i + 1) * size if i < shards - 1 else 0)
+                        for i in range(max(1, shards))])
+
+
+def split_rows(grid: List[List[str]], router: ShardRouter) -> List[List[List[str]]]:
+    """One grid per shard (header + that shard's rows at their local positions)."""
+    parts: List[List[List[str]]] = [[list(grid[0])] for _ in router.shards]
+    for display_row, vals in enumerate(grid[1:], start=1):
+        i, local = router.route(display_row)
+        part = parts[i]
+        while len(part) <= local:
+            part.append([])
+        part[local] = vals
+    return parts
+
+
+def percentile(values: List[float], pct: float) -> float:
+    if not values:
+        return 0.0
+    s = sorted(values)
+    k = min(len(s) - 1, max(0, int(round(pct / 100.0 * (len(s) - 1)))))
+    return s[k]
+
+
+class SimSession:
+    """The bits of ``st.session_state`` the page relies on."""
+
+    def __init__(self, key: str, display_row: int):
+        self.key = key
+        self.display_row = display_row
+        self.sheet_row = display_row + 1
+        self.state = {"treated": False, "timer_stopped": False, "expired_processed": False}
+
+
+class LoadTest:
+    def __init__(self, store: Storage, gas: Optional[GasClient], stats: CallStats,
+                 expiry: Optional[ExpiryScheduler] = None, row_state: Optional[RowStateStore] = None):
+        self.store = store
+        self.row_state = row_state
+        self.gas = gas
+        self.stats = stats
+        self.expiry = expiry
+        self._lock = threading.Lock()
+        self.latencies: Dict[str, List[float]] = defaultdict(list)
+        self.calls: Dict[str, List[int]] = defaultdict(list)
+        self.errors: Counter = Counter()
+        self.expected_deaths: Counter = Counter()
+        self.expired_timers = set()
+        self.timers = TimerCache()
+
+    # ---------- one rerun ----------
+    def page_load(self, sess: SimSession, mode: str) -> Dict:
+        """What the main script does before rendering (``patient.prepare_page`` + payload)."""
+        set_priority(VIEW if mode == "view" else SUBMIT)
+        res = patient.prepare_page(self.store, self.gas, sess.display_row, sess.sheet_row, mode, sess.state,
+                                   timers=self.timers, row_state=self.row_state, expiry=self.expiry)
+        if res["expired_now"]:
+            with self._lock:
+                if self.expiry is not None:  # the scheduler counts each timer once
+                    self.expired_timers.add((sess.sheet_row, res["end_epoch"]))
+                elif res["counted"]:
+                    self.expected_deaths[sess.sheet_row] += 1
+            return {"expired": True}
+        if res["row_error"] is not None:
+            raise res["row_error"]
+        return patient.payloads_from_values(*res["row_data"], mode=mode)
+
+    def rerun(self, sess: SimSession, step: str, mode: str, action=None):
+        trace = TRACER.begin(step)
+        t = time.perf_counter()
+        try:
+            out = self.page_load(sess, mode)
+            if action is not None:
+                out = action(out)
+        except Exception as e:
+            with self._lock:
+                self.errors[f"{step}: {type(e).__name__}"] += 1
+            out = None
+        dt = time.perf_counter() - t
+        TRACER.end(trace)
+        n = trace.remote_calls
+        with self._lock:
+            self.latencies[step].append(dt)
+            self.calls[step].append(n)
+        return out
+
+    # ---------- one participant ----------
+    def run_session(self, sess: SimSession, expire: bool, think: float):
+        def pause():
+            if think:
+                time.sleep(random.uniform(0.5, 1.5) * think)
+
+        data = self.rerun(sess, "edit1", "edit1")
+        if expire:
+            end = patient.resolve_timer(self.store, self.gas, sess.display_row, sess.sheet_row, "edit1")["end_epoch"]
+            time.sleep(max(0.0, end - time.time()) + 1.1)
+            self.rerun(sess, "expired", "edit1")
+            self.rerun(sess, "locked", "edit1")
+            return
+        pause()
+        headers_lq = (data or {}).get("headers_LQ", [])
+        picks = {h: random.choice(["Yes", "No"]) for h in headers_lq}
+        self.rerun(sess, "submit_lq", "edit1",
+                   lambda _: patient.update_LQ(self.store, sess.sheet_row, picks))
+        pause()
+        self.rerun(sess, "edit2", "edit2")
+        pause()
+
+        def submit_v(_):
+            res = patient.update_V(self.store, sess.sheet_row, random.choice(patient.ALLOWED_V))
+            if self.row_state is not None:
+                self.row_state.mark_treated(sess.display_row)
+            if self.expiry is not None:
+                self.expiry.cancel(sess.display_row)
+            patient.stop_timer(self.gas, sess.display_row, self.timers)
+            sess.state["treated"] = sess.state["timer_stopped"] = True
+            return res
+        self.rerun(sess, "submit_v", "edit2", submit_v)
+        self.rerun(sess, "view", "view")
+
+    # ---------- report ----------
+    def report(self) -> str:
+        lines = ["%-10s %6s %8s %8s %8s %10s" % ("step", "n", "p50 ms", "p95 ms", "p99 ms", "calls/run")]
+        all_lat: List[float] = []
+        all_calls: List[int] = []
+        for step, lat in self.latencies.items():
+            calls = self.calls[step]
+            all_lat += lat
+            all_calls += calls
+            lines.append("%-10s %6d %8.0f %8.0f %8.0f %10.2f" % (
+                step, len(lat), percentile(lat, 50) * 1000, percentile(lat, 95) * 1000,
+                percentile(lat, 99) * 1000, sum(calls) / max(1, len(calls))))
+        lines.append("%-10s %6d %8.0f %8.0f %8.0f %10.2f" % (
+            "ALL", len(all_lat), percentile(all_lat, 50) * 1000, percentile(all_lat, 95) * 1000,
+            percentile(all_lat, 99) * 1000, sum(all_calls) / max(1, len(all_calls))))
+        lines.append("")
+        lines.append("remote calls (process total): " + ", ".join(
+            f"{k}={v}" for k, v in sorted(self.stats.totals.items())))
+        if self.stats.errors:
+            lines.append("injected errors: " + ", ".join(f"{k}={v}" for k, v in sorted(self.stats.errors.items())))
+        if self.errors:
+            lines.append("failed reruns: " + ", ".join(f"{k}={v}" for k, v in self.errors.most_common()))
+        return "\n".join(lines)
+
+
+def check_deaths(store: Storage, expected: Counter) -> List[str]:
+    """Column Z must equal the number of counted expiries per row."""
+    problems = []
+    for row, n in sorted(expected.items()):
+        got = store.read_row(row)[1][25]
+        if str(got) != str(n):
+            problems.append(f"row {row}: Z={got!r}, expected {n}")
+    return problems
+
+
+def main(argv=None) -> int:
+    ap = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    ap.add_argument("--sessions", type=int, default=200)
+    ap.add_argument("--patients", type=int, default=0, help="default: one patient per session")
+    ap.add_argument("--expire-share", type=float, default=0.2, help="share of patients whose timer runs out (every session on them waits for it)")
+    ap.add_argument("--expire-seconds", type=int, default=3)
+    ap.add_argument("--timer-seconds", type=int, default=600)
+    ap.add_argument("--sheets-latency", type=float, default=0.15)
+    ap.add_argument("--gas-latency", type=float, default=0.3)
+    ap.add_argument("--jitter", type=float, default=0.05)
+    ap.add_argument("--error-rate", type=float, default=0.0, help="share of remote calls answered with 429")
+    ap.add_argument("--write-latency", type=float, default=0.5, help="write coalescer flush window")
+    ap.add_argument("--row-ttl", type=float, default=0.0, help="shared row cache TTL (0 = off)")
+    ap.add_argument("--read-quota", type=float, default=0.0, help="Sheets reads per minute (0 = no quota scheduler)")
+    ap.add_argument("--write-quota", type=float, default=60.0, help="Sheets writes per minute (with --read-quota)")
+    ap.add_argument("--think", type=float, default=0.5, help="mean pause between clicks (s)")
+    ap.add_argument("--no-gas", action="store_true", help="timer from the sheet fallback only")
+    ap.add_argument("--incident", action="store_true", help="start every timer up front (patient.start_incident)")
+    ap.add_argument("--scheduler", action="store_true", help="expire timers centrally (mci.expiry)")
+    ap.add_argument("--state", choices=["memory", "sqlite", "none"], default="memory",
+                    help="shared row lifecycle state (mci.row_state); none = per-session flags only")
+    ap.add_argument("--shards", type=int, default=1, help="spread patients over this many fake spreadsheets")
+    ap.add_argument("--shard-strategy", choices=["range", "hash"], default="range")
+    ap.add_argument("--seed", type=int, default=1)
+    args = ap.parse_args(argv)
+
+    random.seed(args.seed)
+    patients = args.patients or args.sessions
+    stats = CallStats()
+    n_expire = int(round(patients * args.expire_share))
+    # chosen per patient, so every session on a row agrees with that row's timer length
+    expiring = set(random.sample(range(1, patients + 1), n_expire))
+    seconds = {r: args.expire_seconds if r in expiring else args.timer_seconds for r in range(1, patients + 1)}
+
+    grid = make_rows(patients)
+    if args.no_gas or args.incident:
+        for display_row, secs in seconds.items():  # column Q = timer length for the fallback
+            grid[display_row] += [""] * (16 - len(grid[display_row])) + [str(secs)]
+    router = make_router(args.shards, args.shard_strategy, patients)
+    sheets = [FakeSpreadsheet(part, stats=stats, faults=Faults(args.sheets_latency, args.jitter, args.error_rate))
+              for part in split_rows(grid, router)]
+    caches = [RowCache(ttl=args.row_ttl) for _ in sheets] if args.row_ttl > 0 else []
+    quota = QuotaScheduler(args.read_quota, args.write_quota) if args.read_quota > 0 else None
+    handles = [FakeSheetsHandle(sh, write_latency=args.write_latency, row_cache=caches[i] if caches else None,
+                                quota=quota) for i, sh in enumerate(sheets)]
+    stores = [SheetsStorage(h) for h in handles]
+    store = ShardedStorage(router, stores) if len(stores) > 1 else stores[0]
+
+    gas_server = FakeGasServer(seconds, stats=stats,
+                               faults=Faults(args.gas_latency, args.jitter, args.error_rate))
+    with gas_server:
+        gas = None if args.no_gas else GasClient(gas_server.url)
+        row_state = None
+        if args.state != "none":
+            path = os.path.join(tempfile.mkdtemp(prefix="mci-loadtest-"), "state.sqlite3")
+            row_state = open_row_state(args.state, path, namespace=f"loadtest-{args.seed}")
+        expiry = ExpiryScheduler(store, gas=gas, lock_col="W", row_state=row_state) if args.scheduler else None
+        lt = LoadTest(store, gas, stats, expiry, row_state)
+        if args.incident:
+            before = Counter(stats.totals)
+            started = patient.start_incident(store, timers=lt.timers)
+            if expiry is not None:
+                for display_row, t in started.items():
+                    expiry.schedule(display_row, display_row + 1, t.end_epoch)
+            print(f"incident: {len(started)} timers started, calls: " + ", ".join(
+                f"{k}={v}" for k, v in sorted((Counter(stats.totals) - before).items())))
+        threads = []
+        t0 = time.perf_counter()
+        for i in range(args.sessions):
+            sess = SimSession(f"sim{i}", i % patients + 1)
+            th = threading.Thread(target=lt.run_session, args=(sess, sess.display_row in expiring, args.think),
+                                  daemon=True)
+            threads.append(th)
+            th.start()
+        for th in threads:
+            th.join()
+        for sh in sheets:
+            sh.faults = Faults()  # no injection for the final flush / checks
+        if expiry is not None:
+            expiry.run_due()
+            expiry.close()
+            for row, _ in lt.expired_timers:
+                lt.expected_deaths[row] += 1
+        for h in handles:
+            h.z_counter().flush()
+        wall = time.perf_counter() - t0
+
+    print(f"{args.sessions} sessions, {patients} patients, {n_expire} expiring, wall {wall:.1f}s")
+    print(lt.report())
+    writers = [h.writer() for h in handles]
+    print(f"write queue: {sum(w.writes_submitted for w in writers)} writes → "
+          f"{sum(w.flushes for w in writers)} batch updates" + (f" over {len(handles)} shards" if len(handles) > 1 else ""))
+    print(f"timer cache: {lt.timers.hits} hits, {lt.timers.misses} misses")
+    if caches:
+        print(f"row cache: {sum(c.hits for c in caches)} hits, {sum(c.shared for c in caches)} shared fetches, "
+              f"{sum(c.misses for c in caches)} misses")
+    if quota is not None:
+        waits = {k[len("quota.wait."):]: h for k, h in TRACER.spans.items() if k.startswith("quota.wait.")}
+        print(f"quota: {quota.granted} calls, {quota.throttled} throttled (429), wait avg " + ", ".join(
+            f"{k}={h.sum / max(1, h.count) * 1000:.0f}ms" for k, h in sorted(waits.items())))
+    problems = check_deaths(store, lt.expected_deaths)
+    print("column Z: " + ("exact" if not problems else "; ".join(problems)))
+    return 1 if problems else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,354 @@
+"""ตรรกะแถวคนไข้บน ``Storage`` (ไม่มี Streamlit): payload, อัปเดต L–Q/V, นับ Z, timer"""
+import contextvars
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from mci.events import EVENTS
+from mci.gas import GasClient
+from mci.row_state import RowStateStore
+from mci.schema import SCHEMA, YN, PatientRecord
+from mci.storage import Storage
+from mci.timer_cache import TimerCache, TimerState
+
+# =========================
+# Data access (rows / updates)
+# =========================
+def get_header_and_row(store: Storage, row: int, mode: str = "") -> Tuple[List[str], List[str]]:
+    """header (cache) + แถว ในคำขอเดียว เฉพาะคอลัมน์ที่โหมดนั้นใช้"""
+    return store.read_row(row, mode)
+
+ALLOWED_V = ["Priority 1", "Priority 2", "Priority 3"]
+
+def decode_row(headers: List[str], vals: List[str]) -> PatientRecord:
+    """แถวเดียว → PatientRecord (schema bind กับ header ครั้งเดียว, view ทุกโหมดใช้ record เดียวกัน)"""
+    return SCHEMA.record(headers, vals)
+
+def build_payloads_from_row(store: Storage, sheet_row: int, mode: str) -> Dict:
+    headers, vals = get_header_and_row(store, sheet_row, mode)
+    return payloads_from_values(headers, vals, mode)
+
+def payloads_from_values(headers: List[str], vals: List[str], mode: str) -> Dict:
+    return payloads_from_record(decode_row(headers, vals), mode)
+
+def payloads_from_record(rec: PatientRecord, mode: str) -> Dict:
+    data = {"status": "ok", "record": rec}
+    if mode == "edit1":
+        data["A_K"] = rec.view("A_K")
+        data["headers_LQ"] = rec.treatment_headers
+        data["current_LQ"] = rec.treatment
+    if mode == "edit2":
+        data["A_C_R_U"] = rec.view("A_C_R_U")
+        data["current_V"] = rec.priority
+    if mode == "view":
+        data["A_C_R_V"] = rec.view("A_C_R_V")
+    return data
+
+def update_LQ(store: Storage, sheet_row: int, lq_values: Dict[str, str]) -> Dict:
+    layout = SCHEMA.bind(store.headers())
+    updates = {}
+    for h, v in lq_values.items():
+        col = layout.letters.get(h)
+        if col is not None:
+            updates[col] = v
+    if len(updates) < len(lq_values):
+        store.invalidate_headers()  # header ในชีตถูกแก้ → รอบหน้าอ่านใหม่
+    if updates:
+        # เขียน + ได้แถวล่าสุดกลับมาในคำขอเดียว (ไม่ต้องอ่านซ้ำ)
+        data_next = payloads_from_values(*store.write_row(sheet_row, updates), mode="edit2")
+        EVENTS.emit("lq_submit", sheet_row, values=lq_values)
+    else:
+        data_next = build_payloads_from_row(store, sheet_row, mode="edit2")
+    return {"status": "ok", "next": data_next}
+
+def update_V(store: Storage, sheet_row: int, v_value: str) -> Dict:
+    rec = decode_row(*store.write_row(sheet_row, {"V": v_value}))
+    EVENTS.emit("v_submit", sheet_row, priority=v_value)
+    return {"status": "ok", "final": {"A_C_R_V": rec.view("A_C_R_V"), "record": rec}}
+
+def increment_Z(store: Storage, sheet_row: int, event_key: str) -> bool:
+    """Z = Z + 1 (นับใน process แล้วเขียนยอดรวมเป็น batch; event เดิมนับครั้งเดียว)"""
+    counted = store.increment_z(sheet_row, event_key)
+    if counted:
+        EVENTS.emit("expiry", sheet_row, event_key=event_key)
+    return counted
+
+# =========================
+# Timer helpers (fallback อ่านจาก Secondary ถ้าไม่มี GAS)
+# =========================
+def parse_seconds(value) -> int:
+    """รองรับ: 120, '02:00', '00:01:30', และ numeric day-fraction"""
+    try:
+        if value is None or value == "":
+            return 0
+        if hasattr(value, "hour") and hasattr(value, "minute") and hasattr(value, "second"):
+            return max(0, int(value.hour) * 3600 + int(value.minute) * 60 + int(value.second))
+        if isinstance(value, (int, float)):
+            if 0 < float(value) < 2:
+                return max(0, int(round(float(value) * 86400)))
+            return max(0, int(round(float(value))))
+        s = str(value).strip()
+        if not s:
+            return 0
+        if s.isdigit() or (s.startswith("-") and s[1:].isdigit()):
+            return max(0, int(s))
+        parts = s.split(":")
+        if len(parts) == 2 and parts[0].isdigit() and parts[1].isdigit():
+            return max(0, int(parts[0]) * 60 + int(parts[1]))
+        if len(parts) == 3 and all(p.isdigit() for p in parts):
+            return max(0, int(parts[0]) * 3600 + int(parts[1]) * 60 + int(parts[2]))
+    except Exception:
+        pass
+    return 0
+
+def read_timer_state(store: Storage, sheet_row: int) -> dict:
+    headers, vals = get_header_and_row(store, sheet_row, mode="timer")
+    return timer_state_from_values(vals)
+
+def timer_state_from_values(vals: List[str]) -> dict:
+    q_idx = SCHEMA.cells["timer_origin"]
+    r_idx = SCHEMA.cells["timer_t0"]
+    s_idx = SCHEMA.cells["timer_end"]
+
+    origin_raw = vals[q_idx] if q_idx < len(vals) else ""
+    t0_raw     = vals[r_idx] if r_idx < len(vals) else ""
+    end_raw    = vals[s_idx] if s_idx < len(vals) else ""
+
+    origin = parse_seconds(origin_raw)
+    try:
+        t0_epoch = int(float(t0_raw)) if str(t0_raw).strip() != "" else 0
+    except Exception:
+        t0_epoch = 0
+    try:
+        end_epoch = int(float(end_raw)) if str(end_raw).strip() != "" else 0
+    except Exception:
+        end_epoch = 0
+
+    return {"origin": origin, "t0_epoch": t0_epoch, "end_epoch": end_epoch}
+
+def start_timer_if_needed(store: Storage, sheet_row: int, origin: int, t0_epoch: int, end_epoch: int) -> Tuple[int, int]:
+    if origin <= 0:
+        return t0_epoch, end_epoch
+    if t0_epoch > 0 and end_epoch > 0:
+        return t0_epoch, end_epoch
+
+    now = int(time.time())
+    t0 = now if t0_epoch <= 0 else t0_epoch
+    end_ = t0 + origin if end_epoch <= 0 else end_epoch
+
+    store.write_cells(sheet_row, {"R": t0, "S": end_})
+    return t0, end_
+
+def start_incident(store: Storage, rows: Optional[Iterable[int]] = None, now: Optional[int] = None,
+                   timers: Optional[TimerCache] = None) -> Dict[int, TimerState]:
+    """เริ่ม timer ทุกแถว (หรือเฉพาะ ``rows``) ตาม Q: อ่าน 1 ครั้ง + เขียน R/S batch เดียว; แถวที่เริ่มแล้วไม่แตะ"""
+    now = int(time.time()) if now is None else int(now)
+    wanted = set(rows) if rows is not None else None
+    cells: Dict[int, Dict[str, int]] = {}
+    started: Dict[int, TimerState] = {}
+    for sheet_row, vals in enumerate(store.read_all()[1:], start=2):
+        display_row = sheet_row - 1
+        if wanted is not None and display_row not in wanted:
+            continue
+        ts = timer_state_from_values(vals)
+        if ts["origin"] <= 0 or ts["end_epoch"] > 0:
+            continue
+        cells[sheet_row] = {"R": now, "S": now + ts["origin"]}
+        started[display_row] = TimerState(ts["origin"], now, now + ts["origin"])
+    if not cells:
+        return {}
+    store.write_many(cells)
+    for display_row, t in started.items():
+        if timers is not None:
+            timers.put(display_row, *t)
+        EVENTS.emit("timer_start", display_row + 1, t0=t.t0_epoch, end=t.end_epoch, source="incident")
+    return started
+
+_pool: Optional[ThreadPoolExecutor] = None
+_pool_lock = threading.Lock()
+GAS_LOOKUP_WORKERS = 4
+
+def fetch_pool() -> ThreadPoolExecutor:
+    """thread pool ของ process สำหรับอ่าน remote หลายอย่างพร้อมกันใน 1 rerun"""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ThreadPoolExecutor(max_workers=32, thread_name_prefix="mci-fetch")
+        return _pool
+
+_gas_pool: Optional[ThreadPoolExecutor] = None
+
+def gas_pool() -> ThreadPoolExecutor:
+    """pool แยกสำหรับถาม GAS ทีละหลายแถว (board) ไม่ให้แย่ง fetch_pool ของหน้าคนไข้"""
+    global _gas_pool
+    with _pool_lock:
+        if _gas_pool is None:
+            _gas_pool = ThreadPoolExecutor(max_workers=GAS_LOOKUP_WORKERS, thread_name_prefix="mci-gas-lookup")
+        return _gas_pool
+
+def submit_traced(fn, *args, **kwargs) -> Future:
+    """``fetch_pool().submit`` ที่พา context (trace ของ rerun) ไปด้วย"""
+    ctx = contextvars.copy_context()
+    return fetch_pool().submit(ctx.run, fn, *args, **kwargs)
+
+def resolve_timer(store: Storage, gas: Optional[GasClient], display_row: int, sheet_row: int, mode: str,
+                  timers: Optional[TimerCache] = None) -> Dict:
+    """Timer ของแถวนี้: GAS (Primary) เป็นหลัก, fallback อ่าน/เริ่มจาก Secondary (อ่านแถวไปพร้อมกับถาม GAS)"""
+    origin_seconds = 0
+    t0_epoch = 0
+    end_epoch = 0
+    row_data = None
+    row_error = None
+    warnings: List[str] = []
+
+    cached = timers.get(display_row) if timers is not None else None
+    if cached is not None:
+        try:
+            row_data = get_header_and_row(store, sheet_row, mode)
+        except Exception:
+            row_data = None  # หน้าอ่านใหม่และแจ้ง error เอง
+        return {
+            "origin_seconds": cached.origin_seconds,
+            "t0_epoch": cached.t0_epoch,
+            "end_epoch": cached.end_epoch,
+            "row_data": row_data,
+            "warnings": warnings,
+        }
+
+    use_gas = gas is not None and bool(gas.url)
+    row_future = submit_traced(get_header_and_row, store, sheet_row, mode) if use_gas else None
+
+    # 1) GAS
+    start_at_gas = False
+    try:
+        g = gas.get_row(display_row) if use_gas else {}
+        if g and g.get("status") == "ok":
+            origin_seconds = int(g.get("timer_seconds", 0) or 0)
+            t0_epoch = int(g.get("t0_epoch", 0) or 0)
+            end_epoch = int(g.get("end_epoch", 0) or 0)
+            start_at_gas = origin_seconds > 0 and end_epoch == 0
+    except Exception as e:
+        warnings.append(f"GAS error, fallback to sheet: {e}")
+
+    # แถว (อ่านอยู่แล้วระหว่างถาม GAS หรืออ่านตอนนี้ถ้าไม่มี GAS)
+    try:
+        row_data = row_future.result() if row_future is not None else get_header_and_row(store, sheet_row, mode)
+    except Exception as e:
+        row_error = e
+
+    if start_at_gas:
+        ts = timer_state_from_values(row_data[1]) if row_data is not None else None
+        if ts is not None and ts["end_epoch"] > 0:  # เริ่มแบบ bulk บนชีตแล้ว (start_incident)
+            t0_epoch, end_epoch = ts["t0_epoch"], ts["end_epoch"]
+        else:
+            try:
+                s = gas.start_timer(display_row)
+                if s.get("status") == "ok":
+                    t0_epoch = int(s.get("t0_epoch", t0_epoch) or 0)
+                    end_epoch = int(s.get("end_epoch", end_epoch) or 0)
+                    EVENTS.emit("timer_start", sheet_row, t0=t0_epoch, end=end_epoch, source="gas")
+            except Exception as e:
+                warnings.append(f"GAS error, fallback to sheet: {e}")
+
+    # 2) fallback Secondary
+    if end_epoch == 0:
+        try:
+            if row_error is not None:
+                raise row_error
+            ts = timer_state_from_values(row_data[1])
+            origin_seconds = origin_seconds or int(ts["origin"])
+            t0_epoch = t0_epoch or int(ts["t0_epoch"])
+            end_epoch = end_epoch or int(ts["end_epoch"])
+            if origin_seconds > 0 and end_epoch == 0:
+                t0_epoch, end_epoch = start_timer_if_needed(store, sheet_row, origin_seconds, t0_epoch, end_epoch)
+                EVENTS.emit("timer_start", sheet_row, t0=t0_epoch, end=end_epoch, source="sheet")
+        except Exception as e:
+            warnings.append(f"Sheet timer fallback error: {e}")
+
+    if timers is not None:
+        timers.put(display_row, origin_seconds, t0_epoch, end_epoch)
+    return {
+        "origin_seconds": origin_seconds,
+        "t0_epoch": t0_epoch,
+        "end_epoch": end_epoch,
+        "row_data": row_data,
+        "warnings": warnings,
+    }
+
+def prepare_page(store: Storage, gas: Optional[GasClient], display_row: int, sheet_row: int, mode: str,
+                 state, timers: Optional[TimerCache] = None, row_state: Optional[RowStateStore] = None,
+                 expiry=None) -> Dict:
+    """งานข้อมูลทั้งหมดของหน้า patient ใน 1 rerun ก่อนวาด (shared state → timer → หมดเวลา → แถว)"""
+    # ใช้ร่วมกับ loadtest / replay; state = flag ของ session (แก้ในที่), expired_now → หน้า rerun เพื่อล็อก
+    shared = row_state.get(display_row) if row_state is not None else None
+    if shared is not None and shared.treated:
+        state["treated"] = state["timer_stopped"] = True
+    if shared is not None and shared.expired:
+        state["expired_processed"] = state["timer_stopped"] = True
+
+    if shared is not None and shared.locked:  # ล็อกแล้ว → ไม่ต้องถาม GAS/อ่าน timer
+        timer = {"origin_seconds": 0, "t0_epoch": 0, "end_epoch": max(0, shared.expired_end),
+                 "row_data": None, "warnings": []}
+    else:
+        timer = resolve_timer(store, gas, display_row, sheet_row, mode, timers)
+    end_epoch = timer["end_epoch"]
+    remaining = max(0, end_epoch - int(time.time())) if end_epoch else 0
+    timer.update(remaining=remaining, expired_now=False, counted=False, row_error=None)
+
+    if expiry is not None and end_epoch and not state["treated"] and not state["timer_stopped"]:
+        expiry.schedule(display_row, sheet_row, end_epoch)  # ซ้ำได้ (idempotent ต่อ end_epoch)
+    if end_epoch and remaining <= 0 and not state["expired_processed"] and not state["treated"]:
+        # ไม่มี timer (end_epoch 0) → ไม่ใช่หมดเวลา; มี scheduler → นับ Z / lock / stop GAS ที่ server, หน้านี้แค่ล็อก
+        if expiry is None and (row_state is None or row_state.claim_expiry(display_row, end_epoch)):
+            try:
+                timer["counted"] = increment_Z(store, sheet_row, f"expiry:{sheet_row}:{end_epoch}")
+            except Exception as e:
+                timer["warnings"].append(f"ไม่สามารถอัปเดตคอลัมน์ Z ได้: {e}")
+        if timers is not None:
+            timers.invalidate(display_row)
+        state["expired_processed"] = state["timer_stopped"] = True
+        timer["expired_now"] = True
+        return timer
+
+    if timer["row_data"] is None:
+        try:
+            timer["row_data"] = get_header_and_row(store, sheet_row, mode)
+        except Exception as e:
+            timer["row_error"] = e
+    return timer
+
+def gas_timers(gas: Optional[GasClient], display_rows: Iterable[int],
+               timers: Optional[TimerCache] = None) -> Tuple[Dict[int, TimerState], List[int]]:
+    """timer ของหลายแถวจาก GAS (board): ``({แถวที่เริ่มแล้ว: timer}, แถวที่ GAS ไม่ตอบ)`` ถามบน pool แยกขนาดเล็ก"""
+    rows = list(display_rows)
+    if gas is None or not gas.url or not rows:
+        return {}, []
+    pool = gas_pool()
+    futures = {r: pool.submit(contextvars.copy_context().run, gas.get_row, r) for r in rows}
+    started: Dict[int, TimerState] = {}
+    failed: List[int] = []
+    for r, fut in futures.items():
+        try:
+            g = fut.result()
+        except Exception:
+            failed.append(r)
+            continue
+        if not g or g.get("status") != "ok":
+            failed.append(r)
+            continue
+        end_epoch = int(g.get("end_epoch", 0) or 0)
+        if end_epoch > 0:
+            started[r] = TimerState(int(g.get("timer_seconds", 0) or 0), int(g.get("t0_epoch", 0) or 0), end_epoch)
+            if timers is not None:
+                timers.put(r, *started[r])
+        elif timers is not None:
+            timers.mark_unstarted(r)  # ไม่ถามซ้ำจนกว่าจะครบ unstarted_ttl
+    return started, failed
+
+def stop_timer(gas: Optional[GasClient], display_row: int, timers: Optional[TimerCache] = None) -> dict:
+    """หยุด timer ที่ GAS และลืมค่าที่ cache ไว้"""
+    if timers is not None:
+        timers.invalidate(display_row)
+    EVENTS.emit("timer_stop", display_row + 1)
+    return gas.stop_timer(display_row) if gas is not None else {}
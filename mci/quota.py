@@ -0,0 +1,180 @@
+"""Quota-aware, priority-ordered gate in front of every Sheets API call.
+
+Google counts Sheets requests per minute (reads and writes separately) for
+the service account; past that it answers 429, which used to surface as
+"Failed to read sheet" or a Z write retried blindly by one session while the
+others kept hammering.  ``QuotaScheduler`` holds one token bucket per kind
+("read" / "write") for the whole process.  A call waits for a token; waiting
+calls are served by priority (``CRITICAL`` expiry / triage writes, then
+``SUBMIT`` responder reads, then ``VIEW`` passive reads), first come first
+served within a priority.  A 429 pauses the whole bucket with jittered
+exponential backoff and the call is retried behind it, so one throttled
+request slows every caller down instead of each retrying on its own.
+
+The priority of a read comes from the context (``set_priority`` at the top
+of a rerun, ``priority()`` around a block); writes are ``CRITICAL``.
+"""
+import contextvars
+import heapq
+import itertools
+import random
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+from mci.sheets import error_status
+from mci.tracing import TRACER
+
+CRITICAL, SUBMIT, VIEW = 0, 1, 2
+PRIORITY_NAMES = {CRITICAL: "critical", SUBMIT: "submit", VIEW: "view"}
+
+READ, WRITE = "read", "write"
+
+_priority: contextvars.ContextVar = contextvars.ContextVar("mci_sheets_priority", default=None)
+
+
+def set_priority(level: int):
+    """Priority of the Sheets calls made from here on in this context (e.g. one rerun)."""
+    return _priority.set(level)
+
+
+@contextmanager
+def priority(level: int) -> Iterator[None]:
+    token = _priority.set(level)
+    try:
+        yield
+    finally:
+        _priority.reset(token)
+
+
+def current_priority(kind: str = READ) -> int:
+    level = _priority.get()
+    if level is None:
+        return CRITICAL if kind == WRITE else SUBMIT
+    return level
+
+
+class QuotaTimeout(TimeoutError):
+    """No token within ``max_wait`` seconds (the quota is saturated by higher priorities)."""
+
+
+class TokenBucket:
+    """``per_minute`` tokens a minute, at most ``burst`` saved up (not thread-safe)."""
+
+    def __init__(self, per_minute: float, burst: float):
+        self.rate = per_minute / 60.0
+        self.capacity = max(1.0, burst)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+
+    def ready_in(self, now: float) -> float:
+        """Seconds until one token is available (0 = now)."""
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        wait = max(0.0, self.paused_until - now)
+        if self.tokens < 1.0:
+            wait = max(wait, (1.0 - self.tokens) / self.rate)
+        return wait
+
+    def take(self):
+        self.tokens -= 1.0
+
+    def pause(self, until: float):
+        """Throttled: nothing goes out before ``until``, and no saved-up burst after it."""
+        self.paused_until = max(self.paused_until, until)
+        self.tokens = 0.0
+        self.updated = max(self.updated, self.paused_until)
+
+
+class QuotaScheduler:
+    def __init__(
+        self,
+        read_per_minute: float = 60.0,
+        write_per_minute: float = 60.0,
+        burst: float = 10.0,
+        max_retries: int = 5,
+        backoff: float = 1.0,
+        max_backoff: float = 32.0,
+        max_wait: float = 60.0,
+    ):
+        self.buckets: Dict[str, TokenBucket] = {
+            READ: TokenBucket(read_per_minute, burst),
+            WRITE: TokenBucket(write_per_minute, burst),
+        }
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.max_wait = max_wait
+        self._cond = threading.Condition()
+        self._waiting: Dict[str, List[Tuple[int, int, float]]] = {READ: [], WRITE: []}
+        self._seq = itertools.count()
+        # stats
+        self.granted = 0
+        self.throttled = 0  # 429s seen
+
+    # ---------- calls ----------
+    def run(self, kind: str, fn: Callable[[], Any], level: Optional[int] = None) -> Any:
+        """``fn()`` once a ``kind`` token is granted; 429 → back the bucket off and retry."""
+        level = current_priority(kind) if level is None else level
+        attempt = 0
+        while True:
+            with TRACER.span(f"quota.wait.{PRIORITY_NAMES.get(level, level)}"):
+                self.acquire(kind, level)
+            try:
+                return fn()
+            except Exception as e:
+                if error_status(e) != 429 or attempt >= self.max_retries:
+                    raise
+                attempt += 1
+                delay = min(self.max_backoff, self.backoff * (2 ** (attempt - 1))) * (0.5 + random.random())
+                with self._cond:
+                    self.throttled += 1
+                    self.buckets[kind].pause(time.monotonic() + delay)
+                    self._cond.notify_all()
+
+    def acquire(self, kind: str, level: int):
+        """Block until this caller is the most urgent waiter of ``kind`` and a token is free."""
+        bucket = self.buckets[kind]
+        queue = self._waiting[kind]
+        started = time.monotonic()
+        deadline = started + self.max_wait
+        ticket = (level, next(self._seq), started)
+        with self._cond:
+            heapq.heappush(queue, ticket)
+            try:
+                while True:
+                    now = time.monotonic()
+                    wait = bucket.ready_in(now) if queue[0] == ticket else deadline - now
+                    if wait <= 0 and queue[0] == ticket:
+                        bucket.take()
+                        heapq.heappop(queue)
+                        self.granted += 1
+                        self._cond.notify_all()  # the next waiter may be served too
+                        return
+                    if now >= deadline:
+                        raise QuotaTimeout(f"no Sheets {kind} quota within {self.max_wait:.0f}s")
+                    self._cond.wait(min(wait, deadline - now))
+            except BaseException:
+                if ticket in queue:
+                    queue.remove(ticket)
+                    heapq.heapify(queue)
+                    self._cond.notify_all()
+                raise
+
+    # ---------- metrics ----------
+    def depth(self, kind: Optional[str] = None) -> int:
+        """Calls waiting for a token (of ``kind``, or all)."""
+        with self._cond:
+            if kind is not None:
+                return len(self._waiting[kind])
+            return sum(len(q) for q in self._waiting.values())
+
+    def oldest_wait(self, kind: Optional[str] = None) -> float:
+        """Seconds the longest-waiting call (of ``kind``, or any) has been queued."""
+        now = time.monotonic()
+        with self._cond:
+            queues = [self._waiting[kind]] if kind is not None else list(self._waiting.values())
+            starts = [t[2] for q in queues for t in q]
+        return now - min(starts) if starts else 0.0
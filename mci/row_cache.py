@@ -0,0 +1,135 @@
+"""Process-wide cache of worksheet rows shared by every session.
+
+The responder on ``edit1`` and the observers on ``view`` of the same patient
+all read the same row on every rerun.  ``RowCache`` keeps the full A–Z row
+per ``(spreadsheet, worksheet, row)`` for ``ttl`` seconds and lets concurrent
+readers of a missing row share one fetch (single flight).
+
+Every write path bumps the row's version (``bump``) before and after the
+write, or stores the row it got back (``put``).  A cached row or an in-flight
+fetch from an older version is never handed out again, so a writer's next
+read always sees its own write.
+"""
+import threading
+import time
+from typing import Any, Callable, Dict, Hashable, Optional
+
+
+class _Entry:
+    __slots__ = ("version", "at", "value")
+
+    def __init__(self, version: int, at: float, value: Any):
+        self.version = version
+        self.at = at
+        self.value = value
+
+
+class _Flight:
+    __slots__ = ("version", "event", "value", "error")
+
+    def __init__(self, version: int):
+        self.version = version
+        self.event = threading.Event()
+        self.value: Any = None
+        self.error: Optional[BaseException] = None
+
+
+class RowCache:
+    def __init__(self, ttl: float = 2.0, max_entries: int = 10000, wait_timeout: float = 30.0):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.wait_timeout = wait_timeout
+        self._lock = threading.Lock()
+        self._entries: Dict[Hashable, _Entry] = {}
+        self._versions: Dict[Hashable, int] = {}
+        self._flights: Dict[Hashable, _Flight] = {}
+        self.hits = 0
+        self.misses = 0
+        self.shared = 0  # readers that waited on another session's fetch
+
+    def get(self, key: Hashable, fetch: Callable[[], Any]) -> Any:
+        """Cached value of ``key``, else ``fetch()`` (once, however many callers are waiting)."""
+        now = time.monotonic()
+        with self._lock:
+            version = self._versions.get(key, 0)
+            entry = self._entries.get(key)
+            if entry is not None and entry.version == version and now - entry.at < self.ttl:
+                self.hits += 1
+                return entry.value
+            flight = self._flights.get(key)
+            leader = flight is None or flight.version != version
+            if leader:
+                flight = self._flights[key] = _Flight(version)
+                self.misses += 1
+            else:
+                self.shared += 1
+
+        if not leader:
+            if not flight.event.wait(self.wait_timeout):
+                raise TimeoutError(f"row fetch for {key!r} did not finish")
+            if flight.error is not None:
+                raise flight.error
+            return flight.value
+
+        try:
+            flight.value = fetch()
+        except BaseException as e:
+            flight.error = e
+            raise
+        finally:
+            with self._lock:
+                if self._flights.get(key) is flight:
+                    del self._flights[key]
+                if flight.error is None and self._versions.get(key, 0) == version:
+                    self._store(key, _Entry(version, time.monotonic(), flight.value))
+            flight.event.set()
+        return flight.value
+
+    def put(self, key: Hashable, value: Any, if_version: Optional[int] = None):
+        """A writer got the row back with its write: new version, cached as is.
+
+        With ``if_version``, another write since then only bumps the version
+        (the returned row might predate it).
+        """
+        with self._lock:
+            version = self._versions.get(key, 0) + 1
+            if if_version is not None and version - 1 != if_version:
+                self._versions[key] = version
+                self._entries.pop(key, None)
+                return
+            self._versions[key] = version
+            self._store(key, _Entry(version, time.monotonic(), value))
+
+    def offer(self, key: Hashable, value: Any, version: int):
+        """Cache a row read elsewhere (bulk read) if nothing wrote it since ``version``."""
+        with self._lock:
+            if self._versions.get(key, 0) == version:
+                self._store(key, _Entry(version, time.monotonic(), value))
+
+    def versions(self) -> Dict[Hashable, int]:
+        with self._lock:
+            return dict(self._versions)
+
+    def bump(self, key: Hashable):
+        """The row was (or is about to be) written: drop it and outdate in-flight fetches."""
+        with self._lock:
+            self._versions[key] = self._versions.get(key, 0) + 1
+            self._entries.pop(key, None)
+
+    def version(self, key: Hashable) -> int:
+        with self._lock:
+            return self._versions.get(key, 0)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def _store(self, key: Hashable, entry: _Entry):
+        self._entries.pop(key, None)
+        self._entries[key] = entry
+        while len(self._entries) > self.max_entries:
+            self._entries.pop(next(iter(self._entries)))
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._entries)
@@ -0,0 +1,171 @@
+"""Per-row lifecycle state shared by every session (and replica).
+
+Whether a patient is treated or already counted dead used to live in each
+browser's ``st.session_state``: a second device, a reloaded tab or another
+replica did not know, redid the GAS and sheet reads and could count the same
+death again.  ``RowStateStore`` holds that state per display row:
+
+- ``get`` — cheap local read, done on every rerun before any remote call
+- ``mark_treated`` — triage submitted
+- ``claim_expiry`` — atomic: True for exactly one caller per timer
+  (``end_epoch``), and never once the row is treated; only that caller
+  counts the death.  A row with no timer (``end_epoch`` 0) is claimed once
+  too, recorded as ``NO_TIMER``
+
+``MemoryRowState`` is shared by the sessions of one process,
+``SQLiteRowState`` by every process on one node (one file, WAL).  For
+several nodes, implement ``RowStateStore`` on a shared service and name it
+as ``[state] backend = "package.module:Class"``.  State is kept per
+``namespace`` (the drill), so a new drill starts unlocked.
+"""
+import importlib
+import threading
+import time
+from typing import Dict, Iterable, NamedTuple, Optional
+
+from mci.storage import SQLiteDB
+
+NO_TIMER = -1  # ``expired_end`` of a row counted dead without a timer (``end_epoch`` 0)
+
+
+class RowState(NamedTuple):
+    treated: bool = False
+    expired_end: int = 0  # end_epoch of the timer whose expiry was counted (0 = none, NO_TIMER)
+    updated_at: float = 0.0
+
+    @property
+    def expired(self) -> bool:
+        return self.expired_end != 0
+
+    @property
+    def locked(self) -> bool:
+        return self.treated or self.expired
+
+
+UNLOCKED = RowState()
+
+
+def _claim_key(end_epoch: int) -> int:
+    return int(end_epoch) if end_epoch and int(end_epoch) > 0 else NO_TIMER
+
+
+class RowStateStore:
+    """Interface (rows are display rows)."""
+
+    name = "base"
+
+    def get(self, row: int) -> RowState:
+        raise NotImplementedError
+
+    def mark_treated(self, row: int):
+        raise NotImplementedError
+
+    def claim_expiry(self, row: int, end_epoch: int) -> bool:
+        """Record that the timer ending at ``end_epoch`` ran out; True only for the first caller."""
+        raise NotImplementedError
+
+    def clear(self, rows: Optional[Iterable[int]] = None):
+        """Forget ``rows`` (default: all), e.g. when their timers are started again."""
+        raise NotImplementedError
+
+
+class MemoryRowState(RowStateStore):
+    name = "memory"
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._rows: Dict[int, RowState] = {}
+
+    def get(self, row: int) -> RowState:
+        with self._lock:
+            return self._rows.get(row, UNLOCKED)
+
+    def mark_treated(self, row: int):
+        with self._lock:
+            self._rows[row] = self._rows.get(row, UNLOCKED)._replace(treated=True, updated_at=time.time())
+
+    def claim_expiry(self, row: int, end_epoch: int) -> bool:
+        end = _claim_key(end_epoch)
+        with self._lock:
+            cur = self._rows.get(row, UNLOCKED)
+            if cur.treated or cur.expired_end == end:
+                return False
+            self._rows[row] = cur._replace(expired_end=end, updated_at=time.time())
+            return True
+
+    def clear(self, rows: Optional[Iterable[int]] = None):
+        with self._lock:
+            if rows is None:
+                self._rows.clear()
+            else:
+                for r in rows:
+                    self._rows.pop(r, None)
+
+
+class SQLiteRowState(RowStateStore):
+    """Table ``row_state(namespace, row, treated, expired_end, updated_at)`` in one local file."""
+
+    name = "sqlite"
+
+    def __init__(self, path: str = "mci_state.sqlite3", namespace: str = "default", timeout: float = 30.0):
+        self.path = path
+        self.namespace = namespace
+        self.timeout = timeout
+        self._db = SQLiteDB(path, timeout)
+        self._exec(lambda c: c.execute(
+            "CREATE TABLE IF NOT EXISTS row_state ("
+            " namespace TEXT NOT NULL, row INTEGER NOT NULL,"
+            " treated INTEGER NOT NULL DEFAULT 0, expired_end INTEGER NOT NULL DEFAULT 0,"
+            " updated_at REAL NOT NULL DEFAULT 0,"
+            " PRIMARY KEY (namespace, row))"
+        ))
+
+    def _exec(self, fn):
+        """Run ``fn(conn)`` inside a transaction."""
+        return self._db.run(fn)
+
+    def get(self, row: int) -> RowState:
+        got = self._exec(lambda c: c.execute(
+            "SELECT treated, expired_end, updated_at FROM row_state WHERE namespace = ? AND row = ?",
+            (self.namespace, row),
+        ).fetchone())
+        return RowState(bool(got[0]), int(got[1]), float(got[2])) if got else UNLOCKED
+
+    def mark_treated(self, row: int):
+        self._exec(lambda c: c.execute(
+            "INSERT INTO row_state (namespace, row, treated, updated_at) VALUES (?, ?, 1, ?)"
+            " ON CONFLICT(namespace, row) DO UPDATE SET treated = 1, updated_at = excluded.updated_at",
+            (self.namespace, row, time.time()),
+        ))
+
+    def claim_expiry(self, row: int, end_epoch: int) -> bool:
+        # one statement: the conditional upsert either changes the row (claimed) or not
+        cur = self._exec(lambda c: c.execute(
+            "INSERT INTO row_state (namespace, row, expired_end, updated_at) VALUES (?, ?, ?, ?)"
+            " ON CONFLICT(namespace, row) DO UPDATE SET"
+            " expired_end = excluded.expired_end, updated_at = excluded.updated_at"
+            " WHERE row_state.treated = 0 AND row_state.expired_end != excluded.expired_end",
+            (self.namespace, row, _claim_key(end_epoch), time.time()),
+        ))
+        return cur.rowcount == 1
+
+    def clear(self, rows: Optional[Iterable[int]] = None):
+        if rows is None:
+            self._exec(lambda c: c.execute("DELETE FROM row_state WHERE namespace = ?", (self.namespace,)))
+            return
+        params = [(self.namespace, r) for r in rows]
+        self._exec(lambda c: c.executemany("DELETE FROM row_state WHERE namespace = ? AND row = ?", params))
+
+
+def open_row_state(backend: str = "memory", path: str = "mci_state.sqlite3",
+                   namespace: str = "default") -> RowStateStore:
+    """``memory`` / ``sqlite`` / ``package.module:Class`` (built with ``namespace=``)."""
+    backend = (backend or "memory").strip()
+    if backend == "memory":
+        return MemoryRowState()
+    if backend == "sqlite":
+        return SQLiteRowState(path, namespace=namespace)
+    if ":" in backend:
+        module, _, attr = backend.partition(":")
+        return getattr(importlib.import_module(module), attr)(namespace=namespace)
+    raise ValueError(f"unknown row state backend {backend!r} (use memory, sqlite or package.module:Class)")
@@ -0,0 +1,125 @@
+"""Declarative layout of the patient worksheet, compiled once.
+
+``SCHEMA`` names the column ranges each page shows (``VIEWS``) and the single
+cells the app reads (``CELLS``); letters are turned into 0-based indices at
+import.  Binding it to a header row (``SCHEMA.bind(headers)``, cached per
+header row) precomputes each view's ``(label, index)`` pairs, so decoding a
+row into a ``PatientRecord`` is one tuple copy and every view after that is a
+straight walk over precomputed indices — no letter arithmetic, slicing or
+dict merging per rerun.
+"""
+from functools import lru_cache
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from mci.sheets import col_letter_to_index, index_to_col_letter
+
+YN = ("Yes", "No")
+
+# view name → column ranges shown together, in order
+VIEWS: Dict[str, Sequence[Tuple[str, str]]] = {
+    "A_K": [("A", "K")],                  # patient info (edit1)
+    "L_Q": [("L", "Q")],                  # treatment Yes/No (edit1 form)
+    "A_C_R_U": [("A", "C"), ("R", "U")],  # edit2
+    "A_C_R_V": [("A", "C"), ("R", "V")],  # view
+}
+
+# single cells by name
+CELLS: Dict[str, str] = {
+    "priority": "V",
+    "deaths": "Z",
+    "timer_origin": "Q",  # sheet timer fallback
+    "timer_t0": "R",
+    "timer_end": "S",
+}
+
+
+class Layout:
+    """``Schema`` bound to one header row (labels for every view)."""
+
+    __slots__ = ("headers", "views", "cells", "letters")
+
+    def __init__(self, schema: "Schema", headers: Tuple[str, ...]):
+        n = len(headers)
+        self.headers = headers
+        # columns past the end of the header row have no label → not shown (as before)
+        self.views: Dict[str, Tuple[Tuple[str, int], ...]] = {
+            name: tuple((headers[i], i) for i in idx if i < n) for name, idx in schema.view_indices.items()
+        }
+        self.cells = schema.cells
+        # label → column letter (first occurrence, like headers.index)
+        self.letters: Dict[str, str] = {}
+        for i, h in enumerate(headers):
+            self.letters.setdefault(h, index_to_col_letter(i + 1))
+
+    def labels(self, view: str) -> List[str]:
+        return [label for label, _ in self.views[view]]
+
+    def record(self, vals: Sequence[str]) -> "PatientRecord":
+        return PatientRecord(self, vals)
+
+
+class Schema:
+    def __init__(self, views: Dict[str, Sequence[Tuple[str, str]]], cells: Dict[str, str]):
+        self.view_indices: Dict[str, Tuple[int, ...]] = {
+            name: tuple(i for a, b in ranges for i in range(col_letter_to_index(a) - 1, col_letter_to_index(b)))
+            for name, ranges in views.items()
+        }
+        self.cells: Dict[str, int] = {name: col_letter_to_index(col) - 1 for name, col in cells.items()}
+        self._bind = lru_cache(maxsize=8)(self._layout)
+
+    def _layout(self, headers: Tuple[str, ...]) -> Layout:
+        return Layout(self, headers)
+
+    def bind(self, headers: Sequence[str]) -> Layout:
+        """Layout for this header row (compiled once per distinct header row)."""
+        return self._bind(tuple(headers))
+
+    def record(self, headers: Sequence[str], vals: Sequence[str]) -> "PatientRecord":
+        return self.bind(headers).record(vals)
+
+
+class PatientRecord:
+    """One decoded row; views are built on first use and kept."""
+
+    __slots__ = ("layout", "vals", "_views")
+
+    def __init__(self, layout: Layout, vals: Sequence[str]):
+        self.layout = layout
+        self.vals = tuple(vals)
+        self._views: Dict[str, Dict[str, str]] = {}
+
+    def cell(self, name: str) -> str:
+        i = self.layout.cells[name]
+        return self.vals[i] if i < len(self.vals) else ""
+
+    def view(self, name: str) -> Dict[str, str]:
+        got = self._views.get(name)
+        if got is None:
+            vals, n = self.vals, len(self.vals)
+            got = self._views[name] = {label: (vals[i] if i < n else "") for label, i in self.layout.views[name]}
+        return got
+
+    def pairs(self, name: str) -> List[Tuple[str, str]]:
+        """``(label, value)`` in column order (duplicate labels kept, unlike ``view``)."""
+        vals, n = self.vals, len(self.vals)
+        return [(label, vals[i] if i < n else "") for label, i in self.layout.views[name]]
+
+    @property
+    def priority(self) -> str:
+        return self.cell("priority")
+
+    @property
+    def treatment_headers(self) -> List[str]:
+        return list(self.view("L_Q"))
+
+    @property
+    def treatment(self) -> List[str]:
+        """L–Q normalised to Yes/No (anything that isn't "yes" counts as No)."""
+        return [v if v in YN else ("Yes" if str(v).strip().lower() == "yes" else "No")
+                for v in self.view("L_Q").values()]
+
+    def letter(self, label: str) -> Optional[str]:
+        return self.layout.letters.get(label)
+
+
+SCHEMA = Schema(VIEWS, CELLS)
@@ -0,0 +1,219 @@
+"""Patients spread over several spreadsheets / worksheets.
+
+One worksheet for the whole drill means one write queue, one Z counter and
+one spreadsheet's write contention for everybody.  ``ShardRouter`` maps a
+patient (``?row=N``) to one of several shards, either by contiguous ranges of
+rows or by a stable hash, and ``ShardedStorage`` is a ``Storage`` over one
+backend per shard (each ``SheetsStorage`` with its own client, row cache,
+write queue and Z counter).  The rest of the app keeps using global row
+numbers — the timer cache, GAS, the expiry scheduler and the event log are
+unchanged — and ``read_all`` stitches every shard back into one table for the
+board and the watcher.
+
+Every shard worksheet has its own header in row 1.  With ``range`` the shard
+covering display rows ``first``–``last`` holds them from row 2 on.  With
+``hash`` each shard holds the patients that hash to it densely from row 2 on,
+in display-row order: a patient's local row is the number of display rows up
+to and including it that hash to the same shard.  That depends on the router
+alone (not on the data), so every replica maps rows the same way, and no
+worksheet has blank gaps to pre-fill or read.  Rows a shard worksheet holds
+beyond what the router gives it are skipped by ``read_all`` (and logged),
+never merged over another shard's patients.
+"""
+import logging
+import threading
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, NamedTuple, Optional, Sequence, Tuple
+
+from mci.storage import COLUMNS, Storage
+
+STRATEGIES = ("range", "hash")
+
+log = logging.getLogger(__name__)
+
+
+class Shard(NamedTuple):
+    name: str
+    first: int = 0  # display rows first–last (range strategy; 0 = open-ended)
+    last: int = 0
+
+
+class ShardRouter:
+    def __init__(self, shards: Sequence[Shard], strategy: str = "range"):
+        if not shards:
+            raise ValueError("at least one shard is needed")
+        if strategy not in STRATEGIES:
+            raise ValueError(f"unknown shard strategy {strategy!r} (use {' / '.join(STRATEGIES)})")
+        self.shards = list(shards)
+        self.strategy = strategy
+        # hash: display rows of each shard in order (its local rows 1, 2, …), built as far as needed
+        self._hash_lock = threading.Lock()
+        self._hash_rows: List[List[int]] = [[] for _ in self.shards]
+        self._hash_local: Dict[int, Tuple[int, int]] = {}
+        if strategy == "range":
+            for s in self.shards:
+                if s.first < 1 or (s.last and s.last < s.first):
+                    raise ValueError(f"shard {s.name!r}: bad row range {s.first}-{s.last}")
+
+    def _hash_shard(self, display_row: int) -> int:
+        return zlib.crc32(str(display_row).encode()) % len(self.shards)
+
+    def _hash_extend(self, upto: int):
+        """Number display rows 1…``upto`` per shard (lock held)."""
+        for r in range(len(self._hash_local) + 1, upto + 1):
+            i = self._hash_shard(r)
+            self._hash_rows[i].append(r)
+            self._hash_local[r] = (i, len(self._hash_rows[i]))
+
+    def route(self, display_row: int) -> Tuple[int, int]:
+        """``(shard index, display row inside that shard)``."""
+        if self.strategy == "hash":
+            if display_row < 1:
+                raise KeyError(f"row {display_row} is in no shard")
+            with self._hash_lock:
+                self._hash_extend(display_row)
+                return self._hash_local[display_row]
+        for i, s in enumerate(self.shards):
+            if display_row >= s.first and (not s.last or display_row <= s.last):
+                return i, display_row - s.first + 1
+        raise KeyError(f"row {display_row} is in no shard")
+
+    def to_global(self, shard: int, local_row: int) -> int:
+        """Inverse of ``route`` for a display row of ``shard``."""
+        if self.strategy == "hash":
+            with self._hash_lock:
+                rows = self._hash_rows[shard]
+                upto = len(self._hash_local)
+                limit = upto + 64 * len(self.shards) * max(1, local_row)  # crc32 spreads rows evenly
+                while len(rows) < local_row and upto < limit:
+                    upto += 256
+                    self._hash_extend(upto)
+                if local_row < 1 or len(rows) < local_row:
+                    raise KeyError(f"shard {shard} has no local row {local_row}")
+                return rows[local_row - 1]
+        s = self.shards[shard]
+        if local_row < 1 or (s.last and local_row > s.last - s.first + 1):
+            raise KeyError(f"shard {s.name!r} has no local row {local_row} (rows {s.first}-{s.last})")
+        return local_row + s.first - 1
+
+    def owns(self, shard: int, display_row: int) -> bool:
+        try:
+            return self.route(display_row)[0] == shard
+        except KeyError:
+            return False
+
+
+class ShardedStorage(Storage):
+    """``Storage`` over one backend per shard; rows in and out are global sheet rows."""
+
+    name = "sharded"
+
+    def __init__(self, router: ShardRouter, stores: Sequence[Storage]):
+        if len(stores) != len(router.shards):
+            raise ValueError("one store per shard")
+        self.router = router
+        self.stores = list(stores)
+        self._pool: Optional[ThreadPoolExecutor] = None
+        self._pool_lock = threading.Lock()
+        self.stray: Dict[str, int] = {}  # shard name → rows past its range in the last read_all
+
+    def _locate(self, row: int) -> Tuple[int, int]:
+        """Shard index and local sheet row of global sheet row ``row`` (row 1 = header of the first shard)."""
+        if row <= 1:
+            return 0, row
+        i, local = self.router.route(row - 1)
+        return i, local + 1
+
+    def locate(self, row: int) -> Tuple[Storage, int]:
+        i, local = self._locate(row)
+        return self.stores[i], local
+
+    def shard_of(self, row: int) -> str:
+        """Shard name of global sheet row ``row``."""
+        return self.router.shards[self._locate(row)[0]].name
+
+    def _map(self, fn, items: List[Any]) -> List[Any]:
+        """``fn`` over ``items`` side by side (one call per shard)."""
+        if len(items) <= 1:
+            return [fn(x) for x in items]
+        with self._pool_lock:
+            if self._pool is None:
+                self._pool = ThreadPoolExecutor(max_workers=len(self.stores), thread_name_prefix="mci-shard")
+        return list(self._pool.map(fn, items))
+
+    # ---------- Storage ----------
+    def headers(self) -> List[str]:
+        return self.stores[0].headers()
+
+    def invalidate_headers(self):
+        for s in self.stores:
+            s.invalidate_headers()
+
+    def read_row(self, row: int, mode: str = "") -> Tuple[List[str], List[str]]:
+        store, local = self.locate(row)
+        return store.read_row(local, mode)
+
+    def read_all(self) -> List[List[str]]:
+        """Every shard read at once and merged into one table in global row order."""
+        parts = self._map(lambda s: s.read_all(), self.stores)
+        if not parts or not parts[0]:
+            return []
+        out: List[List[str]] = [parts[0][0]]
+        stray: Dict[str, int] = {}
+        for i, rows in enumerate(parts):
+            for local_sheet_row, vals in enumerate(rows[1:], start=2):
+                try:
+                    display_row = self.router.to_global(i, local_sheet_row - 1)
+                except KeyError:
+                    if any(vals):
+                        name = self.router.shards[i].name
+                        stray[name] = stray.get(name, 0) + 1
+                    continue
+                while len(out) <= display_row:
+                    out.append([""] * len(COLUMNS))
+                out[display_row] = vals
+        for name, n in stray.items():
+            log.warning("shard %s: %d row(s) past its range skipped", name, n)
+        self.stray = stray
+        return out
+
+    def write_cells(self, row: int, cells: Dict[str, Any]):
+        store, local = self.locate(row)
+        store.write_cells(local, cells)
+
+    def write_many(self, cells: Dict[int, Dict[str, Any]]):
+        """One batch per shard, all shards at once."""
+        per_shard: Dict[int, Dict[int, Dict[str, Any]]] = {}
+        for row, row_cells in cells.items():
+            i, local = self._locate(row)
+            per_shard.setdefault(i, {})[local] = row_cells
+        self._map(lambda item: self.stores[item[0]].write_many(item[1]), list(per_shard.items()))
+
+    def write_row(self, row: int, cells: Dict[str, Any]) -> Tuple[List[str], List[str]]:
+        store, local = self.locate(row)
+        return store.write_row(local, cells)
+
+    def increment_z(self, row: int, event_key: str) -> bool:
+        store, local = self.locate(row)
+        return store.increment_z(local, event_key)
+
+
+def parse_shards(cfg: Dict[str, Any]) -> Tuple[ShardRouter, List[Dict[str, Any]]]:
+    """``[shards]`` secrets → router + one dict per shard (spreadsheet_id, worksheet_name, …)::
+
+        [shards]
+        strategy = "range"          # or "hash"
+        [[shards.sheets]]
+        spreadsheet_id = "…"
+        worksheet_name = "Secondary"
+        rows = [1, 150]             # range only
+    """
+    strategy = str(cfg.get("strategy", "range") or "range").strip().lower()
+    specs = [dict(s) for s in cfg.get("sheets", [])]
+    shards = []
+    for i, spec in enumerate(specs):
+        first, last = (list(spec.get("rows", [])) + [0, 0])[:2]
+        name = str(spec.get("name") or f"{spec.get('worksheet_name', '')}@{str(spec.get('spreadsheet_id', ''))[-6:]}")
+        shards.append(Shard(name or f"shard{i}", int(first or 0), int(last or 0)))
+    return ShardRouter(shards, strategy), specs
@@ -0,0 +1,441 @@
+"""Process-wide Google Sheets client / worksheet handle.
+
+Streamlit re-executes ``streamlit_app.py`` on every interaction, so anything
+built there is thrown away after each rerun.  ``SheetsHandle`` is meant to be
+created once per process (via ``st.cache_resource``) and shared by every
+session: credentials, the authorized gspread client, the pooled HTTP session
+and the worksheet object are built on first use and then reused.
+"""
+import threading
+import time
+from datetime import timezone
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from mci.tracing import TRACER
+
+SCOPES = [
+    "https://www.googleapis.com/auth/spreadsheets",
+    "https://www.googleapis.com/auth/drive",
+]
+
+# HTTP statuses that mean "the handle we hold is no longer good":
+# expired/revoked token, lost permission, or spreadsheet/worksheet gone/renamed.
+STALE_STATUS = (401, 403, 404)
+
+# HTTP statuses worth retrying (quota / transient server errors), Sheets and GAS alike.
+RETRY_STATUS = (429, 500, 502, 503, 504)
+
+LAST_COL = "Z"  # the app only ever uses columns A–Z
+
+# Column ranges each page needs; fetched together with one values_batch_get.
+# Q–S are included for the sheet timer fallback (origin / t0_epoch / end_epoch).
+MODE_RANGES: Dict[str, List[Tuple[str, str]]] = {
+    "edit1": [("A", "S")],              # A–K + L–Q (+ timer)
+    "edit2": [("A", "C"), ("Q", "V")],  # A–C + R–U + V (+ timer)
+    "view":  [("A", "C"), ("Q", "V")],  # A–C + R–V (+ timer)
+    "timer": [("Q", "S")],
+}
+
+
+def col_letter_to_index(letter: str) -> int:
+    letter = letter.upper()
+    result = 0
+    for ch in letter:
+        result = result * 26 + (ord(ch) - ord('A') + 1)
+    return result
+
+
+def index_to_col_letter(idx: int) -> str:
+    letters = ""
+    while idx > 0:
+        idx, rem = divmod(idx - 1, 26)
+        letters = chr(65 + rem) + letters
+    return letters
+
+
+def a1_range(sheet_title: str, rng: str) -> str:
+    """``'Sheet Name'!A1:B2`` (quoted so titles with spaces/quotes work)."""
+    return "'%s'!%s" % (sheet_title.replace("'", "''"), rng)
+
+
+def error_status(exc: BaseException) -> int:
+    """HTTP status of a gspread/requests error (0 if unknown)."""
+    code = getattr(exc, "code", None)
+    if isinstance(code, int):
+        return code
+    resp = getattr(exc, "response", None)
+    status = getattr(resp, "status_code", None)
+    return status if isinstance(status, int) else 0
+
+
+def trim_row(vals: List[str]) -> List[str]:
+    """Copy of ``vals`` without trailing blank cells (how Sheets returns a row)."""
+    vals = list(vals)
+    while vals and vals[-1] == "":
+        vals.pop()
+    return vals
+
+
+def is_stale_error(exc: BaseException) -> bool:
+    if error_status(exc) in STALE_STATUS:
+        return True
+    # google.auth.exceptions.RefreshError (token could not be refreshed)
+    return type(exc).__name__ == "RefreshError"
+
+
+# Remote operations (``SheetsHandle.call`` names its trace span after these).
+def values_batch_get(ws, ranges: List[str]) -> Dict:
+    return ws.spreadsheet.values_batch_get(ranges)
+
+
+def values_batch_update(ws, body: Dict) -> Dict:
+    return ws.spreadsheet.values_batch_update(body=body)
+
+
+def row_values(ws, row: int) -> List[str]:
+    return ws.row_values(row)
+
+
+# counted against the write quota (everything else is a read)
+WRITE_OPS = (values_batch_update,)
+
+
+class SheetsHandle:
+    """Thread-safe, lazily built gspread client + worksheet.
+
+    - credentials are refreshed proactively ``refresh_margin`` seconds before expiry
+    - on an auth / 404 error the whole handle is rebuilt once and the call retried
+    - the underlying ``requests`` session keeps a pool of keep-alive connections
+    """
+
+    def __init__(
+        self,
+        spreadsheet_id: str,
+        worksheet_name: str,
+        service_account_info: Optional[Dict] = None,
+        refresh_margin: int = 300,
+        pool_size: int = 32,
+        header_ttl: float = 600.0,
+        write_latency: float = 0.5,
+        row_cache=None,
+        quota=None,
+    ):
+        self.spreadsheet_id = spreadsheet_id
+        self.worksheet_name = worksheet_name
+        self._info = dict(service_account_info or {})
+        self._refresh_margin = refresh_margin
+        self._pool_size = pool_size
+        self._lock = threading.RLock()
+        self._creds = None
+        self._client = None
+        self._ws = None
+        self.rebuilds = 0
+        self._header_ttl = header_ttl
+        self._headers: Optional[List[str]] = None
+        self._headers_at = 0.0
+        self._write_latency = write_latency
+        self._writer = None
+        self._z_counter = None
+        self.row_cache = row_cache  # mci.row_cache.RowCache shared across sessions (optional)
+        self.quota = quota  # mci.quota.QuotaScheduler (optional)
+
+    # ---------- building ----------
+    def _connect(self):
+        """Build credentials, client and worksheet. Returns (creds, client, ws)."""
+        import gspread
+        from google.oauth2.service_account import Credentials
+        from requests.adapters import HTTPAdapter
+
+        creds = Credentials.from_service_account_info(self._info, scopes=SCOPES)
+        client = gspread.authorize(creds)
+        session = getattr(getattr(client, "http_client", None), "session", None)
+        if session is not None:
+            adapter = HTTPAdapter(pool_connections=4, pool_maxsize=self._pool_size)
+            session.mount("https://", adapter)
+        sh = client.open_by_key(self.spreadsheet_id)
+        ws = sh.worksheet(self.worksheet_name)
+        return creds, client, ws
+
+    def _refresh_if_needed(self):
+        creds = self._creds
+        expiry = getattr(creds, "expiry", None)
+        if creds is None:
+            return
+        if getattr(creds, "token", None) and expiry is not None:
+            # google-auth stores expiry as a naive UTC datetime
+            if expiry.tzinfo is None:
+                expiry = expiry.replace(tzinfo=timezone.utc)
+            remaining = expiry.timestamp() - time.time()
+            if remaining > self._refresh_margin:
+                return
+        from google.auth.transport.requests import Request
+        with TRACER.remote("sheets.refresh_token"):
+            creds.refresh(Request())
+
+    # ---------- public ----------
+    def worksheet(self):
+        """Worksheet object (built on first use, token refreshed when close to expiry)."""
+        with self._lock:
+            if self._ws is None:
+                with TRACER.remote("sheets.open"):
+                    self._creds, self._client, self._ws = self._connect()
+            else:
+                self._refresh_if_needed()
+            return self._ws
+
+    def reset(self):
+        """Drop everything; the next call rebuilds from scratch."""
+        with self._lock:
+            self._creds = None
+            self._client = None
+            self._ws = None
+            self.rebuilds += 1
+        self.invalidate_headers()
+
+    def call(self, fn: Callable[..., Any], *args, **kwargs) -> Any:
+        """``fn(ws, *args, **kwargs)``; rebuild the handle once on auth/404 errors.
+
+        Traced as one remote call named ``sheets.<fn name>``.  With a quota
+        scheduler, every attempt first waits for a read / write token.
+        """
+        name = "sheets." + getattr(fn, "__name__", "call").lstrip("_")
+        try:
+            return self._send(name, fn, self.worksheet(), *args, **kwargs)
+        except Exception as e:
+            if not is_stale_error(e):
+                raise
+            self.reset()
+            return self._send(name, fn, self.worksheet(), *args, **kwargs)
+
+    def _send(self, name: str, fn: Callable[..., Any], ws, *args, **kwargs) -> Any:
+        def send():
+            with TRACER.remote(name):
+                return fn(ws, *args, **kwargs)
+
+        if self.quota is None:
+            return send()
+        return self.quota.run("write" if fn in WRITE_OPS else "read", send)
+
+    # ---------- header row (cached) ----------
+    def cached_headers(self) -> Optional[List[str]]:
+        with self._lock:
+            if self._headers is None:
+                return None
+            if time.monotonic() - self._headers_at > self._header_ttl:
+                self._headers = None
+                return None
+            return self._headers
+
+    def set_headers(self, headers: List[str]):
+        with self._lock:
+            self._headers = list(headers)
+            self._headers_at = time.monotonic()
+
+    def invalidate_headers(self):
+        """Call after the header row was edited (or to force a re-read)."""
+        with self._lock:
+            self._headers = None
+
+    def headers(self) -> List[str]:
+        cached = self.cached_headers()
+        if cached is not None:
+            return cached
+        headers = self.call(row_values, 1)
+        self.set_headers(headers)
+        return headers
+
+    # ---------- reads ----------
+    def row_key(self, row: int) -> Tuple[str, str, int]:
+        return (self.spreadsheet_id, self.worksheet_name, row)
+
+    def read_row(self, row: int, mode: str = "") -> Tuple[List[str], List[str]]:
+        """Header + values of one row; with a row cache, the full A–Z row shared by all sessions."""
+        if self.row_cache is None:
+            return self._fetch_row(row, mode)
+        return self.row_cache.get(self.row_key(row), lambda: self._fetch_row(row, ""))
+
+    def _fetch_row(self, row: int, mode: str = "") -> Tuple[List[str], List[str]]:
+        """Header + values (A–Z, "" where not fetched) of one row in ONE request.
+
+        Only the column ranges listed in ``MODE_RANGES[mode]`` are fetched
+        (unknown mode → whole A–Z).  The header row rides along in the same
+        ``values_batch_get`` when it is not cached yet.
+        """
+        ranges = MODE_RANGES.get(mode, [("A", LAST_COL)])
+        headers = self.cached_headers()
+
+        names = [a1_range(self.worksheet_name, f"{a}{row}:{b}{row}") for a, b in ranges]
+        if headers is None:
+            names.append(a1_range(self.worksheet_name, f"A1:{LAST_COL}1"))
+        res = self.call(values_batch_get, names) or {}
+        value_ranges = res.get("valueRanges", [])
+
+        vals = [""] * col_letter_to_index(LAST_COL)
+        for (a, b), vr in zip(ranges, value_ranges):
+            got = (vr.get("values") or [[]])[0]
+            start = col_letter_to_index(a) - 1
+            width = col_letter_to_index(b) - start
+            for i, v in enumerate(got[:width]):
+                vals[start + i] = v
+
+        if headers is None:
+            hdr = value_ranges[len(ranges)] if len(value_ranges) > len(ranges) else {}
+            headers = list((hdr.get("values") or [[]])[0])
+            self.set_headers(headers)
+        if len(vals) < len(headers):
+            vals = vals + [""] * (len(headers) - len(vals))
+        return headers, vals
+
+    def read_all(self) -> List[List[str]]:
+        """Every row (header first), each padded to A–Z, in one request (open-ended ``A1:Z``).
+
+        With a row cache, the rows also refresh it (those not written meanwhile).
+        """
+        versions = self.row_cache.versions() if self.row_cache is not None else {}
+        res = self.call(values_batch_get, [a1_range(self.worksheet_name, f"A1:{LAST_COL}")]) or {}
+        value_ranges = res.get("valueRanges") or [{}]
+        width = col_letter_to_index(LAST_COL)
+        rows = [list(r[:width]) + [""] * (width - len(r)) for r in (value_ranges[0].get("values") or [])]
+        if rows:
+            headers = trim_row(rows[0])
+            self.set_headers(headers)
+            if self.row_cache is not None:
+                for i, vals in enumerate(rows[1:], start=2):
+                    key = self.row_key(i)
+                    self.row_cache.offer(key, (headers, vals), versions.get(key, 0))
+        return rows
+
+    def read_column(self, col: str, rows: List[int]) -> Dict[int, str]:
+        """``{row: value}`` of one column for many rows in one request."""
+        if not rows:
+            return {}
+        res = self.call(values_batch_get, [a1_range(self.worksheet_name, f"{col}{r}") for r in rows]) or {}
+        out = {}
+        for r, vr in zip(rows, res.get("valueRanges", [])):
+            got = (vr.get("values") or [[""]])[0]
+            out[r] = got[0] if got else ""
+        return out
+
+    # ---------- writes (coalesced across sessions) ----------
+    def writer(self):
+        """The process-wide ``WriteCoalescer`` for this worksheet."""
+        with self._lock:
+            if self._writer is None:
+                from mci.write_queue import WriteCoalescer
+
+                # with a quota scheduler, 429s are already retried (behind the paused bucket) inside each flush
+                retry = [s for s in RETRY_STATUS if s != 429] if self.quota is not None else RETRY_STATUS
+                self._writer = WriteCoalescer(self._batch_update, max_latency=self._write_latency,
+                                              retry_status=retry)
+            return self._writer
+
+    def _batch_update(self, data: List[Dict], include_values: bool = False):
+        body = {"valueInputOption": "RAW", "data": data}
+        if include_values:
+            body["includeValuesInResponse"] = True
+        return self.call(values_batch_update, body)
+
+    def write_timeout(self, timeout: float) -> float:
+        """How long a writer waits for its ticket: never less than a quota wait."""
+        if self.quota is not None:
+            return max(timeout, self.quota.max_wait)
+        return timeout
+
+    def _bump_rows(self, rows):
+        if self.row_cache is not None:
+            for r in rows:
+                self.row_cache.bump(self.row_key(r))
+
+    def _bump_when_done(self, ticket, rows):
+        """Reads cached while the write was queued are outdated once it lands, even after the writer gave up."""
+        if self.row_cache is not None:
+            rows = list(rows)
+            ticket.add_done_callback(lambda _: self._bump_rows(rows))
+
+    def write_cells(self, row: int, cells: Dict[str, Any], wait: bool = True, timeout: float = 30.0):
+        """Queue ``{column letter: value}`` for one row; by default block until committed."""
+        updates = [
+            {"range": a1_range(self.worksheet_name, f"{col}{row}"), "majorDimension": "ROWS", "values": [[v]]}
+            for col, v in cells.items()
+        ]
+        self._bump_rows([row])
+        ticket = self.writer().submit(updates)
+        self._bump_when_done(ticket, [row])
+        if wait:
+            ticket.wait(self.write_timeout(timeout))
+        return ticket
+
+    def write_row(self, row: int, cells: Dict[str, Any], timeout: float = 30.0) -> Tuple[List[str], List[str]]:
+        """Write ``{column letter: value}`` and get the whole row back from the same request.
+
+        The write goes out as one ``A{row}:Z{row}`` range where untouched cells
+        are ``None`` (Sheets leaves null cells as they are) with
+        ``includeValuesInResponse``, so the response carries the row after the
+        write.  Returns ``(headers, values A–Z)`` like ``read_row``.
+        """
+        width = col_letter_to_index(LAST_COL)
+        values: List[Any] = [None] * width
+        for col, v in cells.items():
+            values[col_letter_to_index(col) - 1] = v
+        rng = a1_range(self.worksheet_name, f"A{row}:{LAST_COL}{row}")
+        self._bump_rows([row])
+        version = self.row_cache.version(self.row_key(row)) if self.row_cache is not None else 0
+        ticket = self.writer().submit([{"range": rng, "majorDimension": "ROWS", "values": [values]}],
+                                      want_values=True)
+        try:
+            ticket.wait(self.write_timeout(timeout))
+        except BaseException:
+            self._bump_rows([row])
+            self._bump_when_done(ticket, [row])  # a timed-out write can still commit later
+            raise
+        got = ((ticket.updated.get(rng) or {}).get("values") or [[]])[0]
+        vals = list(got[:width]) + [""] * (width - len(got))
+        headers = self.headers()
+        if len(vals) < len(headers):
+            vals = vals + [""] * (len(headers) - len(vals))
+        if self.row_cache is not None:
+            self.row_cache.put(self.row_key(row), (headers, vals), if_version=version)
+        return headers, vals
+
+    def write_column(self, col: str, values: Dict[int, Any], wait: bool = True, timeout: float = 30.0):
+        """Queue ``{row: value}`` for one column in a single ticket."""
+        updates = [
+            {"range": a1_range(self.worksheet_name, f"{col}{r}"), "majorDimension": "ROWS", "values": [[v]]}
+            for r, v in values.items()
+        ]
+        self._bump_rows(values)
+        ticket = self.writer().submit(updates)
+        self._bump_when_done(ticket, values)
+        if wait:
+            ticket.wait(self.write_timeout(timeout))
+        return ticket
+
+    def write_many(self, cells: Dict[int, Dict[str, Any]], wait: bool = True, timeout: float = 30.0):
+        """Queue ``{row: {column letter: value}}`` for many rows in a single ticket (one batch update)."""
+        updates = [
+            {"range": a1_range(self.worksheet_name, f"{col}{r}"), "majorDimension": "ROWS", "values": [[v]]}
+            for r, row_cells in cells.items() for col, v in row_cells.items()
+        ]
+        self._bump_rows(cells)
+        ticket = self.writer().submit(updates)
+        self._bump_when_done(ticket, cells)
+        if wait:
+            ticket.wait(self.write_timeout(timeout))
+        return ticket
+
+    def z_counter(self):
+        """The process-wide ``ExpiryCounter`` writing column Z of this worksheet."""
+        with self._lock:
+            if self._z_counter is None:
+                from mci.counters import ExpiryCounter
+                from mci.quota import CRITICAL, priority
+
+                def read_totals(rows):
+                    with priority(CRITICAL):  # part of the expiry write
+                        return self.read_column("Z", rows)
+
+                self._z_counter = ExpiryCounter(
+                    read_totals=read_totals,
+                    write_totals=lambda totals: self.write_column("Z", totals),
+                )
+            return self._z_counter
@@ -0,0 +1,281 @@
+"""Storage backends for the patient table.
+
+The app only needs a handful of operations on a table laid out like the
+Secondary worksheet: row 1 is the header, columns A–Z hold one patient per
+row.  ``Storage`` is that interface; ``SheetsStorage`` keeps the Google Sheets
+behaviour and ``SQLiteStorage`` is an indexed local engine with the same
+A–Z layout (large drills where Sheets latency is the bottleneck, and tests).
+"""
+import sqlite3
+import threading
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from mci.sheets import (
+    LAST_COL,
+    MODE_RANGES,
+    SheetsHandle,
+    col_letter_to_index,
+    index_to_col_letter,
+    trim_row,
+)
+
+COLUMNS = [index_to_col_letter(i) for i in range(1, col_letter_to_index(LAST_COL) + 1)]
+
+
+class SQLiteDB:
+    """Connections to one SQLite file: one per thread (WAL mode, so readers never
+    block the writer), or a single shared one for ``":memory:"``, which would
+    otherwise give every thread its own empty database."""
+
+    def __init__(self, path: str, timeout: float = 30.0):
+        self.path = path
+        self.timeout = timeout
+        self._local = threading.local()
+        self._shared: Optional[sqlite3.Connection] = None
+        self._shared_lock = threading.RLock()
+        if path == ":memory:":
+            self._shared = sqlite3.connect(path, timeout=timeout, check_same_thread=False)
+
+    def conn(self) -> sqlite3.Connection:
+        if self._shared is not None:
+            return self._shared
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=self.timeout)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def run(self, fn):
+        """Run ``fn(conn)`` inside a transaction."""
+        conn = self.conn()
+        if self._shared is not None:
+            with self._shared_lock, conn:
+                return fn(conn)
+        with conn:
+            return fn(conn)
+
+
+class Storage:
+    """Interface used by ``mci.patient`` (all rows are 1-based sheet rows)."""
+
+    name = "base"
+
+    def headers(self) -> List[str]:
+        raise NotImplementedError
+
+    def invalidate_headers(self):
+        pass
+
+    def read_row(self, row: int, mode: str = "") -> Tuple[List[str], List[str]]:
+        """(headers, values A–Z) — only the columns of ``MODE_RANGES[mode]`` are guaranteed."""
+        raise NotImplementedError
+
+    def read_all(self) -> List[List[str]]:
+        """Every row from row 1 (header) on, each A–Z — one bulk read for the board."""
+        raise NotImplementedError
+
+    def write_cells(self, row: int, cells: Dict[str, Any]):
+        """Write ``{column letter: value}`` of one row; returns once committed."""
+        raise NotImplementedError
+
+    def write_many(self, cells: Dict[int, Dict[str, Any]]):
+        """``{row: {column letter: value}}`` for many rows, in one batch where the backend can."""
+        for row, row_cells in cells.items():
+            self.write_cells(row, row_cells)
+
+    def write_row(self, row: int, cells: Dict[str, Any]) -> Tuple[List[str], List[str]]:
+        """``write_cells`` and return ``(headers, values A–Z)`` of the row after the write."""
+        self.write_cells(row, cells)
+        return self.read_row(row)
+
+    def increment_z(self, row: int, event_key: str) -> bool:
+        """Count one expiry (column Z); False if ``event_key`` was already counted."""
+        raise NotImplementedError
+
+
+class SheetsStorage(Storage):
+    """Google Sheets through the shared ``SheetsHandle`` (header cache, write queue, Z counter)."""
+
+    name = "sheets"
+
+    def __init__(self, gs: SheetsHandle):
+        self.gs = gs
+
+    def headers(self) -> List[str]:
+        return self.gs.headers()
+
+    def invalidate_headers(self):
+        self.gs.invalidate_headers()
+
+    def read_row(self, row: int, mode: str = "") -> Tuple[List[str], List[str]]:
+        return self.gs.read_row(row, mode)
+
+    def read_all(self) -> List[List[str]]:
+        return self.gs.read_all()
+
+    def write_cells(self, row: int, cells: Dict[str, Any]):
+        self.gs.write_cells(row, cells)
+
+    def write_many(self, cells: Dict[int, Dict[str, Any]]):
+        self.gs.write_many(cells)
+
+    def write_row(self, row: int, cells: Dict[str, Any]) -> Tuple[List[str], List[str]]:
+        return self.gs.write_row(row, cells)  # one round-trip (values come back with the write)
+
+    def increment_z(self, row: int, event_key: str) -> bool:
+        return self.gs.z_counter().add(row, event_key)
+
+
+class SQLiteStorage(Storage):
+    """Local SQLite table ``patients(row PRIMARY KEY, A … Z)``; row 1 = header.
+
+    Values are stored as text, like Sheets' formatted values.
+    """
+
+    name = "sqlite"
+
+    def __init__(self, path: str = "mci.sqlite3", timeout: float = 30.0):
+        self.path = path
+        self.timeout = timeout
+        self._db = SQLiteDB(path, timeout)
+        self._header_lock = threading.Lock()
+        self._headers: Optional[List[str]] = None
+        self._init_schema()
+
+    def _exec(self, fn):
+        """Run ``fn(conn)`` inside a transaction."""
+        return self._db.run(fn)
+
+    def _init_schema(self):
+        cols = ", ".join(f'"{c}" TEXT NOT NULL DEFAULT \'\'' for c in COLUMNS)
+
+        def _create(conn):
+            conn.execute(f"CREATE TABLE IF NOT EXISTS patients (row INTEGER PRIMARY KEY, {cols})")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS z_events ("
+                " row INTEGER NOT NULL, event_key TEXT NOT NULL,"
+                " PRIMARY KEY (row, event_key))"
+            )
+        self._exec(_create)
+
+    # ---------- Storage ----------
+    def headers(self) -> List[str]:
+        with self._header_lock:
+            if self._headers is not None:
+                return self._headers
+        row = self._exec(lambda c: c.execute(
+            "SELECT " + ", ".join(f'"{c}"' for c in COLUMNS) + " FROM patients WHERE row = 1"
+        ).fetchone())
+        headers = trim_row(row) if row else []
+        with self._header_lock:
+            self._headers = headers
+        return headers
+
+    def invalidate_headers(self):
+        with self._header_lock:
+            self._headers = None
+
+    def read_row(self, row: int, mode: str = "") -> Tuple[List[str], List[str]]:
+        ranges = MODE_RANGES.get(mode, [("A", LAST_COL)])
+        cols = [c for a, b in ranges for c in COLUMNS[col_letter_to_index(a) - 1:col_letter_to_index(b)]]
+        got = self._exec(lambda c: c.execute(
+            "SELECT " + ", ".join(f'"{x}"' for x in cols) + " FROM patients WHERE row = ?", (row,)
+        ).fetchone())
+        vals = [""] * len(COLUMNS)
+        if got:
+            for col, v in zip(cols, got):
+                vals[col_letter_to_index(col) - 1] = v
+        headers = self.headers()
+        if len(vals) < len(headers):
+            vals = vals + [""] * (len(headers) - len(vals))
+        return headers, vals
+
+    def read_all(self) -> List[List[str]]:
+        got = self._exec(lambda c: c.execute(
+            "SELECT row, " + ", ".join(f'"{x}"' for x in COLUMNS) + " FROM patients WHERE row >= 1 ORDER BY row"
+        ).fetchall())
+        rows: List[List[str]] = []
+        for r in got:
+            while len(rows) < r[0] - 1:  # rows never written → blank, like Sheets
+                rows.append([""] * len(COLUMNS))
+            rows.append([v or "" for v in r[1:]])
+        return rows
+
+    def write_cells(self, row: int, cells: Dict[str, Any]):
+        if not cells:
+            return
+        sql = _upsert_sql(cells)
+        values = [_text(v) for v in cells.values()]
+        self._exec(lambda c: c.execute(sql, [row] + values))
+        if row == 1:
+            self.invalidate_headers()
+
+    def write_many(self, cells: Dict[int, Dict[str, Any]]):
+        """All rows in one transaction."""
+        items = [(row, row_cells) for row, row_cells in cells.items() if row_cells]
+        if not items:
+            return
+
+        def _write(conn):
+            for row, row_cells in items:
+                conn.execute(_upsert_sql(row_cells), [row] + [_text(v) for v in row_cells.values()])
+        self._exec(_write)
+        if any(row == 1 for row, _ in items):
+            self.invalidate_headers()
+
+    def increment_z(self, row: int, event_key: str) -> bool:
+        def _inc(conn):
+            cur = conn.execute(
+                "INSERT OR IGNORE INTO z_events (row, event_key) VALUES (?, ?)", (row, event_key)
+            )
+            if cur.rowcount == 0:
+                return False
+            conn.execute("INSERT OR IGNORE INTO patients (row) VALUES (?)", (row,))
+            conn.execute(
+                "UPDATE patients SET \"Z\" = CAST(CAST(COALESCE(NULLIF(\"Z\", ''), '0') AS REAL) AS INTEGER) + 1"
+                " WHERE row = ?",
+                (row,),
+            )
+            return True
+        return self._exec(_inc)
+
+    # ---------- bulk ----------
+    def load_rows(self, rows: Iterable[List[Any]], start_row: int = 1):
+        """Replace the table with ``rows`` (e.g. a Sheets ``get_all_values()`` export)."""
+        n = len(COLUMNS)
+        data = []
+        for i, r in enumerate(rows, start=start_row):
+            vals = [_text(v) for v in list(r)[:n]]
+            data.append([i] + vals + [""] * (n - len(vals)))
+        sql = "INSERT INTO patients VALUES (?" + ", ?" * n + ")"
+
+        def _load(conn):
+            conn.execute("DELETE FROM patients")
+            conn.executemany(sql, data)
+        self._exec(_load)
+        self.invalidate_headers()
+
+    def is_empty(self) -> bool:
+        return self._exec(lambda c: c.execute("SELECT 1 FROM patients LIMIT 1").fetchone()) is None
+
+
+def _upsert_sql(cells: Dict[str, Any]) -> str:
+    cols = [_column(c) for c in cells]
+    return (
+        "INSERT INTO patients (row, " + ", ".join(f'"{c}"' for c in cols) + ") "
+        "VALUES (?" + ", ?" * len(cols) + ") "
+        "ON CONFLICT(row) DO UPDATE SET " + ", ".join(f'"{c}" = excluded."{c}"' for c in cols)
+    )
+
+
+def _column(letter: str) -> str:
+    col = str(letter).upper()
+    if col not in COLUMNS:
+        raise ValueError(f"column {letter!r} is outside A–{LAST_COL}")
+    return col
+
+
+def _text(value: Any) -> str:
+    return "" if value is None else str(value)
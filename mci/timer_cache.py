@@ -0,0 +1,85 @@
+"""Process-wide cache of started patient timers.
+
+Once a timer has started, ``t0_epoch`` / ``end_epoch`` / ``timer_seconds``
+do not change until ``stop_timer``, so only the first visit to a row needs
+the GAS round-trip.  Entries live until the timer is stopped
+(``invalidate``) or runs out (``get`` drops it ``grace`` seconds after
+``end_epoch``).  Rows GAS reported as not started are remembered for
+``unstarted_ttl`` seconds, so the board does not ask about them every refresh.
+"""
+import threading
+import time
+from typing import Dict, NamedTuple, Optional, Set
+
+
+class TimerState(NamedTuple):
+    origin_seconds: int
+    t0_epoch: int
+    end_epoch: int
+
+
+class TimerCache:
+    def __init__(self, grace: float = 0.0, unstarted_ttl: float = 60.0):
+        self.grace = grace
+        self.unstarted_ttl = unstarted_ttl
+        self._lock = threading.Lock()
+        self._timers: Dict[int, TimerState] = {}
+        self._unstarted: Dict[int, float] = {}  # row → when GAS said "not started"
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, row: int, now: Optional[float] = None) -> Optional[TimerState]:
+        now = time.time() if now is None else now
+        with self._lock:
+            state = self._timers.get(row)
+            if state is not None and now >= state.end_epoch + self.grace:
+                del self._timers[row]  # expired → the expiry path takes over
+                state = None
+            if state is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+            return state
+
+    def put(self, row: int, origin_seconds: int, t0_epoch: int, end_epoch: int):
+        """Remember a *started* timer (ignored when ``end_epoch`` is not set)."""
+        if end_epoch <= 0:
+            return
+        with self._lock:
+            self._timers[row] = TimerState(int(origin_seconds), int(t0_epoch), int(end_epoch))
+            self._unstarted.pop(row, None)
+
+    def mark_unstarted(self, row: int, now: Optional[float] = None):
+        with self._lock:
+            self._unstarted[row] = time.time() if now is None else now
+
+    def unstarted(self, now: Optional[float] = None) -> Set[int]:
+        """Rows reported not started less than ``unstarted_ttl`` seconds ago."""
+        now = time.time() if now is None else now
+        with self._lock:
+            for row in [r for r, at in self._unstarted.items() if now - at >= self.unstarted_ttl]:
+                del self._unstarted[row]
+            return set(self._unstarted)
+
+    def snapshot(self) -> Dict[int, TimerState]:
+        """Copy of every cached timer (the board overlays these on the sheet)."""
+        with self._lock:
+            return dict(self._timers)
+
+    def invalidate(self, row: int):
+        with self._lock:
+            self._timers.pop(row, None)
+            self._unstarted.pop(row, None)
+
+    def clear(self):
+        with self._lock:
+            self._timers.clear()
+            self._unstarted.clear()
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._timers)
+
+
+# keyed by display row (the ``?row=N`` the participant opened)
+TIMERS = TimerCache()
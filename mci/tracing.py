@@ -0,0 +1,316 @@
+"""Per-rerun tracing and process metrics.
+
+Every remote call (Sheets, GAS) and every script phase is recorded as a span.
+Spans started while a rerun trace is active (``TRACER.begin()`` at the top of
+the script) are attached to it, so a rerun knows which calls it made and how
+long each took; every span also feeds process-wide histograms that can be
+exported as Prometheus text or JSON.  Work done on a shared thread for several
+reruns (a coalesced write batch) is ``collect``-ed there and ``attribute``-d to
+each rerun waiting for it.
+"""
+import contextvars
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Callable, Deque, Dict, Iterator, List, Optional, Tuple
+
+# seconds
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+CALL_BUCKETS = (0, 1, 2, 3, 4, 6, 8, 12, 16)
+
+
+class Span:
+    __slots__ = ("name", "remote", "start", "duration", "error")
+
+    def __init__(self, name: str, remote: bool, start: float):
+        self.name = name
+        self.remote = remote
+        self.start = start
+        self.duration = 0.0
+        self.error = ""
+
+    def as_dict(self, origin: float = 0.0) -> Dict:
+        return {
+            "name": self.name,
+            "remote": self.remote,
+            "start_ms": round((self.start - origin) * 1000, 1),
+            "ms": round(self.duration * 1000, 1),
+            "error": self.error,
+        }
+
+
+class Trace:
+    """Spans of one script run."""
+
+    def __init__(self, name: str):
+        self.name = name
+        self.start = time.perf_counter()
+        self.wall = time.time()
+        self.duration = 0.0
+        self.spans: List[Span] = []
+        self.finished = False
+        self.interrupted = False
+        self._lock = threading.Lock()
+
+    def add(self, span: Span):
+        with self._lock:
+            self.spans.append(span)
+
+    @property
+    def remote_calls(self) -> int:
+        return sum(1 for s in self.spans if s.remote)
+
+    def as_dict(self) -> Dict:
+        return {
+            "name": self.name,
+            "at": self.wall,
+            "ms": round(self.duration * 1000, 1),
+            "remote_calls": self.remote_calls,
+            "interrupted": self.interrupted,
+            "spans": [s.as_dict(self.start) for s in self.spans],
+        }
+
+
+class Histogram:
+    __slots__ = ("buckets", "counts", "count", "sum", "errors")
+
+    def __init__(self, buckets: Tuple[float, ...]):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.count = 0
+        self.sum = 0.0
+        self.errors = 0
+
+    def observe(self, value: float, error: bool = False):
+        self.count += 1
+        self.sum += value
+        if error:
+            self.errors += 1
+        for i, b in enumerate(self.buckets):
+            if value <= b:
+                self.counts[i] += 1
+
+
+_current: contextvars.ContextVar = contextvars.ContextVar("mci_trace", default=None)
+
+
+class Tracer:
+    def __init__(self, keep: int = 50):
+        self._lock = threading.Lock()
+        self.spans: Dict[str, Histogram] = {}
+        self.reruns: Dict[str, Histogram] = {}
+        self.rerun_calls: Dict[str, Histogram] = {}
+        self.recent: Deque[Trace] = deque(maxlen=keep)
+        self._gauges: Dict[Tuple[str, Tuple[Tuple[str, str], ...]], Callable[[], float]] = {}
+        self.started = time.time()
+
+    # ---------- reruns ----------
+    def begin(self, name: str) -> Trace:
+        """Start the trace of a script run (closes a previous one cut short by st.stop/st.rerun)."""
+        prev = _current.get()
+        if prev is not None and not prev.finished:
+            prev.interrupted = True
+            self.end(prev)
+        trace = Trace(name)
+        _current.set(trace)
+        return trace
+
+    def end(self, trace: Optional[Trace] = None):
+        trace = trace or _current.get()
+        if trace is None or trace.finished:
+            return
+        trace.finished = True
+        trace.duration = time.perf_counter() - trace.start
+        with self._lock:
+            self.reruns.setdefault(trace.name, Histogram(BUCKETS)).observe(trace.duration)
+            self.rerun_calls.setdefault(trace.name, Histogram(CALL_BUCKETS)).observe(trace.remote_calls)
+            self.recent.append(trace)
+
+    def current(self) -> Optional[Trace]:
+        return _current.get()
+
+    # ---------- spans ----------
+    def open_span(self, name: str, remote: bool = False) -> Span:
+        """Start a span by hand (for script sections that can't sit in a ``with``)."""
+        return Span(name, remote, time.perf_counter())
+
+    def close_span(self, sp: Span, error: str = ""):
+        sp.duration = time.perf_counter() - sp.start
+        sp.error = sp.error or error
+        trace = _current.get()
+        if trace is not None and not trace.finished:
+            trace.add(sp)
+        with self._lock:
+            self.spans.setdefault(sp.name, Histogram(BUCKETS)).observe(sp.duration, bool(sp.error))
+
+    @contextmanager
+    def span(self, name: str, remote: bool = False) -> Iterator[Span]:
+        sp = self.open_span(name, remote)
+        error = ""
+        try:
+            yield sp
+        except Exception as e:
+            error = type(e).__name__
+            raise
+        finally:
+            self.close_span(sp, error)
+
+    def remote(self, name: str):
+        """Span for one network round-trip (counted in the rerun's remote calls)."""
+        return self.span(name, remote=True)
+
+    # ---------- work done for other reruns ----------
+    @contextmanager
+    def collect(self, name: str = "shared") -> Iterator[Trace]:
+        """Record the spans of the block in a scratch trace (e.g. a write batch flushed on its own thread)."""
+        trace = Trace(name)
+        token = _current.set(trace)
+        try:
+            yield trace
+        finally:
+            _current.reset(token)
+
+    def attribute(self, spans: List[Span], traces):
+        """Add ``spans`` to every rerun in ``traces`` still running (histograms already have them)."""
+        seen = set()
+        for trace in traces:
+            if trace is None or trace.finished or id(trace) in seen:
+                continue
+            seen.add(id(trace))
+            for sp in spans:
+                trace.add(sp)
+
+    # ---------- gauges ----------
+    def gauge(self, name: str, fn: Callable[[], float], **labels: str):
+        """Register a value read at export time (queue depth, cache size, …)."""
+        key = (name, tuple(sorted((k, str(v)) for k, v in labels.items())))
+        with self._lock:
+            self._gauges[key] = fn
+
+    def _gauge_values(self) -> List[Tuple[str, Dict[str, str], float]]:
+        with self._lock:
+            items = list(self._gauges.items())
+        out = []
+        for (name, labels), fn in items:
+            try:
+                out.append((name, dict(labels), float(fn())))
+            except Exception:
+                continue
+        return out
+
+    # ---------- export ----------
+    def snapshot(self) -> Dict:
+        with self._lock:
+            spans = {k: _hist_dict(h) for k, h in self.spans.items()}
+            reruns = {k: _hist_dict(h) for k, h in self.reruns.items()}
+            calls = {k: _hist_dict(h) for k, h in self.rerun_calls.items()}
+            recent = [t.as_dict() for t in self.recent]
+        return {
+            "uptime_s": round(time.time() - self.started, 1),
+            "spans": spans,
+            "reruns": reruns,
+            "rerun_remote_calls": calls,
+            "gauges": [{"name": n, "labels": l, "value": v} for n, l, v in self._gauge_values()],
+            "recent": recent,
+        }
+
+    def prometheus_text(self) -> str:
+        lines: List[str] = []
+        with self._lock:
+            spans = list(self.spans.items())
+            reruns = list(self.reruns.items())
+            calls = list(self.rerun_calls.items())
+        _prom_hist(lines, "mci_span_seconds", "Duration of remote calls and script phases.", "name", spans)
+        lines.append("# HELP mci_span_errors_total Spans that raised.")
+        lines.append("# TYPE mci_span_errors_total counter")
+        for name, h in spans:
+            lines.append('mci_span_errors_total{name="%s"} %d' % (_esc(name), h.errors))
+        _prom_hist(lines, "mci_rerun_seconds", "Duration of a script run.", "mode", reruns)
+        _prom_hist(lines, "mci_rerun_remote_calls", "Remote calls made by a script run.", "mode", calls)
+        seen = set()
+        for name, labels, value in self._gauge_values():
+            if name not in seen:
+                lines.append(f"# TYPE {name} gauge")
+                seen.add(name)
+            lab = ",".join('%s="%s"' % (k, _esc(v)) for k, v in sorted(labels.items()))
+            lines.append(f"{name}{{{lab}}} {value:g}" if lab else f"{name} {value:g}")
+        return "\n".join(lines) + "\n"
+
+
+def _hist_dict(h: Histogram) -> Dict:
+    return {
+        "count": h.count,
+        "errors": h.errors,
+        "sum": round(h.sum, 4),
+        "avg": round(h.sum / h.count, 4) if h.count else 0.0,
+        "buckets": dict(zip([str(b) for b in h.buckets], h.counts)),
+    }
+
+
+def _prom_hist(lines: List[str], metric: str, help_: str, label: str, items):
+    lines.append(f"# HELP {metric} {help_}")
+    lines.append(f"# TYPE {metric} histogram")
+    for key, h in items:
+        k = _esc(key)
+        for b, c in zip(h.buckets, h.counts):
+            lines.append('%s_bucket{%s="%s",le="%g"} %d' % (metric, label, k, b, c))
+        lines.append('%s_bucket{%s="%s",le="+Inf"} %d' % (metric, label, k, h.count))
+        lines.append('%s_sum{%s="%s"} %.6f' % (metric, label, k, h.sum))
+        lines.append('%s_count{%s="%s"} %d' % (metric, label, k, h.count))
+
+
+def _esc(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+# one tracer per process
+TRACER = Tracer()
+
+
+def serve_metrics(port: int, host: str = "0.0.0.0", tracer: Tracer = TRACER, token: str = ""):
+    """Expose ``/metrics`` (Prometheus text) and ``/metrics.json`` on a side port.
+
+    With ``token`` set, requests need ``Authorization: Bearer <token>`` (or
+    ``?token=``); anything else gets 401.
+    """
+    import hmac
+    import json
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+    from urllib.parse import parse_qs, urlsplit
+
+    def authorized(handler: BaseHTTPRequestHandler) -> bool:
+        if not token:
+            return True
+        auth = handler.headers.get("Authorization", "")
+        given = auth[7:] if auth.startswith("Bearer ") else \
+            (parse_qs(urlsplit(handler.path).query).get("token") or [""])[0]
+        return hmac.compare_digest(given, token)
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if not authorized(self):
+                self.send_error(401)
+                return
+            if self.path.startswith("/metrics.json"):
+                body = json.dumps(tracer.snapshot()).encode()
+                ctype = "application/json"
+            elif self.path.startswith("/metrics"):
+                body = tracer.prometheus_text().encode()
+                ctype = "text/plain; version=0.0.4"
+            else:
+                self.send_error(404)
+                return
+            self.send_response(200)
+            self.send_header("Content-Type", ctype)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="mci-metrics", daemon=True).start()
+    return server
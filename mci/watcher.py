@@ -0,0 +1,143 @@
+"""One background poller per process that keeps every row fresh for ``view``.
+
+Observers on ``?mode=view`` used to see a patient's priority only when they
+clicked.  Polling per browser would multiply Sheets reads by the number of
+viewers; instead ``SheetWatcher`` reads the whole worksheet in one request
+every ``interval`` seconds, diffs it against the previous snapshot and bumps
+a per-row version for rows that changed.  Sessions re-render from the
+snapshot (``row()``) in an ``st.fragment`` — no Sheets call per viewer.  On
+the Sheets backend the bulk read also refreshes the shared row cache.
+
+The thread runs only while some page holds a lease: each view / board
+session calls ``lease(key)`` on every refresh, and once no lease has been
+renewed for ``idle_timeout`` seconds the thread stops (the next lease starts
+it again).
+"""
+import threading
+import time
+from typing import Dict, List, Optional, Set, Tuple
+
+from mci.quota import VIEW, set_priority
+from mci.sheets import trim_row
+from mci.storage import Storage
+from mci.tracing import TRACER
+
+
+class SheetWatcher:
+    def __init__(self, store: Storage, interval: float = 5.0, max_backoff: float = 60.0,
+                 idle_timeout: float = 60.0):
+        self.store = store
+        self.interval = interval
+        self.max_backoff = max_backoff
+        self.idle_timeout = idle_timeout
+        self._lock = threading.Lock()
+        self._rows: List[List[str]] = []
+        self._versions: Dict[int, int] = {}  # sheet row → bumped on every change
+        self._leases: Dict[str, float] = {}  # session → last renewal
+        self._thread: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+        self.last_poll = 0.0
+        self.polls = 0
+        self.errors = 0
+
+    # ---------- readers ----------
+    def headers(self) -> List[str]:
+        with self._lock:
+            return trim_row(self._rows[0]) if self._rows else []
+
+    def rows(self) -> List[List[str]]:
+        """Last snapshot (header first), as ``Storage.read_all`` returns it."""
+        with self._lock:
+            return list(self._rows)
+
+    def row(self, sheet_row: int) -> Optional[Tuple[List[str], List[str]]]:
+        """``(headers, values)`` of one row from the last snapshot, None before the first poll."""
+        with self._lock:
+            if not self._rows:
+                return None
+            vals = self._rows[sheet_row - 1] if sheet_row - 1 < len(self._rows) else []
+            return trim_row(self._rows[0]), vals
+
+    def version(self, sheet_row: int) -> int:
+        with self._lock:
+            return self._versions.get(sheet_row, 0)
+
+    def age(self) -> float:
+        """Seconds since the last successful poll started."""
+        return time.time() - self.last_poll if self.last_poll else float("inf")
+
+    # ---------- polling ----------
+    def poll(self) -> Set[int]:
+        """Read everything once; returns the sheet rows that changed."""
+        started = time.time()
+        with TRACER.span("watcher.poll"):
+            rows = self.store.read_all()
+        changed = set()
+        with self._lock:
+            old = self._rows
+            for i in range(max(len(rows), len(old))):
+                new_vals = rows[i] if i < len(rows) else None
+                if new_vals != (old[i] if i < len(old) else None):
+                    changed.add(i + 1)
+                    self._versions[i + 1] = self._versions.get(i + 1, 0) + 1
+            self._rows = rows
+            self.last_poll = started  # data is at least this fresh
+            self.polls += 1
+        return changed
+
+    def lease(self, key: str) -> "SheetWatcher":
+        """Session ``key`` still shows live rows: keep polling (start if stopped)."""
+        with self._lock:
+            self._leases[key] = time.time()
+            if self._thread is None:
+                self._stop = threading.Event()  # one per thread: a stopping thread never sees it cleared
+                self._thread = threading.Thread(target=self._run, args=(self._stop,), name="mci-watcher",
+                                                daemon=True)
+                self._thread.start()
+        return self
+
+    def release(self, key: str):
+        with self._lock:
+            self._leases.pop(key, None)
+
+    def watching(self) -> int:
+        """Sessions holding a lease."""
+        with self._lock:
+            return len(self._leases)
+
+    def running(self) -> bool:
+        with self._lock:
+            return self._thread is not None
+
+    def stop(self):
+        """Stop polling now, whatever the leases."""
+        with self._lock:
+            self._leases.clear()
+            self._stop.set()
+
+    def _idle(self) -> bool:
+        """Drop stale leases; True (and the thread is gone) when none is left (lock held)."""
+        now = time.time()
+        self._leases = {k: t for k, t in self._leases.items() if now - t < self.idle_timeout}
+        if self._leases:
+            return False
+        self._thread = None
+        return True
+
+    def _run(self, stop: threading.Event):
+        set_priority(VIEW)  # background refresh yields to submits and writes
+        delay = self.interval
+        while not stop.is_set():
+            try:
+                self.poll()
+                delay = self.interval
+            except Exception:
+                self.errors += 1
+                delay = min(self.max_backoff, delay * 2)  # quota / outage: poll less, not more
+            with self._lock:
+                if stop.is_set() or self._idle():
+                    break
+            stop.wait(delay)
+        with self._lock:
+            if self._stop is stop:
+                self._thread = None
@@ -0,0 +1,227 @@
+"""Process-wide write coalescer for Sheets cell updates.
+
+Every session used to send its own ``values_batch_update`` / ``update_acell``.
+With many participants submitting at once that burns the per-minute write
+quota.  Sessions now ``submit()`` their cell writes here; a single background
+thread merges everything pending (from all sessions) into one multi-range
+``values_batch_update`` at most ``max_latency`` seconds after the oldest write
+arrived, and each caller gets a ``WriteTicket`` that tells it when its write
+is committed (or why it failed).  A write can ask for the written ranges back
+(``want_values``); the batch then asks Sheets to include the updated values in
+its response and each ticket gets the ranges it wrote (``ticket.updated``).
+"""
+import random
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+from mci.sheets import RETRY_STATUS, error_status
+from mci.tracing import TRACER
+
+
+class WriteTicket:
+    """Handle returned by ``WriteCoalescer.submit``."""
+
+    __slots__ = ("_done", "_callbacks", "_lock", "error", "committed_at", "response", "ranges", "updated",
+                 "trace")
+
+    def __init__(self, ranges: Optional[List[str]] = None):
+        self._done = threading.Event()
+        self._callbacks: List[Callable[["WriteTicket"], Any]] = []
+        self._lock = threading.Lock()
+        self.error: Optional[BaseException] = None
+        self.committed_at: Optional[float] = None
+        self.response: Any = None
+        self.ranges: List[str] = ranges or []
+        self.updated: Dict[str, Dict] = {}  # range → updatedData (want_values only)
+        self.trace = TRACER.current()  # the submitting rerun: the batch's remote calls are counted there
+
+    @property
+    def done(self) -> bool:
+        return self._done.is_set()
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        """Block until flushed. Raises the flush error, or ``TimeoutError``."""
+        if not self._done.wait(timeout):
+            raise TimeoutError("write still queued after %.1fs (it may be committed later)" % (timeout or 0))
+        if self.error is not None:
+            raise self.error
+        return True
+
+    def add_done_callback(self, fn: Callable[["WriteTicket"], Any]):
+        """``fn(ticket)`` once the batch is committed or failed (now, if it already is)."""
+        with self._lock:
+            if not self._done.is_set():
+                self._callbacks.append(fn)
+                return
+        fn(self)
+
+    def _finish(self, response: Any = None, error: Optional[BaseException] = None):
+        self.response = response
+        self.error = error
+        self.committed_at = time.time()
+        with self._lock:
+            self._done.set()
+            callbacks, self._callbacks = self._callbacks, []
+        for fn in callbacks:
+            try:
+                fn(self)
+            except Exception:
+                pass
+
+
+class WriteCoalescer:
+    """Merge cell writes from all sessions into periodic batch updates.
+
+    ``flush`` receives the merged ``data`` list of a ``values_batch_update``
+    body (``[{"range": ..., "majorDimension": "ROWS", "values": [[...]]}]``),
+    plus ``include_values=True`` when some ticket wants the values back.
+    Writes to the same range merge cell by cell: the later value wins and
+    ``None`` ("leave as is") keeps the earlier one.  A failed batch is retried
+    on ``retry_status`` (leave 429 out when a quota scheduler already backs
+    off on it, or every 429 is retried twice over).
+    """
+
+    def __init__(
+        self,
+        flush: Callable[[List[Dict]], Any],
+        max_latency: float = 0.5,
+        max_ranges: int = 500,
+        max_retries: int = 5,
+        backoff: float = 1.0,
+        retry_status=RETRY_STATUS,
+    ):
+        self._flush = flush
+        self.max_latency = max_latency
+        self.max_ranges = max_ranges
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.retry_status = tuple(retry_status)
+        self._cond = threading.Condition()
+        self._pending: Dict[str, Dict] = {}
+        self._tickets: List[WriteTicket] = []
+        self._want_values = False
+        self._oldest = 0.0
+        self._thread: Optional[threading.Thread] = None
+        self._closed = False
+        # stats
+        self.flushes = 0
+        self.ranges_written = 0
+        self.writes_submitted = 0
+
+    # ---------- producer side ----------
+    def submit(self, updates: List[Dict], want_values: bool = False) -> WriteTicket:
+        ticket = WriteTicket([u["range"] for u in updates])
+        if not updates:
+            ticket._finish()
+            return ticket
+        with self._cond:
+            if self._closed:
+                raise RuntimeError("write queue is closed")
+            if not self._pending:
+                self._oldest = time.monotonic()
+            for u in updates:
+                prev = self._pending.pop(u["range"], None)  # keep order of the latest write
+                self._pending[u["range"]] = {
+                    "range": u["range"],
+                    "majorDimension": u.get("majorDimension", "ROWS"),
+                    "values": _merge_values(prev["values"], u["values"]) if prev else u["values"],
+                }
+            self._want_values = self._want_values or want_values
+            self._tickets.append(ticket)
+            self.writes_submitted += 1
+            self._ensure_thread()
+            self._cond.notify_all()
+        return ticket
+
+    def write(self, updates: List[Dict], timeout: Optional[float] = 30.0) -> WriteTicket:
+        """``submit`` and wait until committed."""
+        ticket = self.submit(updates)
+        ticket.wait(timeout)
+        return ticket
+
+    def pending(self) -> int:
+        with self._cond:
+            return len(self._pending)
+
+    # ---------- flusher ----------
+    def _ensure_thread(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._run, name="sheets-write-queue", daemon=True)
+            self._thread.start()
+
+    def _take_batch(self):
+        with self._cond:
+            while not self._pending and not self._closed:
+                self._cond.wait()
+            if not self._pending:
+                return None, None, False
+            while not self._closed and len(self._pending) < self.max_ranges:
+                left = self._oldest + self.max_latency - time.monotonic()
+                if left <= 0:
+                    break
+                self._cond.wait(left)
+            data = list(self._pending.values())
+            tickets = self._tickets
+            want_values = self._want_values
+            self._pending = {}
+            self._tickets = []
+            self._want_values = False
+            return data, tickets, want_values
+
+    def _run(self):
+        while True:
+            data, tickets, want_values = self._take_batch()
+            if data is None:
+                return
+            with TRACER.collect("sheets.write_queue") as batch:
+                try:
+                    response = self._flush_with_retry(data, want_values)
+                except Exception as e:
+                    error = e
+                else:
+                    error = None
+            TRACER.attribute(batch.spans, [t.trace for t in tickets])
+            if error is not None:
+                for t in tickets:
+                    t._finish(error=error)
+                continue
+            self.flushes += 1
+            self.ranges_written += len(data)
+            if want_values:
+                index = {d["range"]: i for i, d in enumerate(data)}
+                responses = (response or {}).get("responses") or []
+                for t in tickets:
+                    t.updated = {
+                        r: responses[index[r]].get("updatedData") or {}
+                        for r in t.ranges if index[r] < len(responses)
+                    }
+            for t in tickets:
+                t._finish(response=response)
+
+    def _flush_with_retry(self, data: List[Dict], want_values: bool = False) -> Any:
+        attempt = 0
+        while True:
+            try:
+                return self._flush(data, include_values=True) if want_values else self._flush(data)
+            except Exception as e:
+                attempt += 1
+                if error_status(e) not in self.retry_status or attempt > self.max_retries:
+                    raise
+                delay = self.backoff * (2 ** (attempt - 1))
+                time.sleep(delay * (0.5 + random.random()))
+
+    def close(self, timeout: float = 5.0):
+        """Flush what is pending and stop the background thread."""
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+
+def _merge_values(old: List[List[Any]], new: List[List[Any]]) -> List[List[Any]]:
+    """Cell-wise merge of two writes to the same range (``None`` in ``new`` keeps ``old``)."""
+    if len(old) != len(new) or any(len(a) != len(b) for a, b in zip(old, new)):
+        return new
+    return [[o if n is None else n for o, n in zip(ro, rn)] for ro, rn in zip(old, new)]
@@ -1,11 +1,39 @@
+import hmac
+import html
 import json
-from typing import Dict, List, Tuple
+import os
+import time
+import uuid
+from typing import Dict, Iterable, List, Optional, Tuple
 
-import pandas as pd
 import streamlit as st
-import gspread
-from google.oauth2.service_account import Credentials
-import requests  # ใช้เรียก GAS (Primary timer)
+import streamlit.components.v1 as components
+
+import mci
+from mci.events import EVENTS, EventLog
+from mci.expiry import ExpiryScheduler
+from mci.gas import GasClient
+from mci.patient import (
+    ALLOWED_V,
+    build_payloads_from_row,
+    gas_timers,
+    get_header_and_row,
+    payloads_from_values,
+    prepare_page,
+    start_incident,
+    stop_timer,
+    update_LQ,
+    update_V,
+)
+from mci.quota import SUBMIT, VIEW, QuotaScheduler, set_priority
+from mci.row_cache import RowCache
+from mci.row_state import RowStateStore, open_row_state
+from mci.shards import ShardedStorage, ShardRouter, parse_shards
+from mci.sheets import SheetsHandle
+from mci.storage import SheetsStorage, SQLiteStorage, Storage
+from mci.timer_cache import TIMERS, TimerState
+from mci.tracing import TRACER, serve_metrics
+from mci.watcher import SheetWatcher
 
 st.set_page_config(page_title="Patient Dashboard", page_icon="🩺", layout="centered")
 
@@ -15,10 +43,9 @@ st.set_page_config(page_title="Patient Dashboard", page_icon="🩺", layout="cen
 SPREADSHEET_ID = (st.secrets.get("gsheets", {}).get("spreadsheet_id", "") or "").strip()
 WORKSHEET_NAME = st.secrets.get("gsheets", {}).get("worksheet_name", "Secondary")
 
-SCOPES = [
-    "https://www.googleapis.com/auth/spreadsheets",
-    "https://www.googleapis.com/auth/drive",
-]
+# backend: "sheets" (ค่าเริ่มต้น) หรือ "sqlite" (ไฟล์ในเครื่อง สำหรับซ้อมใหญ่ที่ Sheets ช้า)
+STORAGE_CFG = st.secrets.get("storage", {})
+STORAGE_BACKEND = (STORAGE_CFG.get("backend", "sheets") or "sheets").strip().lower()
 
 # =========================
 # Session flags (timer / expiry / treated)
@@ -33,42 +60,129 @@ if "treated" not in st.session_state:
     st.session_state["treated"] = False  # ผู้ป่วยได้รับการรักษาแล้ว
 
 # =========================
-# Helpers: Google Sheets client
+# Helpers: Google Sheets client (1 ตัวต่อ process ใช้ร่วมทุก session)
 # =========================
-def get_gs_client():
-    if "gcp_service_account" not in st.secrets:
-        st.error("Missing [gcp_service_account] in secrets.toml")
+def service_account_info(section: str = "gcp_service_account") -> Dict:
+    if section not in st.secrets:
+        st.error(f"Missing [{section}] in secrets.toml")
         st.stop()
-    info = dict(st.secrets["gcp_service_account"])
+    info = dict(st.secrets[section])
     pk = info.get("private_key", "")
     if pk and ("\\n" in pk) and ("\n" not in pk):
         info["private_key"] = pk.replace("\\n", "\n")
     if "BEGIN PRIVATE KEY" not in info.get("private_key", ""):
         st.error("Invalid private_key format in secrets.toml")
         st.stop()
-    try:
-        creds = Credentials.from_service_account_info(info, scopes=SCOPES)
-    except Exception as e:
-        st.error(f"Failed to build credentials: {e}")
-        st.stop()
-    return gspread.authorize(creds)
+    return info
+
+@st.cache_resource(show_spinner=False)
+def get_row_cache(ttl: float, spreadsheet_id: str, worksheet_name: str) -> RowCache:
+    """แถวที่อ่านแล้วใช้ร่วมทุก session (1 ตัวต่อ worksheet/shard; key = spreadsheet, worksheet, row)"""
+    rows = RowCache(ttl=ttl)
+    TRACER.gauge("mci_row_cache_size", lambda: len(rows), spreadsheet=spreadsheet_id, worksheet=worksheet_name)
+    return rows
+
+@st.cache_resource(show_spinner=False)
+def get_quota(account: str, read_per_minute: float, write_per_minute: float, burst: float) -> QuotaScheduler:
+    """โควตา Sheets ต่อ service account: เขียน (triage/expiry) ก่อน → อ่านตอน submit → อ่านของหน้า view"""
+    quota = QuotaScheduler(read_per_minute, write_per_minute, burst=burst)
+    for kind in ("read", "write"):
+        TRACER.gauge("mci_sheets_queue_depth", lambda k=kind: quota.depth(k), kind=kind, account=account)
+        TRACER.gauge("mci_sheets_queue_wait_seconds", lambda k=kind: quota.oldest_wait(k), kind=kind,
+                     account=account)
+    TRACER.gauge("mci_sheets_throttled", lambda: quota.throttled, account=account)
+    return quota
+
+def open_quota(account: str) -> Optional[QuotaScheduler]:
+    cfg = st.secrets.get("quota", {})
+    reads = float(cfg.get("read_per_minute", 60))  # 0 = ไม่จำกัด (ไม่ผ่าน scheduler)
+    if reads <= 0:
+        return None
+    return get_quota(account, reads, float(cfg.get("write_per_minute", 60)), float(cfg.get("burst", 10)))
+
+@st.cache_resource(show_spinner=False)
+def get_sheets_handle(spreadsheet_id: str, worksheet_name: str, _info: Dict,
+                      account: str = "gcp_service_account") -> SheetsHandle:
+    """1 ตัวต่อ (spreadsheet, worksheet): client, row cache, write queue และตัวนับ Z ของตัวเอง"""
+    cfg = st.secrets.get("gsheets", {})
+    row_ttl = float(cfg.get("row_ttl", 2.0))  # 0 = ไม่ cache แถว
+    gs = SheetsHandle(
+        spreadsheet_id, worksheet_name, service_account_info=_info,
+        write_latency=float(cfg.get("write_latency", 0.5)),  # รวม write ของทุก session ทุกๆ ~0.5s
+        row_cache=get_row_cache(row_ttl, spreadsheet_id, worksheet_name) if row_ttl > 0 else None,
+        quota=open_quota(account),
+    )
+    TRACER.gauge("mci_write_queue_pending", lambda: gs.writer().pending(),
+                 spreadsheet=spreadsheet_id, worksheet=worksheet_name)
+    TRACER.gauge("mci_z_pending", lambda: gs.z_counter().pending(),
+                 spreadsheet=spreadsheet_id, worksheet=worksheet_name)
+    return gs
 
-def open_ws():
+def open_gs() -> SheetsHandle:
     if not SPREADSHEET_ID:
         st.error("Missing [gsheets].spreadsheet_id in secrets.toml")
         st.stop()
-    gc = get_gs_client()
+    return get_sheets_handle(SPREADSHEET_ID, WORKSHEET_NAME, service_account_info())
+
+def open_ws(gs: SheetsHandle):
+    import gspread  # เฉพาะ backend sheets (ไม่โหลดตอน start ถ้าใช้ sqlite)
     try:
-        sh = gc.open_by_key(SPREADSHEET_ID)
+        return gs.worksheet()
+    except gspread.exceptions.WorksheetNotFound as e:
+        st.error(f"หา worksheet ชื่อ '{gs.worksheet_name}' ไม่เจอ: {e}")
+        st.stop()
+    except (ValueError, KeyError) as e:
+        st.error(f"Failed to build credentials: {e}")
+        st.stop()
     except Exception as e:
         st.error("เปิดสเปรดชีตไม่สำเร็จ (ตรวจสิทธิ์/Spreadsheet ID):\n" + str(e))
         st.stop()
+
+@st.cache_resource(show_spinner=False)
+def get_sqlite_storage(path: str) -> SQLiteStorage:
+    return SQLiteStorage(path)
+
+def open_storage() -> Storage:
+    if STORAGE_BACKEND == "sqlite":
+        store = get_sqlite_storage(STORAGE_CFG.get("sqlite_path", "mci.sqlite3"))
+        if STORAGE_CFG.get("seed_from_sheets", False) and store.is_empty():
+            # ครั้งแรก: คัดลอกทั้งชีตมาไว้ใน SQLite
+            ws = open_ws(open_gs())
+            store.load_rows(ws.get_all_values())
+        return store
+    if STORAGE_BACKEND != "sheets":
+        st.error(f"Unknown [storage].backend '{STORAGE_BACKEND}' (ใช้ 'sheets' หรือ 'sqlite')")
+        st.stop()
+    if SHARDS_CFG.get("sheets"):
+        return open_sharded_storage()
+    gs = open_gs()
+    open_ws(gs)  # build ครั้งแรก + แสดง error ที่อ่านง่ายถ้าเปิดไม่ได้
+    return SheetsStorage(gs)
+
+# [shards]: แบ่งคนไข้ไปหลาย spreadsheet/worksheet ตามช่วงแถวหรือ hash (ไม่มี = ชีตเดียวเหมือนเดิม)
+SHARDS_CFG = st.secrets.get("shards", {})
+
+@st.cache_resource(show_spinner=False)
+def get_sharded_storage(_router: ShardRouter, _stores: Tuple[Storage, ...], key: str) -> ShardedStorage:
+    return ShardedStorage(_router, _stores)
+
+def open_sharded_storage() -> ShardedStorage:
     try:
-        ws = sh.worksheet(WORKSHEET_NAME)
-    except Exception as e:
-        st.error(f"หา worksheet ชื่อ '{WORKSHEET_NAME}' ไม่เจอ: {e}")
+        router, specs = parse_shards(SHARDS_CFG)
+    except (ValueError, TypeError) as e:
+        st.error(f"[shards] ไม่ถูกต้อง: {e}")
         st.stop()
-    return ws
+    stores = []
+    for spec in specs:
+        account = str(spec.get("account", "gcp_service_account"))  # แยก account = แยกโควตา
+        gs = get_sheets_handle(str(spec.get("spreadsheet_id", "")).strip(),
+                               str(spec.get("worksheet_name", WORKSHEET_NAME)),
+                               service_account_info(account), account)
+        open_ws(gs)
+        stores.append(SheetsStorage(gs))
+    key = json.dumps([router.strategy] + [list(s) for s in router.shards] +
+                     [[g.gs.spreadsheet_id, g.gs.worksheet_name] for g in stores])
+    return get_sharded_storage(router, tuple(stores), key)
 
 # =========================
 # Query params (row / mode)
@@ -89,7 +203,8 @@ def set_query_params(**kwargs):
 
 qp = get_query_params()
 display_row_str = qp.get("row", "1")
-mode = qp.get("mode", "edit1")  # "edit1" A–K + L–Q, "edit2" R–U + V, "view" A–C + R–V
+mode = qp.get("mode", "edit1")  # "edit1" A–K + L–Q, "edit2" R–U + V, "view" A–C + R–V, "board" ทุกแถว, "admin" เริ่มเหตุการณ์
+set_priority(VIEW if mode in ("view", "board") else SUBMIT)  # ลำดับคิวอ่าน Sheets ของ rerun นี้
 
 try:
     display_row = int(display_row_str)
@@ -100,341 +215,138 @@ except ValueError:
 
 sheet_row = display_row + 1  # header อยู่บรรทัด 1
 
-# =========================
-# Utility: column helpers
-# =========================
-def col_letter_to_index(letter: str) -> int:
-    letter = letter.upper()
-    result = 0
-    for ch in letter:
-        result = result * 26 + (ord(ch) - ord('A') + 1)
-    return result
-
-def index_to_col_letter(idx: int) -> str:
-    letters = ""
-    while idx > 0:
-        idx, rem = divmod(idx - 1, 26)
-        letters = chr(65 + rem) + letters
-    return letters
-
-# =========================
-# Data access (rows / updates)
-# =========================
-def get_header_and_row(ws, row: int) -> Tuple[List[str], List[str]]:
-    headers = ws.row_values(1)
-    vals = ws.row_values(row)
-    if len(vals) < len(headers):
-        vals = vals + [""] * (len(headers) - len(vals))
-    return headers, vals
-
-def slice_dict_by_cols(headers: List[str], vals: List[str], start_col: str, end_col: str) -> Dict[str, str]:
-    s = col_letter_to_index(start_col) - 1
-    e = col_letter_to_index(end_col) - 1
-    out = {}
-    for i in range(s, e + 1):
-        if i < len(headers):
-            out[headers[i]] = vals[i] if i < len(vals) else ""
-    return out
-
-ALLOWED_V = ["Priority 1", "Priority 2", "Priority 3"]
-YN = ["Yes", "No"]
-
-def build_payloads_from_row(ws, sheet_row: int, mode: str) -> Dict:
-    headers, vals = get_header_and_row(ws, sheet_row)
-
-    AK = slice_dict_by_cols(headers, vals, "A", "K")
-    LQ_dict = slice_dict_by_cols(headers, vals, "L", "Q")
-    headers_LQ = list(LQ_dict.keys())
-    current_LQ = [LQ_dict[h] if LQ_dict[h] in YN else ("Yes" if str(LQ_dict[h]).strip().lower() == "yes" else "No") for h in headers_LQ]
-
-    RU = slice_dict_by_cols(headers, vals, "R", "U")
-
-    Vcol_idx = col_letter_to_index("V") - 1
-    current_V = vals[Vcol_idx] if Vcol_idx < len(vals) else ""
-
-    AC = slice_dict_by_cols(headers, vals, "A", "C")
-    A_C_R_U = {**AC, **RU}
-    RV = slice_dict_by_cols(headers, vals, "R", "V")
-    A_C_R_V = {**AC, **RV}
-
-    data = {"status": "ok"}
-    if mode == "edit1":
-        data["A_K"] = AK
-        data["headers_LQ"] = headers_LQ
-        data["current_LQ"] = current_LQ
-    if mode == "edit2":
-        data["A_C_R_U"] = A_C_R_U
-        data["current_V"] = current_V
-    if mode == "view":
-        data["A_C_R_V"] = A_C_R_V
-    return data
-
-def update_LQ(ws, sheet_row: int, lq_values: Dict[str, str]) -> Dict:
-    headers = ws.row_values(1)
-    updates = []
-    for h, v in lq_values.items():
-        if h in headers:
-            col_idx = headers.index(h) + 1  # 1-based
-            a1 = f"{ws.title}!{index_to_col_letter(col_idx)}{sheet_row}"
-            updates.append({"range": a1, "majorDimension": "ROWS", "values": [[v]]})
-    if updates:
-        ws.spreadsheet.values_batch_update(body={"valueInputOption": "RAW", "data": updates})
-    data_next = build_payloads_from_row(ws, sheet_row, mode="edit2")
-    return {"status": "ok", "next": data_next}
-
-def update_V(ws, sheet_row: int, v_value: str) -> Dict:
-    V_idx = col_letter_to_index("V")
-    a1 = f"{index_to_col_letter(V_idx)}{sheet_row}"
-    ws.update_acell(a1, v_value)
-    headers, vals = get_header_and_row(ws, sheet_row)
-    AC = slice_dict_by_cols(headers, vals, "A", "C")
-    RV = slice_dict_by_cols(headers, vals, "R", "V")
-    return {"status": "ok", "final": {"A_C_R_V": {**AC, **RV}}}
-
-def increment_Z(ws, sheet_row: int) -> int:
-    """Z = Z + 1"""
-    Z_idx = col_letter_to_index("Z")
-    a1 = f"{index_to_col_letter(Z_idx)}{sheet_row}"
-    try:
-        cur = ws.acell(a1).value
-    except Exception:
-        cur = ""
-    try:
-        base = int(float(cur))
-    except Exception:
-        base = 0
-    new_val = base + 1
-    ws.update_acell(a1, new_val)
-    return new_val
-
 # =========================
 # Card UI
 # =========================
 st.markdown("""
 <style>
+.kv-grid{display:grid;grid-template-columns:repeat(var(--kv-cols,2),minmax(0,1fr));column-gap:1rem;}
 .kv-card{border:1px solid #e5e7eb;padding:12px;border-radius:14px;margin-bottom:10px;box-shadow:0 1px 4px rgba(0,0,0,0.06);background:#fff;}
 .kv-label{font-size:0.9rem;color:#6b7280;margin-bottom:2px;}
 .kv-value{font-size:1.05rem;font-weight:600;word-break:break-word;}
 @media (max-width: 640px){
+  .kv-grid{grid-template-columns:minmax(0,1fr);}
   .kv-card{padding:12px;}
   .kv-value{font-size:1.06rem;}
 }
 </style>
 """, unsafe_allow_html=True)
 
-def _pairs_from_row(df_one_row: pd.DataFrame) -> List[Tuple[str, str]]:
-    s = df_one_row.iloc[0]
-    pairs: List[Tuple[str, str]] = []
-    for col in df_one_row.columns:
-        val = s[col]
-        if pd.isna(val):
-            val = ""
-        pairs.append((str(col), str(val)))
-    return pairs
-
-def render_kv_grid(df_one_row: pd.DataFrame, title: str = "", cols: int = 2):
-    if title:
-        st.subheader(title)
-    items = _pairs_from_row(df_one_row)
-    n = len(items)
-    for i in range(0, n, cols):
-        row_items = items[i:i+cols]
-        col_objs = st.columns(len(row_items))
-        for c, (label, value) in zip(col_objs, row_items):
-            with c:
-                st.markdown(
-                    f"""
-                    <div class="kv-card">
-                      <div class="kv-label">{label}</div>
-                      <div class="kv-value">{value if value!='' else '-'}</div>
-                    </div>
-                    """,
-                    unsafe_allow_html=True
-                )
+def kv_grid_html(items: Iterable[Tuple[str, str]], title: str = "", cols: int = 2) -> str:
+    """การ์ด label/value ทั้งชุดเป็น markdown ก้อนเดียว (CSS grid; จอเล็กเหลือ 1 คอลัมน์)"""
+    cards = "".join(
+        f'<div class="kv-card"><div class="kv-label">{html.escape(str(label))}</div>'
+        f'<div class="kv-value">{html.escape(str(value)) if str(value) != "" else "-"}</div></div>'
+        for label, value in items
+    )
+    head = f"### {title}\n\n" if title else ""
+    return f'{head}<div class="kv-grid" style="--kv-cols:{int(cols)}">{cards}</div>'
+
+def render_kv_grid(items: Iterable[Tuple[str, str]], title: str = "", cols: int = 2):
+    """การ์ด label/value ทั้งชุดใน st.markdown ครั้งเดียว"""
+    st.markdown(kv_grid_html(items, title, cols), unsafe_allow_html=True)
 
 # =========================
 # GAS helpers (Primary timer)
 # =========================
-def gas_get_row(row: int) -> dict:
-    url = st.secrets.get("gas", {}).get("webapp_url", "")
-    if not url:
-        return {}
-    params = {"action": "get", "row": str(row)}
-    tok = st.secrets.get("gas", {}).get("token", "")
-    if tok:
-        params["token"] = tok
-    r = requests.get(url, params=params, timeout=20)
-    try:
-        r.raise_for_status()
-    except Exception as e:
-        st.error(f"GAS HTTP error: {e}\nResponse: {r.text}")
-        raise
-    return r.json()
-
-def gas_start_timer(row: int) -> dict:
-    url = st.secrets.get("gas", {}).get("webapp_url", "")
-    if not url:
-        return {}
-    data = {"action": "start_timer", "row": str(row)}
-    tok = st.secrets.get("gas", {}).get("token", "")
-    if tok:
-        data["token"] = tok
-    r = requests.post(url, data=data, timeout=20)
-    r.raise_for_status()
-    return r.json()
+@st.cache_resource(show_spinner=False)
+def get_gas_client(url: str, token: str, connect_timeout: float, read_timeout: float, retries: int) -> GasClient:
+    gas = GasClient(url, token, connect_timeout=connect_timeout, read_timeout=read_timeout, retries=retries)
+    TRACER.gauge("mci_gas_circuit_open", lambda: gas.breaker.state != "closed")
+    TRACER.gauge("mci_timer_cache_size", lambda: len(TIMERS))
+    return gas
+
+def get_gas() -> GasClient:
+    cfg = st.secrets.get("gas", {})
+    return get_gas_client(
+        cfg.get("webapp_url", ""), cfg.get("token", ""),
+        float(cfg.get("connect_timeout", 3.05)),  # ต่อไม่ติดใน ~3s → ไปใช้ timer จากชีตแทน
+        float(cfg.get("read_timeout", 8.0)),
+        int(cfg.get("retries", 2)),
+    )
 
 def gas_stop_timer(row: int) -> dict:
-    """หยุดที่ต้นทาง (ถ้ามี endpoint stop_timer); ถ้าไม่มีจะไม่ error"""
-    url = st.secrets.get("gas", {}).get("webapp_url", "")
-    if not url:
-        return {}
-    data = {"action": "stop_timer", "row": str(row)}
-    tok = st.secrets.get("gas", {}).get("token", "")
-    if tok:
-        data["token"] = tok
-    r = requests.post(url, data=data, timeout=20)
-    try:
-        r.raise_for_status()
-        return r.json()
-    except Exception:
-        return {"status": "noop"}
+    """รักษาแล้ว: ล็อกแถวให้ทุก session + หยุดที่ต้นทาง (ถ้ามี endpoint stop_timer); ถ้าไม่มีจะไม่ error"""
+    ROW_STATE.mark_treated(row)
+    if EXPIRY is not None:
+        EXPIRY.cancel(row)  # รักษาแล้ว → scheduler ไม่ต้องนับตาย
+    return stop_timer(get_gas(), row, timers=TIMERS)
 
 # =========================
-# Timer helpers (fallback อ่านจาก Secondary ถ้าไม่มี GAS)
+# Event log (ประวัติการกระทำ สำหรับสรุปหลังซ้อม; ไม่ต้องอ่านชีต)
 # =========================
-def parse_seconds(value) -> int:
-    """รองรับ: 120, '02:00', '00:01:30', และ numeric day-fraction"""
-    try:
-        if value is None or value == "":
-            return 0
-        if hasattr(value, "hour") and hasattr(value, "minute") and hasattr(value, "second"):
-            return max(0, int(value.hour) * 3600 + int(value.minute) * 60 + int(value.second))
-        if isinstance(value, (int, float)):
-            if 0 < float(value) < 2:
-                return max(0, int(round(float(value) * 86400)))
-            return max(0, int(round(float(value))))
-        s = str(value).strip()
-        if not s:
-            return 0
-        if s.isdigit() or (s.startswith("-") and s[1:].isdigit()):
-            return max(0, int(s))
-        parts = s.split(":")
-        if len(parts) == 2 and parts[0].isdigit() and parts[1].isdigit():
-            return max(0, int(parts[0]) * 60 + int(parts[1]))
-        if len(parts) == 3 and all(p.isdigit() for p in parts):
-            return max(0, int(parts[0]) * 3600 + int(parts[1]) * 60 + int(parts[2]))
-    except Exception:
-        pass
-    return 0
+EVENTS_CFG = st.secrets.get("events", {})
 
-def read_timer_state(ws, sheet_row: int) -> dict:
-    headers, vals = get_header_and_row(ws, sheet_row)
-    q_idx = col_letter_to_index("Q") - 1
-    r_idx = col_letter_to_index("R") - 1
-    s_idx = col_letter_to_index("S") - 1
+@st.cache_resource(show_spinner=False)
+def open_event_log(directory: str, drill_id: str, rotate_mb: float) -> EventLog:
+    return EVENTS.configure(directory, drill_id, rotate_bytes=int(rotate_mb * (1 << 20)))
 
-    origin_raw = vals[q_idx] if q_idx < len(vals) else ""
-    t0_raw     = vals[r_idx] if r_idx < len(vals) else ""
-    end_raw    = vals[s_idx] if s_idx < len(vals) else ""
+open_event_log(
+    str(EVENTS_CFG.get("dir", "events")),  # "" = ปิด
+    str(EVENTS_CFG.get("drill_id", "default")),
+    float(EVENTS_CFG.get("rotate_mb", 8)),
+)
 
-    origin = parse_seconds(origin_raw)
-    try:
-        t0_epoch = int(float(t0_raw)) if str(t0_raw).strip() != "" else 0
-    except Exception:
-        t0_epoch = 0
-    try:
-        end_epoch = int(float(end_raw)) if str(end_raw).strip() != "" else 0
-    except Exception:
-        end_epoch = 0
-
-    return {"origin": origin, "t0_epoch": t0_epoch, "end_epoch": end_epoch}
-
-def start_timer_if_needed(ws, sheet_row: int, origin: int, t0_epoch: int, end_epoch: int) -> Tuple[int, int]:
-    if origin <= 0:
-        return t0_epoch, end_epoch
-    if t0_epoch > 0 and end_epoch > 0:
-        return t0_epoch, end_epoch
-
-    now = int(pd.Timestamp.utcnow().timestamp())
-    t0 = now if t0_epoch <= 0 else t0_epoch
-    end_ = t0 + origin if end_epoch <= 0 else end_epoch
-
-    r_a1 = f"{index_to_col_letter(col_letter_to_index('R'))}{sheet_row}"
-    s_a1 = f"{index_to_col_letter(col_letter_to_index('S'))}{sheet_row}"
-    ws.spreadsheet.values_batch_update(body={
-        "valueInputOption": "RAW",
-        "data": [
-            {"range": f"{ws.title}!{r_a1}", "majorDimension": "ROWS", "values": [[t0]]},
-            {"range": f"{ws.title}!{s_a1}", "majorDimension": "ROWS", "values": [[end_]]},
-        ]
-    })
-    return t0, end_
-
-def render_countdown(origin_seconds: int, remaining: int, paused: bool = False):
-    """โชว์นับถอยหลัง; เมื่อถึง 0 → ซ่อนและ reload หน้า (ทั้งแอป), paused=True → ไม่วาดอะไร (ซ่อน)"""
-    import streamlit.components.v1 as components
-    if paused:
-        return
+# =========================
+# Row state (รักษาแล้ว/นับตายแล้ว ของแต่ละแถว ใช้ร่วมทุก session/replica แทน session_state อย่างเดียว)
+# =========================
+STATE_CFG = st.secrets.get("state", {})
 
-    def _fmt(secs: int) -> str:
-        secs = max(0, int(secs))
-        h, rem = divmod(secs, 3600)
-        m, s = divmod(rem, 60)
-        return f"{h:02d}:{m:02d}:{s:02d}"
+@st.cache_resource(show_spinner=False)
+def get_row_state(backend: str, path: str, namespace: str) -> RowStateStore:
+    return open_row_state(backend, path, namespace)
 
-    initial_digits = _fmt(remaining)
-    progress_value = max(0, (origin_seconds - remaining) if origin_seconds else 0)
-    progress_max = max(1, origin_seconds if origin_seconds > 0 else 1)
+try:
+    # memory = ใช้ร่วมใน process นี้, sqlite = ทุก process ในเครื่องเดียว, "pkg.module:Class" = หลายเครื่อง
+    ROW_STATE = get_row_state(
+        str(STATE_CFG.get("backend", "memory")),
+        str(STATE_CFG.get("path", "mci_state.sqlite3")),
+        str(EVENTS_CFG.get("drill_id", "default")),  # แยกตาม drill → ซ้อมรอบใหม่เริ่มแบบไม่ล็อก
+    )
+except Exception as e:
+    st.error(f"เปิด [state] ไม่สำเร็จ: {e}")
+    st.stop()
 
-    components.html(
-        f"""
-        <div id="timerWrap" style="border:1px dashed #94a3b8;padding:12px;border-radius:12px;background:#f8fafc">
-          <span style="font-size:1.5rem;background:#e2e8f0;border-radius:999px;padding:4px 10px;color:#334155;margin-right:10px">⏳ คนไข้กำลังจะเสียชีวิตใน</span>
-          <span id="digits" style="font-weight:600;letter-spacing:1px;line-height:1;font-size:1.5rem">{initial_digits}</span>
-          <div style="margin-top:10px">
-            <progress id="pg" max="{progress_max}" value="{progress_value}" style="width:100%"></progress>
-          </div>
-        </div>
-        <script>
-          (function() {{
-            let remaining = {remaining};
-            const origin = {origin_seconds};
-            const digits = document.getElementById('digits');
-            const pg = document.getElementById('pg');
-            const wrap = document.getElementById('timerWrap');
-            function fmt(n) {{ return String(n).padStart(2,'0'); }}
-            function render() {{
-              let s = Math.max(0, Math.floor(remaining));
-              let h = Math.floor(s/3600);
-              let m = Math.floor((s%3600)/60);
-              let ss = s%60;
-              if (digits) digits.textContent = `${{fmt(h)}}:${{fmt(m)}}:${{fmt(ss)}}`;
-              if (origin > 0 && pg) {{
-                pg.max = origin;
-                pg.value = Math.min(origin, Math.max(0, origin - s));
-              }}
-            }}
-            function hardReloadParent() {{
-              try {{ window.parent.postMessage({{is_streamlit_message: true, type: "streamlit:rerun"}}, "*"); }} catch (e) {{}}
-              try {{ (window.parent || window.top || window).location.reload(); }} catch (e) {{}}
-            }}
-            render();
-            const intv = setInterval(() => {{
-              remaining -= 1;
-              if (remaining <= 0) {{
-                remaining = 0;
-                render();
-                clearInterval(intv);
-                if (wrap) wrap.style.display = 'none';
-                setTimeout(hardReloadParent, 50);
-                return;
-              }}
-              render();
-            }}, 1000);
-          }})();
-        </script>
-        """,
-        height=160,
+# =========================
+# Expiry scheduler (หมดเวลาฝั่ง server, ทีละ batch)
+# =========================
+EXPIRY_CFG = st.secrets.get("expiry", {})
+
+@st.cache_resource(show_spinner=False)
+def get_expiry_scheduler(backend: str, lock_col: str, batch_window: float, _store: Storage,
+                         _gas: GasClient, _row_state: RowStateStore) -> ExpiryScheduler:
+    sched = ExpiryScheduler(_store, gas=_gas, timers=TIMERS, lock_col=lock_col, batch_window=batch_window,
+                            row_state=_row_state)
+    TRACER.gauge("mci_expiry_pending", sched.pending)
+    return sched
+
+def open_expiry(store: Storage) -> Optional[ExpiryScheduler]:
+    """[expiry] scheduler = false → แต่ละหน้านับ Z เองเหมือนเดิม"""
+    if not EXPIRY_CFG.get("scheduler", True):
+        return None
+    return get_expiry_scheduler(
+        STORAGE_BACKEND,
+        str(EXPIRY_CFG.get("lock_col", "")),
+        float(EXPIRY_CFG.get("batch_window", 0.5)),
+        store,
+        get_gas(),
+        ROW_STATE,
+    )
+
+_countdown = components.declare_component(
+    "mci_countdown", path=os.path.join(os.path.dirname(mci.__file__), "components", "countdown")
+)
+
+def render_countdown(origin_seconds: int, end_epoch: int, now: int, paused: bool = False) -> Optional[dict]:
+    """โชว์นับถอยหลัง; ถึง 0 → ส่ง {"event": "expired"} กลับ session เดิม (ไม่ reload), paused=True → ซ่อน"""
+    if paused:
+        return None
+    return _countdown(
+        origin_seconds=int(origin_seconds),
+        end_epoch=int(end_epoch),
+        server_now=now,
+        key=f"countdown-{display_row}-{end_epoch}",  # timer ใหม่ → component ใหม่ (ค่าเก่าไม่ค้าง)
+        default=None,
     )
 
 def show_lock_overlay(message: str, variant: str = "expired"):
@@ -490,65 +402,262 @@ def show_lock_overlay(message: str, variant: str = "expired"):
     )
 
 # =========================
-# Main
+# Metrics / debug (trace ของแต่ละ rerun)
 # =========================
-st.markdown("### 🩺 Patient Information")
-ws = open_ws()
+def token_ok(expected: str) -> bool:
+    """?token= ตรงกับ token ใน secrets (ไม่ได้ตั้ง token = ปิดหน้านั้น)"""
+    return bool(expected) and hmac.compare_digest(qp.get("token", ""), expected)
 
-# ---------- TIMER (GAS เป็นหลัก; fallback Secondary) ----------
-origin_seconds = 0
-t0_epoch = 0
-end_epoch = 0
+METRICS_CFG = st.secrets.get("metrics", {})
+# [metrics].token (ไม่ตั้ง → ใช้ [admin].token); ?mode=metrics, ?debug=1 และพอร์ต metrics ต้องมี token
+METRICS_TOKEN = str(METRICS_CFG.get("token", "") or st.secrets.get("admin", {}).get("token", "") or "")
+DEBUG_PANEL = bool(METRICS_CFG.get("debug_panel", False)) or (qp.get("debug", "") == "1" and token_ok(METRICS_TOKEN))
 
-# 1) GAS
-try:
-    g = gas_get_row(row=display_row)
-    if g and g.get("status") == "ok":
-        origin_seconds = int(g.get("timer_seconds", 0) or 0)
-        t0_epoch = int(g.get("t0_epoch", 0) or 0)
-        end_epoch = int(g.get("end_epoch", 0) or 0)
-        if origin_seconds > 0 and end_epoch == 0:
-            s = gas_start_timer(row=display_row)
-            if s.get("status") == "ok":
-                t0_epoch = int(s.get("t0_epoch", t0_epoch) or 0)
-                end_epoch = int(s.get("end_epoch", end_epoch) or 0)
-except Exception as e:
-    st.warning(f"GAS error, fallback to sheet: {e}")
+@st.cache_resource(show_spinner=False)
+def start_metrics_server(port: int, token: str):
+    """/metrics (Prometheus) + /metrics.json บนพอร์ตแยก (ตั้ง [metrics].port; Bearer token)"""
+    return serve_metrics(port, token=token)
 
-# 2) fallback Secondary
-if end_epoch == 0:
+if METRICS_CFG.get("port"):
     try:
-        ts = read_timer_state(ws, sheet_row)
-        origin_seconds = origin_seconds or int(ts["origin"])
-        t0_epoch = t0_epoch or int(ts["t0_epoch"])
-        end_epoch = end_epoch or int(ts["end_epoch"])
-        if origin_seconds > 0 and end_epoch == 0:
-            t0_epoch, end_epoch = start_timer_if_needed(ws, sheet_row, origin_seconds, t0_epoch, end_epoch)
-    except Exception as e:
-        st.warning(f"Sheet timer fallback error: {e}")
+        start_metrics_server(int(METRICS_CFG["port"]), METRICS_TOKEN)
+    except OSError as e:
+        st.warning(f"Metrics server error: {e}")
+
+def render_metrics_page():
+    """?mode=metrics&token=... → Prometheus text, &format=json → JSON"""
+    if not token_ok(METRICS_TOKEN):
+        st.error("ต้องมี [metrics].token (หรือ [admin].token) ใน secrets และ ?token= ที่ตรงกัน")
+        st.stop()
+    if qp.get("format", "") == "json":
+        st.json(TRACER.snapshot())
+    else:
+        st.code(TRACER.prometheus_text(), language="text")
 
-# ===== คำนวณเวลาที่เหลือ =====
-now = int(pd.Timestamp.utcnow().timestamp())
-remaining = max(0, end_epoch - now) if end_epoch else 0
+def render_debug_panel(tr):
+    with st.expander(f"🔎 Debug: {tr.duration * 1000:.0f} ms, {tr.remote_calls} remote calls", expanded=False):
+        st.table([s.as_dict(tr.start) for s in tr.spans])
 
-# ===== หมดเวลา → เพิ่ม Z + ล็อก + rerun (ให้รอบถัดไป lock ทั้งหน้าและเอาปุ่มออก) =====
-if (remaining <= 0) and (not st.session_state["expired_processed"]) and (not st.session_state["treated"]):
-    try:
-        increment_Z(ws, sheet_row)
-    except Exception as e:
-        st.warning(f"ไม่สามารถอัปเดตคอลัมน์ Z ได้: {e}")
-    st.session_state["expired_processed"] = True
-    st.session_state["timer_stopped"] = True
+# =========================
+# Watcher (อ่านทั้งชีตเป็นรอบๆ 1 ตัวต่อ process → หน้า view อัปเดตเอง ไม่อ่านเพิ่มต่อคนดู)
+# =========================
+WATCH_CFG = st.secrets.get("watcher", {})
+WATCH_INTERVAL = float(WATCH_CFG.get("interval", 5))  # 0 = ปิด
+WATCHER: Optional[SheetWatcher] = None
+
+@st.cache_resource(show_spinner=False)
+def get_watcher(backend: str, interval: float, _store: Storage) -> SheetWatcher:
+    # thread เริ่มเมื่อมี lease แรก และหยุดเองเมื่อไม่มี session ไหนต่อ lease เกิน idle_timeout
+    idle = max(30.0, 3 * max(interval, BOARD_REFRESH))
+    watcher = SheetWatcher(_store, interval=interval, idle_timeout=idle)
+    TRACER.gauge("mci_watcher_age_seconds", watcher.age)
+    TRACER.gauge("mci_watcher_sessions", watcher.watching)
+    return watcher
+
+def watch_lease() -> str:
+    """key ของ session นี้ใน lease ของ watcher"""
+    if "watch_lease" not in st.session_state:
+        st.session_state["watch_lease"] = uuid.uuid4().hex
+    return st.session_state["watch_lease"]
+
+def open_watcher(store: Storage) -> Optional[SheetWatcher]:
+    if WATCH_INTERVAL <= 0:
+        return None
+    return get_watcher(STORAGE_BACKEND, WATCH_INTERVAL, store).lease(watch_lease())
+
+def renew_watch():
+    """fragment ที่ใช้ snapshot ต่อ lease ทุกรอบ (ปิดแท็บ → ไม่ต่อ → watcher หยุดเอง)"""
+    if WATCHER is not None:
+        WATCHER.lease(watch_lease())
+
+@st.fragment(run_every=WATCH_INTERVAL if WATCH_INTERVAL > 0 else None)
+def render_view_card(display_row: int, sheet_row: int, cards: Dict[str, str], read_at: float,
+                     end_epoch: int, locked: bool):
+    """view: การ์ดคนไข้ ตรวจทุก interval จาก snapshot ของ watcher (ไม่อ่านชีตเพิ่ม); ล็อกแล้ว → rerun ทั้งหน้า"""
+    renew_watch()
+    if not locked and (ROW_STATE.get(display_row).locked or (end_epoch and time.time() >= end_epoch)):
+        st.rerun()  # prepare_page รอบใหม่เห็นสถานะเดียวกัน → ไม่วน
+    # สร้างการ์ดใหม่เมื่อ version เปลี่ยนเท่านั้น; fragment ต้องส่ง element เดิมซ้ำ → markup เดิม = ไม่วาดใหม่
+    version = WATCHER.version(sheet_row) if WATCHER is not None else 0
+    key = (sheet_row, version, read_at)
+    memo = st.session_state.get("view_card")
+    if memo is None or memo[0] != key:
+        if WATCHER is not None and WATCHER.last_poll > read_at:  # snapshot ใหม่กว่าที่หน้านี้อ่านมา
+            got = WATCHER.row(sheet_row)
+            if got is not None:
+                cards = payloads_from_values(*got, mode="view").get("A_C_R_V", cards)
+        memo = (key, kv_grid_html(cards.items(), title="Patient", cols=2))
+        st.session_state["view_card"] = memo
+    st.markdown(memo[1], unsafe_allow_html=True)
+
+# =========================
+# Board (ผู้บัญชาการเหตุการณ์: ทุกคนไข้ในหน้าเดียว)
+# =========================
+BOARD_CFG = st.secrets.get("board", {})
+BOARD_REFRESH = max(2.0, float(BOARD_CFG.get("refresh_seconds", 10)))
+BOARD_GAS_ROWS = max(1, int(BOARD_CFG.get("gas_rows_per_refresh", 50)))  # แถวที่ถาม GAS ได้ต่อรอบ
+
+@st.cache_data(ttl=BOARD_REFRESH, show_spinner=False)
+def load_board_rows(backend: str, _store: Storage) -> List[List[str]]:
+    """อ่านทั้งชีตในคำขอเดียว; ทุก session ที่เปิด board ใช้ผลเดียวกันภายใน refresh_seconds"""
+    return _store.read_all()
+
+@st.cache_data(ttl=BOARD_REFRESH, show_spinner=False)
+def load_board_gas_timers(display_rows: Tuple[int, ...]) -> Tuple[Dict[int, TimerState], List[int]]:
+    """timer จาก GAS ของแถวที่ชีต/TIMERS ไม่รู้ (ไม่มีคำสั่ง bulk); ใช้ร่วมทุก session"""
+    return gas_timers(get_gas(), display_rows, timers=TIMERS)
+
+@st.fragment(run_every=BOARD_REFRESH)
+def render_board(store: Storage):
+    """?mode=board → ตารางคนไข้ทั้งหมด รีเฟรชเองทุก [board].refresh_seconds (เฉพาะส่วนนี้)"""
+    from mci.board import (  # pandas เฉพาะหน้า board
+        board_frame, board_summary, format_remaining, sort_board, timers_to_fetch,
+    )
+
+    renew_watch()
+    tr = TRACER.begin("board")
+    with TRACER.span("phase.board"):
+        try:
+            if WATCHER is not None and WATCHER.age() <= 2 * WATCH_INTERVAL:
+                rows = WATCHER.rows()  # snapshot ล่าสุดของ watcher (ไม่อ่านเพิ่ม)
+            else:
+                rows = load_board_rows(STORAGE_BACKEND, store)
+        except Exception as e:
+            st.error(f"Failed to read sheet: {e}")
+            TRACER.end(tr)
+            return
+        timers = TIMERS.snapshot()
+        unknown: List[int] = []
+        if get_gas().url:  # GAS เป็น timer หลัก → คอลัมน์ S ว่าง; ถามเฉพาะแถวที่ยังไม่รู้ ไม่เกิน BOARD_GAS_ROWS ต่อรอบ
+            todo = timers_to_fetch(rows, timers, skip=TIMERS.unstarted())
+            fetched, unknown = load_board_gas_timers(tuple(todo[:BOARD_GAS_ROWS]))
+            unknown = unknown + todo[BOARD_GAS_ROWS:]  # รอบถัดไปถามต่อ
+            timers.update(fetched)
+        frame = sort_board(board_frame(rows, timers, unknown=unknown))
+        summary = board_summary(frame)
+    columns = ["name", "status", "remaining", "priority", "treatment", "deaths"]
+    if isinstance(store, ShardedStorage):  # รวมทุก shard แล้ว; บอกว่าแต่ละคนอยู่ชีตไหน
+        frame = frame.assign(shard=[store.shard_of(r + 1) for r in frame.index])
+        columns.append("shard")
+        for name, n in store.stray.items():
+            st.warning(f"shard {name}: มี {n} แถวเกินช่วงแถวที่กำหนด → ไม่แสดง (ตรวจ [shards] rows)")
+
+    c1, c2, c3, c4 = st.columns(4)
+    c1.metric("คนไข้", summary["patients"])
+    c2.metric("กำลังนับถอยหลัง", summary["running"])
+    c3.metric("รักษาแล้ว", summary["treated"])
+    c4.metric("เสียชีวิต", summary["deaths"])
+    if summary["priority"]:
+        st.caption(" · ".join(f"{k}: {v}" for k, v in summary["priority"].items()))
+
+    st.dataframe(
+        frame.assign(
+            remaining=format_remaining(frame["remaining_s"]),
+            treatment=frame["treatment_yes"].astype(str) + "/" + frame["treatment_answered"].astype(str),
+        )[columns],
+        use_container_width=True,
+        height=min(720, 38 + 35 * max(1, len(frame))),
+    )
+    st.caption(f"อัปเดตทุก {BOARD_REFRESH:g} วินาที")
+    if unknown:
+        st.warning(f"ยังไม่รู้ timer จาก GAS {len(unknown)} แถว → สถานะ unknown (ถามต่อรอบถัดไป)")
+    TRACER.end(tr)
+    if DEBUG_PANEL:
+        render_debug_panel(tr)
+
+# =========================
+# Admin: เริ่มเหตุการณ์ (เริ่ม timer ทุกแถวพร้อมกัน)
+# =========================
+ADMIN_TOKEN = str(st.secrets.get("admin", {}).get("token", "") or "")
+
+def render_admin_page(store: Storage):
+    """?mode=admin&token=... → เริ่ม timer ทุกแถว/ช่วงแถว ในการเขียนครั้งเดียว (หน้าคนไข้ไม่ต้องเริ่มเอง)"""
+    if not token_ok(ADMIN_TOKEN):
+        st.error("ต้องมี [admin].token ใน secrets และ ?token= ที่ตรงกัน")
+        st.stop()
+    scope = st.radio("แถว", ["ทุกแถว", "ช่วงแถว"], horizontal=True)
+    rows = None
+    if scope == "ช่วงแถว":
+        c1, c2 = st.columns(2)
+        first = int(c1.number_input("จากแถว", min_value=1, value=1, step=1))
+        last = int(c2.number_input("ถึงแถว", min_value=1, value=max(1, first), step=1))
+        rows = range(first, last + 1)
+    st.caption("ใช้เวลาของแต่ละแถวจากคอลัมน์ Q; แถวที่เริ่มไปแล้วจะไม่ถูกเริ่มใหม่")
+    if st.button("🚨 Start incident", type="primary"):
+        try:
+            started = start_incident(store, rows, timers=TIMERS)
+        except Exception as e:
+            st.error(f"Start incident failed: {e}")
+            st.stop()
+        ROW_STATE.clear(started)  # timer ใหม่ → ปลดล็อกแถวที่เริ่มใหม่
+        if EXPIRY is not None:
+            for r, t in started.items():
+                EXPIRY.schedule(r, r + 1, t.end_epoch)
+        st.success(f"เริ่ม timer แล้ว {len(started)} แถว")
+
+# =========================
+# Main
+# =========================
+if mode == "metrics":
+    render_metrics_page()
+    st.stop()
+
+if mode == "board":
+    st.markdown("### 🗂️ Incident Board")
+    store = open_storage()
+    WATCHER = open_watcher(store)
+    render_board(store)
+    st.stop()
+
+if mode == "admin":
+    st.markdown("### 🚨 Incident")
+    store = open_storage()
+    EXPIRY = open_expiry(store)
+    render_admin_page(store)
+    st.stop()
+
+trace = TRACER.begin(mode)
+st.markdown("### 🩺 Patient Information")
+store = open_storage()
+EXPIRY = open_expiry(store)
+if mode == "view":  # watcher อ่านทั้งชีตทุก interval → เริ่มเฉพาะเมื่อมีคนเปิด view/board
+    WATCHER = open_watcher(store)
+
+# ---------- สถานะร่วม → TIMER (GAS เป็นหลัก; fallback Secondary) → หมดเวลา → แถวของหน้านี้ ----------
+# ทั้งหมดอยู่ใน prepare_page (ใช้ร่วมกับ loadtest / replay benchmark → นับ remote call ตรงกัน)
+# แถว (header + คอลัมน์ตามโหมด) อ่านครั้งเดียวต่อ rerun แล้วใช้ทั้ง timer และ payload
+with TRACER.span("phase.timer"):
+    timer = prepare_page(store, get_gas(), display_row, sheet_row, mode, st.session_state,
+                         timers=TIMERS, row_state=ROW_STATE, expiry=EXPIRY)
+for msg in timer["warnings"]:
+    st.warning(msg)
+origin_seconds = timer["origin_seconds"]
+t0_epoch = timer["t0_epoch"]
+end_epoch = timer["end_epoch"]
+row_data = timer["row_data"]
+row_error = timer["row_error"]
+now = int(time.time())
+remaining = timer["remaining"]
+
+# ===== หมดเวลา → (นับ Z แล้วใน prepare_page) ล็อก + rerun (ให้รอบถัดไป lock ทั้งหน้าและเอาปุ่มออก) =====
+if timer["expired_now"]:
     st.rerun()
 
 # ===== สถานะล็อก (หมดเวลา/รักษาแล้ว/กดหยุด) =====
-expired = (remaining <= 0) or st.session_state["expired_processed"]
+expired = (bool(end_epoch) and remaining <= 0) or st.session_state["expired_processed"]  # ไม่มี timer ≠ หมดเวลา
 treated = st.session_state["treated"]
 locked  = expired or treated or st.session_state["timer_stopped"]
 
 # ===== แสดง/ซ่อนตัวจับเวลา =====
-if not locked:
-    render_countdown(origin_seconds, remaining, paused=False)
+if not locked and end_epoch:
+    countdown_event = render_countdown(origin_seconds, end_epoch, now, paused=False)
+    if countdown_event and countdown_event.get("event") == "expired" and countdown_event.get("end_epoch") == end_epoch:
+        # browser ถึง 0 ก่อน server เล็กน้อย → รอให้ครบแล้ว rerun ใน session เดิม (รอบถัดไปเข้าทางหมดเวลาด้านบน)
+        wait = end_epoch - time.time()
+        if wait <= 2:
+            if wait > 0:
+                time.sleep(wait)
+            st.rerun()
 
 # ===== ข้อความและ Overlay ตามสถานะ =====
 if locked:
@@ -560,18 +669,21 @@ if locked:
         st.error("คนไข้เสียชีวิตแล้ว")
 
 # ---------------- Defaults (กัน NameError) ----------------
-df_AK = None
-df_AC_RU = None
-df_AC_RV = None
+cards_AK = None
+cards_AC_RU = None
+cards_AC_RV = None
 headers_LQ = ["L","M","N","O","P","Q"]
 current_LQ = []
 current_V = ""
 
 # ===== เตรียม payload ตามโหมด =====
+payload_span = TRACER.open_span("phase.payload")
 if mode == "edit1":
     try:
-        data = build_payloads_from_row(ws, sheet_row=sheet_row, mode="edit1")
-        df_AK = pd.DataFrame([data.get("A_K", {})])
+        if row_error is not None:
+            raise row_error
+        data = payloads_from_values(*row_data, mode="edit1")
+        cards_AK = data.get("A_K", {})
         headers_LQ = data.get("headers_LQ", headers_LQ)
         current_LQ = data.get("current_LQ", current_LQ)
     except Exception as e:
@@ -580,8 +692,10 @@ if mode == "edit1":
 
 if mode == "edit2":
     try:
-        data = build_payloads_from_row(ws, sheet_row=sheet_row, mode="edit2")
-        df_AC_RU = pd.DataFrame([data.get("A_C_R_U", {})])
+        if row_error is not None:
+            raise row_error
+        data = payloads_from_values(*row_data, mode="edit2")
+        cards_AC_RU = data.get("A_C_R_U", {})
         current_V = data.get("current_V", current_V)
     except Exception as e:
         st.error(f"Failed to read sheet: {e}")
@@ -589,16 +703,22 @@ if mode == "edit2":
 
 if mode == "view":
     try:
-        data = build_payloads_from_row(ws, sheet_row=sheet_row, mode="view")
-        df_AC_RV = pd.DataFrame([data.get("A_C_R_V", {})])
+        if row_error is not None:
+            raise row_error
+        read_at = time.time()
+        data = payloads_from_values(*row_data, mode="view")
+        cards_AC_RV = data.get("A_C_R_V", {})
     except Exception as e:
         st.error(f"Failed to read sheet: {e}")
         st.stop()
 
+TRACER.close_span(payload_span)
+
 # ============ Modes ============
+render_span = TRACER.open_span("phase.render")
 if mode == "view":
-    if df_AC_RV is not None:
-        render_kv_grid(df_AC_RV, title="Patient", cols=2)
+    if cards_AC_RV is not None:
+        render_view_card(display_row, sheet_row, cards_AC_RV, read_at, end_epoch, locked)
     if treated:
         st.success("คนไข้ได้รับการรักษาแล้ว")
     elif st.session_state["expired_processed"]:
@@ -611,12 +731,14 @@ if mode == "view":
         st.rerun()
 
 elif mode == "edit2":
-    if df_AC_RU is None:
-        data = build_payloads_from_row(ws, sheet_row=sheet_row, mode="edit2")
-        df_AC_RU = pd.DataFrame([data.get("A_C_R_U", {})])
+    if cards_AC_RU is None:
+        if row_data is None:
+            row_data = get_header_and_row(store, sheet_row, mode)
+        data = payloads_from_values(*row_data, mode="edit2")
+        cards_AC_RU = data.get("A_C_R_U", {})
         current_V = data.get("current_V", current_V)
 
-    render_kv_grid(df_AC_RU, title="Patient", cols=2)
+    render_kv_grid(cards_AC_RU.items(), title="Patient", cols=2)
     st.markdown("#### Secondary Triage")
 
     if not locked:
@@ -626,7 +748,7 @@ elif mode == "edit2":
             submitted = st.form_submit_button("Submit Triage")
         if submitted:
             try:
-                res = update_V(ws, sheet_row=sheet_row, v_value=v_value)
+                res = update_V(store, sheet_row=sheet_row, v_value=v_value)
                 if res.get("status") == "ok":
                     # หยุดเวลา + ล็อค + ไปหน้า view ทันที
                     try:
@@ -646,13 +768,13 @@ elif mode == "edit2":
 
 else:
     # Phase 1: A–K + L–Q form (อนุญาตแก้หลายครั้งได้ จนกว่าจะกด Triage)
-    if df_AK is None:
-        _data_edit1 = build_payloads_from_row(ws, sheet_row=sheet_row, mode="edit1")
-        df_AK = pd.DataFrame([_data_edit1.get("A_K", {})])
+    if cards_AK is None:
+        _data_edit1 = build_payloads_from_row(store, sheet_row=sheet_row, mode="edit1")
+        cards_AK = _data_edit1.get("A_K", {})
         headers_LQ = _data_edit1.get("headers_LQ", ["L","M","N","O","P","Q"])
         current_LQ = _data_edit1.get("current_LQ", [])
 
-    render_kv_grid(df_AK, title="Patient", cols=2)
+    render_kv_grid(cards_AK.items(), title="Patient", cols=2)
     st.markdown("#### Treatment")
 
     if not locked:
@@ -676,7 +798,7 @@ else:
 
         if submitted:
             try:
-                res = update_LQ(ws, sheet_row=sheet_row, lq_values=selections)
+                res = update_LQ(store, sheet_row=sheet_row, lq_values=selections)
                 if res.get("status") == "ok":
                     # เก็บ payload เฟส 2 ไว้ใน session เพื่อแสดง Result ด้านล่าง
                     st.session_state["next_after_lq"] = res.get("next", {})
@@ -691,9 +813,8 @@ else:
     # Inline phase 2 preview + One-shot Triage (กดได้ครั้งเดียว)
     nxt = st.session_state.get("next_after_lq")
     if nxt:
-        df_ru = pd.DataFrame([nxt.get("A_C_R_U", {})])
         st.markdown("#### Treatment Result (Preview)")
-        render_kv_grid(df_ru, cols=2)
+        render_kv_grid(nxt.get("A_C_R_U", {}).items(), cols=2)
 
         st.markdown("#### Secondary Triage")
         if not locked:
@@ -705,7 +826,7 @@ else:
 
             if v_submitted:
                 try:
-                    res2 = update_V(ws, sheet_row=sheet_row, v_value=v_value)
+                    res2 = update_V(store, sheet_row=sheet_row, v_value=v_value)
                     if res2.get("status") == "ok":
                         try:
                             gas_stop_timer(display_row)
@@ -722,3 +843,8 @@ else:
                     st.error(f"Failed to update V: {e}")
         else:
             st.info("หน้าถูกล็อกเนื่องจากหมดเวลา/ปิดการรักษาแล้ว")
+
+TRACER.close_span(render_span)
+TRACER.end(trace)
+if DEBUG_PANEL:
+    render_debug_panel(trace)
@@ -0,0 +1,27 @@
+import os
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from mci.fakes import CallStats, FakeSheetsHandle, FakeSpreadsheet  # noqa: E402
+from mci.loadtest import make_rows  # noqa: E402
+from mci.storage import SQLiteStorage  # noqa: E402
+
+
+@pytest.fixture
+def sqlite_store():
+    store = SQLiteStorage(":memory:")
+    store.load_rows(make_rows(5))
+    return store
+
+
+@pytest.fixture
+def fake_sheet():
+    """``(spreadsheet, handle)`` over 5 patients; writes flush after 10 ms."""
+    sheet = FakeSpreadsheet(make_rows(5), stats=CallStats())
+    handle = FakeSheetsHandle(sheet, write_latency=0.01)
+    yield sheet, handle
+    handle.writer().close()
@@ -0,0 +1,65 @@
+from mci.board import board_frame, board_summary, sort_board, timers_to_fetch
+from mci.fakes import CallStats, FakeGasServer
+from mci.gas import GasClient
+from mci.patient import gas_timers
+from mci.timer_cache import TimerCache, TimerState
+
+NOW = 1_000_000
+
+
+def sheet(*rows):
+    """Header + rows given as ``{column letter: value}``."""
+    out = [["h"] * 26]
+    for cells in rows:
+        vals = [""] * 26
+        for col, v in cells.items():
+            vals[ord(col) - ord("A")] = v
+        out.append(vals)
+    return out
+
+
+ROWS = sheet(
+    {"A": "running", "S": str(NOW + 90)},
+    {"A": "expired", "S": str(NOW - 5)},
+    {"A": "treated", "S": str(NOW + 90), "V": "Priority 2", "L": "Yes", "M": "No"},
+    {"A": "dead", "Z": "1"},
+    {"A": "gas only"},
+    {},  # blank line
+    {"A": "gas unknown"},
+)
+
+
+def test_statuses_from_one_bulk_read():
+    frame = board_frame(ROWS, {5: TimerState(60, NOW, NOW + 30)}, now=NOW, unknown=[7])
+    assert list(frame.index) == [1, 2, 3, 4, 5, 7]
+    assert frame["status"].to_dict() == {1: "running", 2: "expired", 3: "treated", 4: "dead", 5: "running",
+                                         7: "unknown"}
+    assert frame.loc[1, "remaining_s"] == 90 and frame.loc[5, "remaining_s"] == 30
+    assert (frame.loc[3, "treatment_yes"], frame.loc[3, "treatment_answered"]) == (1, 2)
+    assert list(sort_board(frame).index[:3]) == [5, 1, 2]  # least time left first
+    assert board_summary(frame) == {"patients": 6, "running": 2, "treated": 1, "deaths": 1,
+                                    "priority": {"Priority 2": 1}}
+    assert board_frame(ROWS[:1]).empty
+
+
+def test_timers_to_fetch_skips_known_and_closed_rows():
+    assert timers_to_fetch(ROWS) == [5, 7]
+    assert timers_to_fetch(ROWS, {5: TimerState(60, NOW, NOW + 30)}) == [7]
+    assert timers_to_fetch(ROWS, skip={7}) == [5]
+
+
+def test_gas_answers_are_cached_started_or_not():
+    stats = CallStats()
+    with FakeGasServer({1: 300, 2: 300}, stats=stats) as server:
+        gas = GasClient(server.url)
+        server.handle("start_timer", 1)
+        timers = TimerCache(unstarted_ttl=60)
+        started, failed = gas_timers(gas, [1, 2], timers=timers)
+        assert list(started) == [1] and failed == []
+        assert timers.get(1) == started[1]
+        assert timers.unstarted() == {2}
+        assert timers_to_fetch(sheet({"A": "a"}, {"A": "b"}), timers.snapshot(), skip=timers.unstarted()) == []
+        assert timers.unstarted(now=10 ** 10) == set()  # asked again once the TTL is over
+        timers.put(2, 300, NOW, NOW + 300)
+        assert timers.unstarted() == set()
+    assert stats.totals["gas.get"] == 2
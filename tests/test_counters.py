@@ -0,0 +1,128 @@
+import threading
+
+import pytest
+
+from mci.counters import ExpiryCounter
+
+
+class Column:
+    """Column Z of a sheet: ``read`` / ``write`` with injectable failures.
+
+    ``write`` failures may be ``"lost"`` (never committed) or ``"late"``
+    (committed, but the writer timed out first).
+    """
+
+    def __init__(self, **values):
+        self.values = {int(r): str(v) for r, v in values.items()}
+        self.read_errors = 0
+        self.write_failures = []
+        self.writes = 0
+
+    def read(self, rows):
+        if self.read_errors:
+            self.read_errors -= 1
+            raise ConnectionError("read failed")
+        return {r: self.values.get(r, "") for r in rows}
+
+    def write(self, totals):
+        self.writes += 1
+        failure = self.write_failures.pop(0) if self.write_failures else None
+        if failure != "lost":
+            self.values.update({r: str(v) for r, v in totals.items()})
+        if failure is not None:
+            raise TimeoutError("write still queued")
+
+    def total(self, row):
+        return int(self.values.get(row, "0") or 0)
+
+
+def counter(col):
+    return ExpiryCounter(col.read, col.write, interval=3600)  # no background flush: tests flush
+
+
+def test_concurrent_adds_are_counted_exactly():
+    col = Column(**{"2": 3})
+    z = counter(col)
+    barrier = threading.Barrier(8)
+
+    def expire(worker):
+        barrier.wait()
+        for i in range(50):
+            z.add(2 + i % 3, f"expiry:{worker}:{i}")
+            z.add(2 + i % 3, f"expiry:{worker}:{i}")  # same event replayed: ignored
+
+    threads = [threading.Thread(target=expire, args=(w,)) for w in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert z.pending() == 400
+    z.flush()
+    assert z.pending() == 0
+    assert (col.total(2), col.total(3), col.total(4)) == (3 + 136, 136, 128)
+
+
+def test_failed_read_keeps_the_deltas():
+    col = Column(**{"2": 1})
+    z = counter(col)
+    z.add(2, "a")
+    col.read_errors = 1
+    with pytest.raises(ConnectionError):
+        z.flush()
+    assert z.pending(2) == 1 and col.writes == 0
+    z.flush()
+    assert col.total(2) == 2
+
+
+@pytest.mark.parametrize("failure", ["lost", "late"])
+def test_failed_write_is_never_counted_twice(failure):
+    col = Column(**{"2": 5})
+    z = counter(col)
+    z.add(2, "a")
+    col.write_failures = [failure]
+    with pytest.raises(TimeoutError):
+        z.flush()
+    assert z.pending(2) == 1
+    z.add(2, "b")
+    z.flush()
+    assert col.total(2) == 7
+    assert z.pending() == 0 and z.last_total(2) == 7
+
+
+def test_adds_during_a_failing_flush_survive():
+    col = Column(**{"2": 0})
+    z = counter(col)
+    z.add(2, "a")
+    started, release = threading.Event(), threading.Event()
+    write = col.write
+
+    def slow_write(totals):
+        started.set()
+        release.wait(5)
+        col.write_failures = ["late"]
+        write(totals)
+
+    def flush():
+        with pytest.raises(TimeoutError):
+            z.flush()
+
+    z._write_totals = slow_write
+    flusher = threading.Thread(target=flush)
+    flusher.start()
+    started.wait(5)
+    z.add(2, "b")  # arrives while the write is in flight
+    release.set()
+    flusher.join()
+    z._write_totals = write
+    z.flush()
+    assert col.total(2) == 2
+
+
+def test_sheets_z_counter_against_the_fake(fake_sheet):
+    _, handle = fake_sheet
+    z = handle.z_counter()
+    z.interval = 3600
+    for i, r in enumerate((2, 2, 3)):
+        z.add(r, f"expiry:{r}:{i}")
+    z.flush()
+    assert handle.read_column("Z", [2, 3]) == {2: "2", 3: "1"}
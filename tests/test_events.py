@@ -0,0 +1,67 @@
+import glob
+import json
+import os
+import time
+
+import pytest
+
+from mci.events import EventLog, compact, compact_file, load_events, patient_times
+
+
+def log(tmp_path, replica="r1", **kwargs):
+    kwargs.setdefault("flush_interval", 3600)  # the background writer never gets there: tests flush
+    return EventLog(str(tmp_path), "drill-1", replica=replica, **kwargs)
+
+
+def lines(path):
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f]
+
+
+def test_emit_queues_and_flush_writes_one_batch(tmp_path):
+    events = log(tmp_path)
+    events.emit("timer_start", 2, t0=100)
+    events.emit("v_submit", 2, priority="Priority 1")
+    assert events.pending() == 2 and not os.path.exists(events.current_path())
+    events.flush()
+    assert [e["kind"] for e in lines(events.current_path())] == ["timer_start", "v_submit"]
+    assert (events.written, events.batches, events.pending()) == (2, 1, 0)
+
+
+def test_background_writer_flushes(tmp_path):
+    events = log(tmp_path, flush_interval=0)
+    events.emit("expiry", 3)
+    deadline = time.time() + 5
+    while not events.written and time.time() < deadline:
+        time.sleep(0.01)
+    assert lines(events.current_path())[0]["kind"] == "expiry"
+
+
+def test_reconfigure_writes_the_old_drill_first(tmp_path):
+    events = log(tmp_path)
+    events.emit("lq_submit", 2)
+    events.configure(str(tmp_path), "drill-2")
+    events.emit("lq_submit", 3)
+    events.flush()
+    assert [e["row"] for e in lines(os.path.join(tmp_path, "drill-1", "current-r1.jsonl"))] == [2]
+    assert [e["drill"] for e in lines(events.current_path())] == ["drill-2"]
+
+
+def test_rotation_compaction_and_query(tmp_path):
+    pytest.importorskip("pyarrow")
+    a, b = log(tmp_path, "a", rotate_bytes=1), log(tmp_path, "b")
+    a.emit("timer_start", 2, t0=100.0)  # one event past rotate_bytes: sealed on write
+    a.flush()
+    b.emit("lq_submit", 2)
+    b.emit("expiry", 3)
+    b.flush()
+    drill = os.path.join(tmp_path, "drill-1")
+    sealed = glob.glob(os.path.join(drill, "part-*-a.jsonl")) or glob.glob(os.path.join(drill, "part-*-a.parquet"))
+    assert len(sealed) == 1 and not os.path.exists(a.current_path())
+    compact(drill)  # whatever the background compaction has not done yet
+    assert compact_file(sealed[0].replace(".parquet", ".jsonl")) is None  # already compacted
+    df = load_events(str(tmp_path))
+    assert list(df["kind"]) == ["timer_start", "lq_submit", "expiry"]
+    times = patient_times(df).set_index("row")
+    assert times.loc[2, "start"] == 100.0 and times.loc[2, "treated_at"] > 100.0
+    assert not times.loc[2, "died"]
@@ -0,0 +1,109 @@
+import time
+
+from mci.expiry import LOCKED, ExpiryScheduler
+from mci.patient import prepare_page
+from mci.row_state import MemoryRowState
+
+
+class StubGas:
+    """``stop_timer`` that fails the first ``failures`` calls."""
+
+    url = "stub"
+
+    def __init__(self, failures=0):
+        self.failures = failures
+        self.stopped = []
+
+    def stop_timer(self, row):
+        if self.failures:
+            self.failures -= 1
+            raise ConnectionError("GAS down")
+        self.stopped.append(row)
+        return {"status": "ok"}
+
+
+def scheduler(store, **kwargs):
+    kwargs.setdefault("lock_col", "W")
+    return ExpiryScheduler(store, batch_window=0, retry_delay=0, background=False, **kwargs)
+
+
+def z(store, sheet_row):
+    return store.read_row(sheet_row)[1][25]
+
+
+def due():
+    return int(time.time()) - 1
+
+
+def test_due_rows_expire_together_once(sqlite_store):
+    gas = StubGas()
+    ex = scheduler(sqlite_store, gas=gas)
+    end = due()
+    ex.schedule(1, 2, end)
+    ex.schedule(2, 3, end)
+    ex.schedule(1, 2, end)  # same timer again: ignored
+    ex.schedule(3, 4, int(time.time()) + 3600)
+    assert ex.run_due() == 2
+    assert ex.batches == 1 and ex.expired == 2 and ex.pending() == 1
+    assert (z(sqlite_store, 2), z(sqlite_store, 3)) == ("1", "1")
+    assert sqlite_store.read_row(2)[1][22] == LOCKED
+    assert sorted(gas.stopped) == [1, 2]
+    assert ex.processed(1, end)
+    ex.schedule(1, 2, end)  # already expired: not again
+    assert ex.run_due() == 0
+
+
+def test_cancelled_row_is_not_expired(sqlite_store):
+    ex = scheduler(sqlite_store)
+    ex.schedule(1, 2, due())
+    ex.cancel(1)
+    assert ex.run_due() == 0
+    assert z(sqlite_store, 2) == ""
+
+
+def test_one_replica_claims_each_timer(sqlite_store):
+    state = MemoryRowState()
+    a, b = scheduler(sqlite_store, row_state=state), scheduler(sqlite_store, row_state=state)
+    end = due()
+    for ex in (a, b):
+        ex.schedule(1, 2, end)
+        ex.run_due()
+    assert z(sqlite_store, 2) == "1"
+    assert a.expired + b.expired == 1
+    state.mark_treated(2)
+    a.schedule(2, 3, end)
+    a.run_due()
+    assert z(sqlite_store, 3) == ""
+
+
+def test_failed_lock_and_stop_are_retried_without_recounting(sqlite_store):
+    gas = StubGas(failures=1)
+    ex = scheduler(sqlite_store, gas=gas)
+    write_cells = sqlite_store.write_cells
+    calls = []
+
+    def flaky_write(row, cells):
+        calls.append(row)
+        if len(calls) == 1:
+            raise TimeoutError("write still queued")
+        write_cells(row, cells)
+
+    sqlite_store.write_cells = flaky_write
+    end = due()
+    ex.schedule(1, 2, end)
+    ex.run_due()
+    assert ex.failures == 2 and not ex.processed(1, end)
+    assert sqlite_store.read_row(2)[1][22] == "" and gas.stopped == []
+    ex.run_due()
+    assert ex.processed(1, end)
+    assert sqlite_store.read_row(2)[1][22] == LOCKED and gas.stopped == [1]
+    assert z(sqlite_store, 2) == "1"
+
+
+def test_row_without_timer_is_not_expired(sqlite_store):
+    for ex in (None, scheduler(sqlite_store)):
+        state = {"treated": False, "timer_stopped": False, "expired_processed": False}
+        res = prepare_page(sqlite_store, None, 1, 2, "edit1", state, row_state=MemoryRowState(), expiry=ex)
+        assert res["end_epoch"] == 0 and not res["expired_now"]
+        assert not state["expired_processed"] and res["row_data"] is not None
+    assert z(sqlite_store, 2) == ""
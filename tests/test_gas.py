@@ -0,0 +1,40 @@
+import time
+
+from mci.gas import CircuitBreaker
+
+
+def test_opens_after_threshold_failures_in_a_row():
+    b = CircuitBreaker(failure_threshold=3, reset_timeout=60)
+    b.record_failure()
+    b.record_failure()
+    b.record_success()  # resets the run
+    b.record_failure()
+    b.record_failure()
+    assert b.state == CircuitBreaker.CLOSED and b.allow()
+    b.record_failure()
+    assert b.state == CircuitBreaker.OPEN
+    assert not b.allow()
+
+
+def test_half_open_lets_one_probe_through():
+    b = CircuitBreaker(failure_threshold=1, reset_timeout=0.05)
+    b.record_failure()
+    assert not b.allow()
+    time.sleep(0.06)
+    assert b.state == CircuitBreaker.HALF_OPEN
+    assert b.allow()
+    assert not b.allow()  # probe still in flight
+    b.record_success()
+    assert b.state == CircuitBreaker.CLOSED
+    assert b.allow() and b.allow()
+
+
+def test_failed_probe_opens_again():
+    b = CircuitBreaker(failure_threshold=3, reset_timeout=0.05)
+    for _ in range(3):
+        b.record_failure()
+    time.sleep(0.06)
+    assert b.allow()
+    b.record_failure()  # a single failure while half-open is enough
+    assert b.state == CircuitBreaker.OPEN
+    assert not b.allow()
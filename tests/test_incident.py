@@ -0,0 +1,38 @@
+from mci.patient import start_incident, timer_state_from_values
+from mci.timer_cache import TimerCache, TimerState
+
+NOW = 1_000_000
+
+
+def timer(store, sheet_row):
+    return timer_state_from_values(store.read_row(sheet_row)[1])
+
+
+def with_durations(store):
+    store.write_cells(2, {"Q": "300"})
+    store.write_cells(3, {"Q": "00:02:00"})
+    store.write_cells(4, {"Q": "60", "R": NOW - 10, "S": NOW + 50})  # already running
+    writes = []
+    write_many = store.write_many
+    store.write_many = lambda cells: (writes.append(sorted(cells)), write_many(cells))
+    return writes
+
+
+def test_starts_every_row_with_a_duration_in_one_write(sqlite_store):
+    writes = with_durations(sqlite_store)
+    timers = TimerCache()
+    started = start_incident(sqlite_store, now=NOW, timers=timers)
+    assert started == {1: TimerState(300, NOW, NOW + 300), 2: TimerState(120, NOW, NOW + 120)}
+    assert writes == [[2, 3]]
+    assert timer(sqlite_store, 3) == {"origin": 120, "t0_epoch": NOW, "end_epoch": NOW + 120}
+    assert timer(sqlite_store, 4)["t0_epoch"] == NOW - 10  # left alone
+    assert timer(sqlite_store, 5)["end_epoch"] == 0  # no duration in Q
+    assert timers.get(1, now=NOW) == started[1]
+    assert start_incident(sqlite_store, now=NOW + 5) == {} and len(writes) == 1  # twice is harmless
+
+
+def test_only_the_chosen_rows(sqlite_store):
+    writes = with_durations(sqlite_store)
+    assert list(start_incident(sqlite_store, rows=range(2, 4), now=NOW)) == [2]
+    assert writes == [[3]]
+    assert timer(sqlite_store, 2)["end_epoch"] == 0
@@ -0,0 +1,49 @@
+import time
+
+from mci.patient import prepare_page
+from mci.row_state import MemoryRowState
+from mci.timer_cache import TimerCache
+
+
+def session():
+    return {"treated": False, "timer_stopped": False, "expired_processed": False}
+
+
+def run_out(store, sheet_row):
+    now = int(time.time())
+    store.write_cells(sheet_row, {"Q": "60", "R": now - 61, "S": now - 1})
+
+
+def test_expiry_is_handled_in_the_same_session_once(sqlite_store):
+    run_out(sqlite_store, 3)
+    state, row_state = session(), MemoryRowState()
+    res = prepare_page(sqlite_store, None, 2, 3, "edit1", state, timers=TimerCache(), row_state=row_state)
+    assert res["expired_now"] and res["counted"]
+    assert state["expired_processed"] and state["timer_stopped"]
+    again = prepare_page(sqlite_store, None, 2, 3, "edit1", state, row_state=row_state)  # the rerun it asks for
+    assert not again["expired_now"] and again["row_data"] is not None
+    other = session()  # another device on the same patient: locked, not counted twice
+    assert not prepare_page(sqlite_store, None, 2, 3, "view", other, row_state=row_state)["expired_now"]
+    assert other["expired_processed"]
+    assert sqlite_store.read_row(3)[1][25] == "1"
+
+
+def test_treated_row_skips_the_timer(sqlite_store):
+    run_out(sqlite_store, 2)
+    row_state = MemoryRowState()
+    row_state.mark_treated(1)
+    state = session()
+    res = prepare_page(sqlite_store, None, 1, 2, "view", state, row_state=row_state)
+    assert state["treated"] and not res["expired_now"] and res["end_epoch"] == 0
+    assert res["row_data"][1][0] == "Patient 1"
+    assert sqlite_store.read_row(2)[1][25] == ""
+
+
+def test_unreadable_row_is_reported_not_raised(sqlite_store):
+    def broken(row, mode=""):
+        raise ConnectionError("sheet down")
+
+    sqlite_store.read_row = broken
+    res = prepare_page(sqlite_store, None, 1, 2, "edit1", session())
+    assert isinstance(res["row_error"], ConnectionError) and res["row_data"] is None
+    assert res["warnings"]
@@ -0,0 +1,77 @@
+import threading
+import time
+
+import pytest
+
+from mci.fakes import FakeAPIError
+from mci.quota import CRITICAL, READ, SUBMIT, VIEW, WRITE, QuotaScheduler, QuotaTimeout, current_priority, priority
+
+
+def wait_for(cond, timeout=5.0):
+    deadline = time.time() + timeout
+    while not cond() and time.time() < deadline:
+        time.sleep(0.005)
+    return cond()
+
+
+def test_waiters_are_served_by_priority_then_arrival():
+    quota = QuotaScheduler(read_per_minute=1200, burst=1)
+    quota.buckets[READ].pause(time.monotonic() + 0.3)  # everyone queues up first
+    order = []
+    threads = []
+    for name, level in (("view", VIEW), ("submit-1", SUBMIT), ("critical", CRITICAL), ("submit-2", SUBMIT)):
+        t = threading.Thread(target=quota.run, args=(READ, lambda name=name: order.append(name), level))
+        t.start()
+        threads.append(t)
+        assert wait_for(lambda: quota.depth(READ) == len(threads))
+    assert quota.oldest_wait() > 0
+    for t in threads:
+        t.join(5)
+    assert order == ["critical", "submit-1", "submit-2", "view"]
+    assert quota.granted == 4 and quota.depth() == 0
+
+
+def test_429_pauses_the_bucket_and_retries():
+    quota = QuotaScheduler(write_per_minute=6000, backoff=0.01, max_backoff=0.05)
+    calls = []
+
+    def flaky():
+        calls.append(time.monotonic())
+        if len(calls) < 3:
+            raise FakeAPIError(429)
+        return "ok"
+
+    assert quota.run(WRITE, flaky) == "ok"
+    assert len(calls) == 3 and quota.throttled == 2
+    assert quota.buckets[WRITE].tokens < 1  # no saved-up burst right after a 429
+
+
+def test_other_errors_and_exhausted_retries_propagate():
+    quota = QuotaScheduler(read_per_minute=6000, max_retries=1, backoff=0.01)
+    status = 429
+
+    def failing():
+        raise FakeAPIError(status)
+
+    with pytest.raises(FakeAPIError):
+        quota.run(READ, failing)
+    assert quota.throttled == 1
+    status = 500
+    with pytest.raises(FakeAPIError):
+        quota.run(READ, failing)
+    assert quota.throttled == 1
+
+
+def test_no_token_within_max_wait():
+    quota = QuotaScheduler(read_per_minute=1, burst=1, max_wait=0.05)
+    quota.run(READ, lambda: None)
+    with pytest.raises(QuotaTimeout):
+        quota.run(READ, lambda: None)
+    assert quota.depth(READ) == 0
+
+
+def test_priority_from_context():
+    assert (current_priority(READ), current_priority(WRITE)) == (SUBMIT, CRITICAL)
+    with priority(VIEW):
+        assert current_priority(READ) == VIEW
+    assert current_priority(READ) == SUBMIT
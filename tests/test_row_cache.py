@@ -0,0 +1,80 @@
+import threading
+
+from mci.fakes import CallStats, FakeSheetsHandle, FakeSpreadsheet
+from mci.loadtest import make_rows
+from mci.row_cache import RowCache
+
+
+def test_hit_until_bumped():
+    cache = RowCache(ttl=60)
+    fetches = []
+    fetch = lambda: fetches.append(1) or len(fetches)  # noqa: E731
+    assert cache.get("r", fetch) == 1
+    assert cache.get("r", fetch) == 1
+    cache.bump("r")
+    assert cache.get("r", fetch) == 2
+    assert (cache.hits, cache.misses) == (1, 2)
+
+
+def test_fetch_outdated_by_a_write_is_not_cached():
+    cache = RowCache(ttl=60)
+
+    def fetch_then_written():
+        cache.bump("r")  # a write lands while the read is in flight
+        return "old"
+
+    assert cache.get("r", fetch_then_written) == "old"
+    assert cache.get("r", lambda: "new") == "new"
+
+
+def test_concurrent_readers_share_one_fetch():
+    cache = RowCache(ttl=60)
+    release = threading.Event()
+    fetches = []
+
+    def fetch():
+        fetches.append(1)
+        release.wait(5)
+        return "row"
+
+    got = []
+    threads = [threading.Thread(target=lambda: got.append(cache.get("r", fetch))) for _ in range(6)]
+    for t in threads:
+        t.start()
+    while cache.shared + cache.misses < 6:
+        threading.Event().wait(0.005)
+    release.set()
+    for t in threads:
+        t.join()
+    assert got == ["row"] * 6 and len(fetches) == 1
+
+
+def test_put_and_offer_respect_versions():
+    cache = RowCache(ttl=60)
+    v = cache.version("r")
+    cache.bump("r")  # another write since v
+    cache.put("r", "mine", if_version=v)
+    assert cache.get("r", lambda: "fetched") == "fetched"
+
+    v = cache.version("s")
+    cache.bump("s")
+    cache.offer("s", "bulk", v)  # read before the write: ignored
+    assert cache.get("s", lambda: "fetched") == "fetched"
+    cache.offer("t", "bulk", cache.version("t"))
+    assert cache.get("t", lambda: "fetched") == "bulk"
+
+
+def test_sheets_writes_invalidate_the_cached_row():
+    sheet = FakeSpreadsheet(make_rows(3), stats=CallStats())
+    handle = FakeSheetsHandle(sheet, write_latency=0.01, row_cache=RowCache(ttl=60))
+    try:
+        assert handle.read_row(2)[1][21] == ""
+        handle.write_cells(2, {"V": "Red"})
+        assert handle.read_row(2)[1][21] == "Red"
+        _, vals = handle.write_row(2, {"W": "x"})
+        assert vals[21:23] == ["Red", "x"]
+        reads = sheet.stats.totals["sheets.values_batch_get"]
+        assert handle.read_row(2)[1][22] == "x"  # from write_row's response
+        assert sheet.stats.totals["sheets.values_batch_get"] == reads
+    finally:
+        handle.writer().close()
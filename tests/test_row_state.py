@@ -0,0 +1,68 @@
+import threading
+
+import pytest
+
+from mci.row_state import NO_TIMER, MemoryRowState, SQLiteRowState
+
+
+@pytest.fixture(params=["memory", "sqlite-memory", "sqlite-file"])
+def state(request, tmp_path):
+    if request.param == "memory":
+        return MemoryRowState()
+    if request.param == "sqlite-memory":
+        return SQLiteRowState(":memory:")
+    return SQLiteRowState(str(tmp_path / "state.sqlite3"))
+
+
+def test_one_claim_per_timer(state):
+    assert state.claim_expiry(1, 1000)
+    assert not state.claim_expiry(1, 1000)
+    assert state.get(1).expired and state.get(1).expired_end == 1000
+    assert state.claim_expiry(1, 2000)  # timer started again
+    assert not state.get(2).locked
+
+
+def test_row_without_timer_is_claimed_once(state):
+    assert state.claim_expiry(1, 0)
+    assert not state.claim_expiry(1, 0)
+    assert state.get(1).expired_end == NO_TIMER and state.get(1).locked
+
+
+def test_treated_row_is_never_claimed(state):
+    state.mark_treated(1)
+    assert not state.claim_expiry(1, 1000)
+    assert state.get(1).treated and not state.get(1).expired
+
+
+def test_clear_unlocks(state):
+    state.claim_expiry(1, 1000)
+    state.mark_treated(2)
+    state.clear([1])
+    assert not state.get(1).locked and state.get(2).treated
+    state.clear()
+    assert not state.get(2).locked
+
+
+def test_concurrent_claims_have_one_winner(state):
+    barrier = threading.Barrier(12)
+    wins = []
+
+    def claim():
+        barrier.wait()
+        wins.append(state.claim_expiry(1, 1000))
+
+    threads = [threading.Thread(target=claim) for _ in range(12)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert wins.count(True) == 1
+
+
+def test_sqlite_processes_share_the_file(tmp_path):
+    path = str(tmp_path / "state.sqlite3")
+    a, b = SQLiteRowState(path, namespace="drill"), SQLiteRowState(path, namespace="drill")
+    assert a.claim_expiry(1, 1000)
+    assert not b.claim_expiry(1, 1000)
+    other = SQLiteRowState(path, namespace="next-drill")
+    assert not other.get(1).locked
@@ -0,0 +1,36 @@
+from mci.loadtest import HEADER
+from mci.schema import SCHEMA, VIEWS, Schema
+
+
+def test_views_compile_to_column_indices():
+    assert SCHEMA.view_indices["A_K"] == tuple(range(0, 11))
+    assert SCHEMA.view_indices["A_C_R_V"] == (0, 1, 2, 17, 18, 19, 20, 21)
+    assert SCHEMA.cells == {"priority": 21, "deaths": 25, "timer_origin": 16, "timer_t0": 17, "timer_end": 18}
+
+
+def test_bind_is_cached_per_header_row():
+    layout = SCHEMA.bind(HEADER)
+    assert SCHEMA.bind(list(HEADER)) is layout
+    assert SCHEMA.bind(HEADER[:5]) is not layout
+    assert layout.labels("L_Q") == HEADER[11:17]
+    assert layout.letters["Priority"] == "V"
+
+
+def test_record_decodes_views_and_cells():
+    vals = ["Patient 1", "30", "M"] + ["d"] * 8 + ["Yes", "no", "YES", "", "No", "x"] + ["", "", "", ""] + ["P2"]
+    rec = SCHEMA.record(HEADER, vals)
+    assert rec.priority == "P2" and rec.cell("deaths") == ""  # past the end of a short row
+    assert rec.view("A_C_R_V") == {"Name": "Patient 1", "Age": "30", "Sex": "M", "Result R": "",
+                                   "Result S": "", "Result T": "", "Result U": "", "Priority": "P2"}
+    assert rec.view("A_K") is rec.view("A_K")  # built once
+    assert rec.treatment == ["Yes", "No", "Yes", "No", "No", "No"]
+    assert rec.treatment_headers == HEADER[11:17]
+    assert rec.letter("Deaths") == "Z"
+
+
+def test_columns_past_the_header_are_not_shown_and_duplicates_kept_in_pairs():
+    headers = ["Name", "Name", "Sex"]
+    rec = Schema(VIEWS, {"priority": "V"}).record(headers, ["a", "b", "c", "d"])
+    assert rec.view("A_C_R_V") == {"Name": "b", "Sex": "c"}
+    assert rec.pairs("A_C_R_V") == [("Name", "a"), ("Name", "b"), ("Sex", "c")]
+    assert rec.priority == ""
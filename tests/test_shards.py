@@ -0,0 +1,84 @@
+import pytest
+
+from mci.loadtest import HEADER
+from mci.shards import Shard, ShardedStorage, ShardRouter, parse_shards
+from mci.storage import SQLiteStorage
+
+
+def patient(n):
+    return [f"Patient {n}"]
+
+
+def sharded(router, parts):
+    stores = []
+    for rows in parts:
+        store = SQLiteStorage(":memory:")
+        store.load_rows([HEADER] + rows)
+        stores.append(store)
+    return ShardedStorage(router, stores)
+
+
+def test_range_routing():
+    router = ShardRouter([Shard("a", 1, 3), Shard("b", 4, 0)])
+    assert [router.route(r) for r in (1, 3, 4, 100)] == [(0, 1), (0, 3), (1, 1), (1, 97)]
+    assert router.to_global(1, 2) == 5
+    with pytest.raises(KeyError):
+        router.to_global(0, 4)  # past a's last row
+    with pytest.raises(ValueError):
+        ShardRouter([Shard("bad", 5, 2)])
+
+
+def test_hash_routing_is_dense_and_stable():
+    router = ShardRouter([Shard(f"s{i}") for i in range(3)], "hash")
+    routes = [router.route(r) for r in range(1, 61)]
+    for i in range(3):
+        assert sorted(local for shard, local in routes if shard == i) == \
+            list(range(1, sum(1 for shard, _ in routes if shard == i) + 1))
+    again = ShardRouter([Shard(f"s{i}") for i in range(3)], "hash")
+    assert [again.to_global(*rt) for rt in reversed(routes)] == list(range(60, 0, -1))
+
+
+def test_read_all_merges_in_global_order_and_routes_writes():
+    store = sharded(ShardRouter([Shard("a", 1, 2), Shard("b", 3, 0)]),
+                    [[patient(1), patient(2)], [patient(3), patient(4)]])
+    rows = store.read_all()
+    assert rows[0] == HEADER and [r[0] for r in rows[1:]] == [f"Patient {n}" for n in (1, 2, 3, 4)]
+    store.write_cells(4, {"V": "Priority 1"})  # sheet row 4 = display row 3 = b's sheet row 2
+    assert store.stores[1].read_row(2)[1][21] == "Priority 1"
+    assert store.shard_of(4) == "b"
+
+
+def test_rows_past_a_range_shard_are_skipped(caplog):
+    store = sharded(ShardRouter([Shard("a", 1, 2), Shard("b", 3, 0)]),
+                    [[patient(1), patient(2), ["stray"]], [patient(3)]])
+    rows = store.read_all()
+    assert [r[0] for r in rows[1:]] == ["Patient 1", "Patient 2", "Patient 3"]
+    assert store.stray == {"a": 1} and "past its range" in caplog.text
+
+
+def test_unmappable_hash_rows_do_not_break_read_all():
+    router = ShardRouter([Shard("s0"), Shard("s1")], "hash")
+    owned = [[], []]
+    for r in range(1, 7):
+        owned[router.route(r)[0]].append(patient(r))
+    store = sharded(router, [owned[0] + [["extra"]], owned[1]])
+    to_global = router.to_global
+
+    def past_the_end(shard, local):  # as if s0's worksheet ran past what the router can place
+        if shard == 0 and local > len(owned[0]):
+            raise KeyError(local)
+        return to_global(shard, local)
+
+    router.to_global = past_the_end
+    rows = store.read_all()
+    assert [r[0] for r in rows[1:7]] == [f"Patient {n}" for n in range(1, 7)]
+    assert store.stray == {"s0": 1}
+
+
+def test_parse_shards():
+    router, specs = parse_shards({"strategy": "range", "sheets": [
+        {"spreadsheet_id": "abcdef123456", "worksheet_name": "S", "rows": [1, 50]},
+        {"name": "rest", "spreadsheet_id": "x", "rows": [51]},
+    ]})
+    assert router.shards == [Shard("S@123456", 1, 50), Shard("rest", 51, 0)]
+    assert specs[1]["spreadsheet_id"] == "x"
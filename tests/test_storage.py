@@ -0,0 +1,51 @@
+import threading
+
+import pytest
+
+from mci.storage import SQLiteStorage
+
+
+def test_read_and_write_cells(sqlite_store):
+    headers, vals = sqlite_store.read_row(2)
+    assert headers[0] and vals[0] == "Patient 1"
+    sqlite_store.write_cells(2, {"V": "Red", "q": 600})
+    assert sqlite_store.read_row(2)[1][16] == "600"
+    sqlite_store.write_many({3: {"V": "Green"}, 10: {"A": "late arrival"}})
+    rows = sqlite_store.read_all()
+    assert rows[1][21] == "Red" and rows[2][21] == "Green"
+    assert rows[8] == [""] * 26 and rows[9][0] == "late arrival"  # unwritten rows read blank
+    with pytest.raises(ValueError):
+        sqlite_store.write_cells(2, {"AA": "x"})
+
+
+def test_header_write_invalidates_cached_headers(sqlite_store):
+    assert sqlite_store.headers()[0] == "Name"
+    sqlite_store.write_cells(1, {"A": "Patient"})
+    assert sqlite_store.headers()[0] == "Patient"
+
+
+def test_increment_z_once_per_event_from_many_threads(sqlite_store):
+    barrier = threading.Barrier(8)
+
+    def expire(worker):
+        barrier.wait()
+        for i in range(25):
+            sqlite_store.increment_z(2, f"expiry:{i % 20}")
+            sqlite_store.increment_z(3, f"expiry:{worker}:{i}")
+
+    threads = [threading.Thread(target=expire, args=(w,)) for w in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert sqlite_store.read_row(2)[1][25] == "20"
+    assert sqlite_store.read_row(3)[1][25] == "200"
+    assert sqlite_store.increment_z(4, "once") and not sqlite_store.increment_z(4, "once")
+
+
+def test_memory_database_is_shared_between_threads():
+    store = SQLiteStorage(":memory:")
+    t = threading.Thread(target=store.write_cells, args=(2, {"A": "from a thread"}))
+    t.start()
+    t.join()
+    assert store.read_row(2)[1][0] == "from a thread"
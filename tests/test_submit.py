@@ -0,0 +1,33 @@
+from mci import patient
+from mci.loadtest import HEADER
+from mci.storage import SheetsStorage
+
+
+def calls(sheet):
+    return {k.split(".")[-1]: v for k, v in sheet.stats.totals.items() if v}
+
+
+def test_write_row_returns_the_row_after_the_write(fake_sheet):
+    sheet, handle = fake_sheet
+    handle.headers()  # cached from here on
+    before = calls(sheet)
+    headers, vals = handle.write_row(3, {"L": "Yes", "V": "Priority 1"})
+    assert headers == HEADER
+    assert vals[0] == "Patient 2" and (vals[11], vals[21]) == ("Yes", "Priority 1")  # untouched A kept
+    assert len(vals) == 26
+    after = calls(sheet)
+    assert after.get("values_batch_update", 0) - before.get("values_batch_update", 0) == 1
+    assert after.get("values_batch_get", 0) == before.get("values_batch_get", 0)  # no read-back
+    assert sheet.sheet1.row_values(3)[21] == "Priority 1"
+
+
+def test_submits_cost_one_round_trip(fake_sheet):
+    sheet, handle = fake_sheet
+    store = SheetsStorage(handle)
+    store.headers()
+    before = sum(sheet.stats.totals.values())
+    res = patient.update_LQ(store, 2, {"Airway": "Yes", "Breathing": "No"})
+    assert res["next"]["A_C_R_U"]["Name"] == "Patient 1"
+    res = patient.update_V(store, 2, patient.ALLOWED_V[0])
+    assert res["final"]["A_C_R_V"]["Priority"] == patient.ALLOWED_V[0]
+    assert sum(sheet.stats.totals.values()) - before == 2
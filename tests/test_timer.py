@@ -0,0 +1,65 @@
+import time
+
+from mci.fakes import CallStats, FakeGasServer, Faults
+from mci.gas import GasClient
+from mci.patient import resolve_timer, timer_state_from_values
+from mci.timer_cache import TimerCache
+
+
+class DownGas:
+    url = "down"
+
+    def get_row(self, row):
+        raise ConnectionError("GAS down")
+
+
+def slow_reads(store, delay):
+    read_row = store.read_row
+
+    def slow(row, mode=""):
+        time.sleep(delay)
+        return read_row(row, mode)
+
+    store.read_row = slow
+
+
+def test_sheet_fallback_starts_the_timer_once(sqlite_store):
+    sqlite_store.write_cells(3, {"Q": "120"})
+    timers = TimerCache()
+    got = resolve_timer(sqlite_store, None, 2, 3, "edit1", timers)
+    assert got["origin_seconds"] == 120 and got["end_epoch"] - got["t0_epoch"] == 120
+    assert got["row_data"][1][0] == "Patient 2" and got["warnings"] == []
+    ts = timer_state_from_values(sqlite_store.read_row(3)[1])
+    assert (ts["t0_epoch"], ts["end_epoch"]) == (got["t0_epoch"], got["end_epoch"])
+    sqlite_store.write_cells(3, {"S": ""})
+    again = resolve_timer(sqlite_store, None, 2, 3, "edit1", timers)  # from the cache, sheet not consulted
+    assert again["end_epoch"] == got["end_epoch"]
+
+
+def test_gas_and_row_read_are_in_flight_together(sqlite_store):
+    stats = CallStats()
+    slow_reads(sqlite_store, 0.2)
+    with FakeGasServer(300, stats=stats, faults=Faults(0.2)) as server:
+        t = time.perf_counter()
+        got = resolve_timer(sqlite_store, GasClient(server.url), 1, 2, "edit1")
+        elapsed = time.perf_counter() - t
+        assert got["end_epoch"] - got["t0_epoch"] == 300 and got["row_data"] is not None
+    assert stats.totals["gas.get"] == 1 and stats.totals["gas.start_timer"] == 1
+    assert elapsed < 0.6  # get ‖ read, then start (sequential would be ≥ 0.6)
+
+
+def test_timer_started_on_the_sheet_is_not_started_again_at_gas(sqlite_store):
+    stats = CallStats()
+    now = int(time.time())
+    sqlite_store.write_cells(2, {"Q": "300", "R": now, "S": now + 300})
+    with FakeGasServer(300, stats=stats) as server:
+        got = resolve_timer(sqlite_store, GasClient(server.url), 1, 2, "edit1")
+    assert (got["t0_epoch"], got["end_epoch"]) == (now, now + 300)
+    assert stats.totals["gas.start_timer"] == 0
+
+
+def test_gas_error_falls_back_to_the_sheet(sqlite_store):
+    sqlite_store.write_cells(2, {"Q": "60"})
+    got = resolve_timer(sqlite_store, DownGas(), 1, 2, "edit1")
+    assert got["end_epoch"] - got["t0_epoch"] == 60
+    assert got["warnings"] and "GAS down" in got["warnings"][0]
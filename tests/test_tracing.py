@@ -0,0 +1,27 @@
+import urllib.error
+import urllib.request
+
+import pytest
+
+from mci.tracing import Tracer, serve_metrics
+
+
+def get(url, headers=None):
+    with urllib.request.urlopen(urllib.request.Request(url, headers=headers or {}), timeout=5) as resp:
+        return resp.status
+
+
+def test_metrics_port_needs_the_token():
+    server = serve_metrics(0, host="127.0.0.1", tracer=Tracer(), token="s3cret")
+    base = f"http://127.0.0.1:{server.server_address[1]}"
+    try:
+        for url, headers in ((f"{base}/metrics", None), (f"{base}/metrics?token=nope", None),
+                             (f"{base}/metrics.json", {"Authorization": "Bearer nope"})):
+            with pytest.raises(urllib.error.HTTPError) as err:
+                get(url, headers)
+            assert err.value.code == 401
+        assert get(f"{base}/metrics", {"Authorization": "Bearer s3cret"}) == 200
+        assert get(f"{base}/metrics.json?token=s3cret") == 200
+    finally:
+        server.shutdown()
+        server.server_close()
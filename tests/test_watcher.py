@@ -0,0 +1,37 @@
+import time
+
+from mci.watcher import SheetWatcher
+
+
+def wait_for(cond, timeout=5.0):
+    deadline = time.time() + timeout
+    while not cond() and time.time() < deadline:
+        time.sleep(0.01)
+    return cond()
+
+
+def test_poll_bumps_versions_of_changed_rows(sqlite_store):
+    watcher = SheetWatcher(sqlite_store)
+    watcher.poll()
+    before = watcher.version(2), watcher.version(3)
+    sqlite_store.write_cells(3, {"V": "Priority 1"})
+    assert watcher.poll() == {3}
+    assert (watcher.version(2), watcher.version(3)) == (before[0], before[1] + 1)
+    assert watcher.row(3)[1][21] == "Priority 1"
+
+
+def test_thread_runs_only_while_leased(sqlite_store):
+    watcher = SheetWatcher(sqlite_store, interval=0.01, idle_timeout=0.2)
+    assert not watcher.running()
+    watcher.lease("a").lease("b")
+    assert watcher.running() and wait_for(lambda: watcher.polls > 0)
+    watcher.release("a")
+    assert watcher.watching() == 1
+    assert wait_for(lambda: not watcher.running())  # "b" never renewed
+    polls = watcher.polls
+    time.sleep(0.05)
+    assert watcher.polls == polls and watcher.watching() == 0
+    watcher.lease("c")  # a new session starts it again
+    assert wait_for(lambda: watcher.polls > polls)
+    watcher.stop()
+    assert wait_for(lambda: not watcher.running())
@@ -0,0 +1,102 @@
+import threading
+
+import pytest
+
+from mci.fakes import FakeAPIError
+from mci.write_queue import WriteCoalescer
+
+
+class Recorder:
+    """``flush`` callable that records every batch (and can fail or block)."""
+
+    def __init__(self, errors=(), gate=None):
+        self.batches = []
+        self.errors = list(errors)
+        self.gate = gate
+
+    def __call__(self, data, include_values=False):
+        if self.gate is not None:
+            self.gate.wait(5)
+        self.batches.append(data)
+        if self.errors:
+            raise self.errors.pop(0)
+        if include_values:
+            return {"responses": [{"updatedData": {"range": d["range"], "values": d["values"]}} for d in data]}
+        return {}
+
+
+def update(rng, *values):
+    return {"range": rng, "majorDimension": "ROWS", "values": [list(values)]}
+
+
+def test_writes_to_the_same_range_merge_cell_by_cell():
+    flush = Recorder()
+    q = WriteCoalescer(flush, max_latency=0.05)
+    a = q.submit([update("S!A2:C2", "x", None, "z")])
+    b = q.submit([update("S!A2:C2", None, "y", "Z"), update("S!D2", "d")])
+    a.wait(5)
+    b.wait(5)
+    q.close()
+    assert len(flush.batches) == 1
+    merged = {d["range"]: d["values"] for d in flush.batches[0]}
+    assert merged == {"S!A2:C2": [["x", "y", "Z"]], "S!D2": [["d"]]}
+    assert q.writes_submitted == 2 and q.flushes == 1
+
+
+def test_want_values_returns_the_ranges_of_each_ticket():
+    q = WriteCoalescer(Recorder(), max_latency=0.05)
+    a = q.submit([update("S!A2", "a")], want_values=True)
+    b = q.submit([update("S!A3", "b")])
+    a.wait(5)
+    b.wait(5)
+    q.close()
+    assert a.updated == {"S!A2": {"range": "S!A2", "values": [["a"]]}}
+    assert list(b.updated) == ["S!A3"]
+
+
+def test_flush_error_reaches_every_ticket_of_the_batch():
+    q = WriteCoalescer(Recorder(errors=[ValueError("bad range")]), max_latency=0.05)
+    a = q.submit([update("S!A2", "a")])
+    b = q.submit([update("S!A3", "b")])
+    for t in (a, b):
+        with pytest.raises(ValueError, match="bad range"):
+            t.wait(5)
+    q.close()
+
+
+def test_retry_status_is_retried_other_errors_are_not():
+    flush = Recorder(errors=[FakeAPIError(503), FakeAPIError(429)])
+    q = WriteCoalescer(flush, max_latency=0.01, backoff=0.001)
+    assert q.submit([update("S!A2", "a")]).wait(5)
+    assert len(flush.batches) == 3
+
+    flush = Recorder(errors=[FakeAPIError(429)])
+    q = WriteCoalescer(flush, max_latency=0.01, backoff=0.001, retry_status=(503,))
+    with pytest.raises(FakeAPIError):
+        q.submit([update("S!A2", "a")]).wait(5)
+    assert len(flush.batches) == 1
+    q.close()
+
+
+def test_timed_out_ticket_still_commits_and_runs_callbacks():
+    gate = threading.Event()
+    q = WriteCoalescer(Recorder(gate=gate), max_latency=0.01)
+    t = q.submit([update("S!A2", "a")])
+    with pytest.raises(TimeoutError):
+        t.wait(0.05)
+    seen = []
+    t.add_done_callback(lambda ticket: seen.append(ticket.error))
+    gate.set()
+    assert t.wait(5)
+    assert seen == [None]
+    t.add_done_callback(lambda ticket: seen.append("late"))  # already done → called at once
+    assert seen == [None, "late"]
+    q.close()
+
+
+def test_closed_queue_refuses_writes():
+    q = WriteCoalescer(Recorder())
+    q.close()
+    with pytest.raises(RuntimeError):
+        q.submit([update("S!A2", "a")])
+    assert q.submit([]).done  # nothing to write: done at once